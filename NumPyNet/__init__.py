@@ -14,6 +14,7 @@ from .image import Image
 from .image_utils import normalization
 from .image_utils import image_utils
 from .network import Network
+from .parallel import DataParallel
 
 import parser
 from . import rnn_utils
@@ -179,7 +179,7 @@ class Linear (Activations):
 
   @staticmethod
   def gradient(x, copy=False):
-    return np.ones(shape=x.shape, dtype=float)
+    return np.ones(shape=x.shape, dtype=x.dtype)
 
 
 class Tanh (Activations):
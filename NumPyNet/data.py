@@ -21,7 +21,7 @@ __package__ = 'loading_data'
 class DataGenerator (object):
 
   def __init__ (self, load_func, batch_size, source_path=None, source_file=None, label_path=None, label_file=None,
-                      source_extension='', label_extension='', seed=123,
+                      source_extension='', label_extension='', seed=123, dtype=float,
                       **load_func_kwargs):
     '''
     Data generator in detached thread.
@@ -31,6 +31,8 @@ class DataGenerator (object):
       load_func : function or lambda of preprocessing on a single data/label pair
 
       source_path :
+
+      dtype : floating point dtype of the data and label batches
     '''
     np.random.seed(seed)
 
@@ -78,6 +80,7 @@ class DataGenerator (object):
     load_func = partial(load_func, **load_func_kwargs)
     self.load_func = load_func
     self._batch = batch_size
+    self.dtype = dtype
 
     self._thread = Thread(target=self._update, args=(source_files, label_files))
     self._thread.daemon = True
@@ -124,7 +127,9 @@ class DataGenerator (object):
     '''
 
     try:
-      self._data, self._label = zip(*map(self.load_func, sources, labels))
+      data, label = zip(*map(self.load_func, sources, labels))
+      self._data  = np.asarray(data, dtype=self.dtype)
+      self._label = np.asarray(label, dtype=self.dtype)
 
     except Exception as e:
 
@@ -18,12 +18,13 @@ __package__ = 'Image object'
 
 class Image (object):
 
-  def __init__ (self, filename=None):
+  def __init__ (self, filename=None, dtype=float):
     '''
     Constructor of the image object. If filename the load function loads the image file
+    with the given floating point dtype
     '''
     if filename is not None:
-      self.load(filename)
+      self.load(filename, dtype=dtype)
 
     else:
       self._data = None
@@ -32,6 +33,12 @@ class Image (object):
   def shape (self):
     return self._data.shape
 
+  def __array__ (self, dtype=None, copy=None):
+    '''
+    Array interface, used by numpy.asarray to convert the image data (ex. batches of DataGenerator)
+    '''
+    return self._data if dtype is None else self._data.astype(dtype)
+
   def add_single_batch (self):
     '''
     Add batch dimension for testing layer
@@ -63,11 +70,11 @@ class Image (object):
     return img
 
 
-  def _cv2image (self, img):
+  def _cv2image (self, img, dtype=float):
     '''
     convert image from opencv-fmt to image-fmt
     '''
-    img = img.astype('float64')
+    img = img.astype(dtype)
 
     # bgr 2 rgb
     img = img[..., ::-1]
@@ -96,9 +103,9 @@ class Image (object):
     return self._data
 
 
-  def load (self, filename):
+  def load (self, filename, dtype=float):
     '''
-    Read Image from file
+    Read Image from file as a floating point array of the given dtype
     '''
 
     if not os.path.isfile(filename):
@@ -107,7 +114,7 @@ class Image (object):
     # read image from file
     img = cv2.imread(filename,  cv2.IMREAD_COLOR)
 
-    self._data = self._cv2image(img)
+    self._data = self._cv2image(img, dtype=dtype)
     return self
 
 
@@ -10,6 +10,8 @@ from .connected_layer import Connected_layer
 from .convolutional_layer import Convolutional_layer
 from .cost_layer import Cost_layer, cost_type
 from .dropout_layer import Dropout_layer
+from .globalavgpool_layer import GlobalAvgpool_layer
+from .globalmaxpool_layer import GlobalMaxpool_layer
 from .input_layer import Input_layer
 from .l1norm_layer import L1Norm_layer
 from .l2norm_layer import L2Norm_layer
@@ -29,6 +31,8 @@ Batchnorm = BatchNorm_layer
 Dense = Connected_layer
 Conv2D = Convolutional_layer
 Dropout = Dropout_layer
+GlobalAveragePooling2D = GlobalAvgpool_layer
+GlobalMaxPooling2D = GlobalMaxpool_layer
 L1Normalization = L1Norm_layer
 L2Normalization = L2Norm_layer
 MaxPool2D = Maxpool_layer
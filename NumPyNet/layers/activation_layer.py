@@ -10,13 +10,14 @@ from NumPyNet.utils import _check_activation
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Activation Layer'
 
 
-class Activation_layer(object):
+class Activation_layer(BaseLayer):
 
   def __init__(self, activation=Activations, **kwargs):
     '''
@@ -65,7 +66,7 @@ class Activation_layer(object):
     '''
     self._out_shape = inpt.shape
     self.output = self.activation(inpt, copy=copy)
-    self.delta = np.zeros(shape=self.out_shape, dtype=float)
+    self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype) if self.trainable else None
 
   def backward(self, delta, copy=False):
     '''
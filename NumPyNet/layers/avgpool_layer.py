@@ -9,13 +9,14 @@ import itertools
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Avgpool Layer'
 
 
-class Avgpool_layer(object):
+class Avgpool_layer(BaseLayer):
 
   def __init__(self, size, stride=None, padding=False, **kwargs):
 
@@ -50,6 +51,9 @@ class Avgpool_layer(object):
     self.pad = padding
     self.pad_left, self.pad_right, self.pad_bottom, self.pad_top = (0, 0, 0, 0)
 
+    # inverse of the number of image pixels inside every window, shape (out_w, out_h, 1)
+    self._norm, self._norm_shape = (None, None)
+
     self.output, self.delta = (None, None)
 
 
@@ -72,6 +76,8 @@ class Avgpool_layer(object):
     if self.pad:
       self._evaluate_padding()
 
+    self._evaluate_norm()
+
     return self
 
   @property
@@ -137,7 +143,7 @@ class Avgpool_layer(object):
 
   def _pad(self, inpt):
     '''
-    Padd every image in a batch with np.nan following keras SAME padding
+    Padd every image in a batch with zeros following keras SAME padding
     See also:
       https://stackoverflow.com/questions/53819528/how-does-tf-keras-layers-conv2d-with-padding-same-and-strides-1-behave
 
@@ -145,15 +151,45 @@ class Avgpool_layer(object):
       inpt    : input images in the format (batch, width, height, channels)
     '''
 
-    # return the nan-padded image, in the same format as inpt (batch, width + pad_w, height + pad_h, channels)
+    # return the zero-padded image, in the same format as inpt (batch, width + pad_w, height + pad_h, channels)
     return np.pad(inpt, ((0, 0), (self.pad_top, self.pad_bottom), (self.pad_left, self.pad_right), (0, 0)),
-                  mode='constant', constant_values=(np.nan, np.nan))
+                  mode='constant', constant_values=(0., 0.))
+
+  def _evaluate_norm(self):
+    '''
+    Compute the inverse of the number of image pixels (padding excluded) inside every
+    window. It depends only on the position of the window, so it is computed once for
+    every input shape and broadcasted over batch and channels
+    '''
+    kx, ky = self.size
+    sx, sy = self.stride
+
+    count = np.ones(shape=(1, self.w, self.h, 1), dtype=float)
+
+    if self.pad:
+      count = self._pad(count)
+    else:
+      count = count[:, : (self.w - kx) // sx*sx + kx, : (self.h - ky) // sy*sy + ky, :]
+
+    count = self._asStride(count, self.size, self.stride).sum(axis=(4, 5)) # shape (1, out_w, out_h, 1)
+
+    self._norm = 1. / count[0]
+    self._norm_shape = (self.w, self.h)
+
+  @property
+  def _non_overlapping(self):
+    '''
+    Check if the windows tile the input without overlapping (size == stride, without
+    padding): in this case the pooling is a reduction over a reshape of the input
+    '''
+    return (tuple(self.size) == tuple(self.stride) and
+            not any((self.pad_top, self.pad_bottom, self.pad_left, self.pad_right)))
 
   def forward(self, inpt):
     '''
     Forward function of the average pool layer: it slide a kernel of size (kx,ky) = size
     and with step (st1, st2) = strides over every image in the batch. For every sub-matrix
-    it computes the average value without considering NAN value (padding), and passes it
+    it computes the average value without considering the padding, and passes it
     to the output.
 
     Parameters:
@@ -167,61 +203,61 @@ class Avgpool_layer(object):
     # Padding
     if self.pad:
       self._evaluate_padding()
-      mat_pad = self._pad(inpt)
+
+    if self._norm_shape != (self.w, self.h):
+      self._evaluate_norm()
+
+    if self._non_overlapping:
+
+      # The windows are the blocks of the cut input reshaped as (batch, out_w, kx, out_h, ky, c)
+      _, out_w, out_h, _ = self.out_shape
+      windows = inpt[:, : out_w * kx, : out_h * ky, :].reshape(self.batch, out_w, kx, out_h, ky, self.c)
+
+      self.output = windows.mean(axis=(2, 4))
+
     else:
-      # If padding false, it cuts images' raws/columns
-      mat_pad = inpt[:, : (self.w - kx) // sx*sx + kx, : (self.h - ky) // sy*sy + ky, ...]
 
-    # 'view' is the strided input image, shape = (batch, out_w, out_h, out_c, kx, ky)
-    view = self._asStride(mat_pad, self.size, self.stride)
+      if self.pad:
+        mat_pad = self._pad(inpt)
+      else:
+        # If padding false, it cuts images' raws/columns
+        mat_pad = inpt[:, : (self.w - kx) // sx*sx + kx, : (self.h - ky) // sy*sy + ky, ...]
+
+      # 'view' is the strided input image, shape = (batch, out_w, out_h, out_c, kx, ky)
+      view = self._asStride(mat_pad, self.size, self.stride)
 
-    # Mean of every sub matrix, computed without considering the padd(np.nan)
-    self.output = np.nanmean(view, axis=(4, 5))
-    self.delta = np.zeros(shape=self.out_shape, dtype=float)
+      # Mean of every sub matrix: the sum is normalized by the number of image pixels (padding excluded)
+      self.output = view.sum(axis=(4, 5)) * self._norm.astype(inpt.dtype)
+
+    self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype) if self.trainable else None
 
   def backward(self, delta):
     '''
     backward function of the average_pool layer: the function modifies the net delta
-    to be backpropagated.
+    to be backpropagated. Every position inside the window is a strided view of the
+    (padded) delta, so the normalized layer delta is added to each of them.
 
     Parameters:
       delta : global delta to be backpropagated with shape (batch, out_w, out_h, out_c)
     '''
 
     kx, ky = self.size
+    sx, sy = self.stride
+    _, out_w, out_h, _ = self.output.shape
+
+    norm_delta = self.delta * self._norm.astype(self.delta.dtype)
 
-    # Padding delta for a coherent _asStrided dimension
     if self.pad:
-      mat_pad = self._pad(delta)
-    else :
+      mat_pad = np.zeros(shape=(self.batch, self.w + self.pad_top + self.pad_bottom, self.h + self.pad_left + self.pad_right, self.c), dtype=delta.dtype)
+    else:
       mat_pad = delta
 
-    # _asStrid of padded delta let me access every pixel of the memory in the order I want.
-    # This is used to create a 1-1 correspondence between output and input pixels.
-    net_delta_view = self._asStride(mat_pad, self.size, self.stride)
-
-    # norm = 1./(kx*ky) # needs to count only no nan values for keras
-    b, w, h, c = self.output.shape
-    combo = itertools.product(range(b), range(w), range(h), range(c)) # every combination of indices
-
-    # The indexes are necessary to access every pixel value one at a time, since
-    # modifing the same memory address more times at once doesn't produce the correct result
+    for x, y in itertools.product(range(kx), range(ky)):
+      mat_pad[:, x : x + out_w * sx : sx, y : y + out_h * sy : sy, :] += norm_delta
 
-#    norm = 1. / (kx*ky)
-
-    for b, i, j, k in combo:
-      norm = 1./ np.count_nonzero(~np.isnan(net_delta_view[b, i, j, k, :])) # this only counts non nan values for norm
-      net_delta_view[b, i, j, k, :] += self.delta[b, i, j, k] * norm
-
-#    net_delta_view *= norm
-
-    # Here delta is updated correctly
+    # Excluding the padded part of the image
     if self.pad:
-      _, w_pad, h_pad, _ = mat_pad.shape
-      # Excluding the padded part of the image
-      delta[:] = mat_pad[:, self.pad_top : w_pad - self.pad_bottom, self.pad_left : h_pad - self.pad_right, :]
-    else:
-      delta[:] = mat_pad
+      delta += mat_pad[:, self.pad_top : self.pad_top + self.w, self.pad_left : self.pad_left + self.h, :]
 
 if __name__ == '__main__':
 
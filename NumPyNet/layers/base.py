@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+
+__author__ = ['Mattia Ceccarelli', 'Nico Curti']
+__email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
+__package__ = 'Base Layer'
+
+
+class BaseLayer(object):
+  '''
+  Base class of the layers: attributes shared by every layer.
+
+  The trainable flag is True in training mode and False in inference mode, where the layer stores
+  only its output. It is set on every layer by the Network model (ref. Network.train and Network.eval)
+  '''
+
+  trainable = True
@@ -7,15 +7,16 @@ from __future__ import print_function
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'BatchNorm Layer'
 
 
-class BatchNorm_layer(object):
+class BatchNorm_layer(BaseLayer):
 
-  def __init__(self, scales=None, bias=None, **kwargs):
+  def __init__(self, scales=None, bias=None, momentum=.99, **kwargs):
 
     '''
     BatchNormalization Layer: It performs a Normalization over the Batch axis
@@ -26,10 +27,16 @@ class BatchNorm_layer(object):
     Parameters:
       scales : scale to be multiplied to the normalized input, of shape (w, h, c)
       bias   : bias to be added to the multiplication of scale and normalized input of shape (w, h, c)
+      momentum : float, default .99. Weight of the previous running statistics in their
+        update with the mean and the variance of every batch
     '''
 
     self.scales = scales
     self.bias = bias
+    self.momentum = momentum
+
+    # running statistics of the training batches, shape (w, h, c)
+    self.rolling_mean, self.rolling_var = (None, None)
 
     self.output, self.delta = (None, None)
 
@@ -50,6 +57,14 @@ class BatchNorm_layer(object):
       raise LayerError('Incorrect shapes found. Layer {} cannot be connected to the previous {} layer.'.format(class_name, prev_name))
 
     self._out_shape = previous_layer.out_shape
+
+    # trainable parameters initialized as the identity transformation
+    if self.scales is None:
+      self.scales = np.ones(shape=self._out_shape[1:], dtype=float)
+
+    if self.bias is None:
+      self.bias = np.zeros(shape=self._out_shape[1:], dtype=float)
+
     return self
 
   @property
@@ -94,7 +109,9 @@ class BatchNorm_layer(object):
                     input_norm = (input - mean) / sqrt(var + epsil)
 
     where mean and var are the mean and the variance of the input batch of
-    images computed over the first axis (batch)
+    images computed over the first axis (batch). In inference mode mean and var
+    are the running statistics, which are not updated, and no state for the
+    backward is stored.
 
     Parameters:
       inpt  : numpy array, batch of input images in the format (batch, w, h, c)
@@ -103,12 +120,34 @@ class BatchNorm_layer(object):
 
     self._out_shape = inpt.shape
 
+    if not self.trainable and self.rolling_mean is not None:
+
+      self.output = (inpt - self.rolling_mean) * (1. / np.sqrt(self.rolling_var + epsil))
+
+      if self.scales is not None:
+        self.output *= self.scales
+
+      if self.bias is not None:
+        self.output += self.bias
+
+      self.x, self.mean, self.var, self.x_norm, self.delta = (None, None, None, None, None)
+      return
+
     # Copy input, compute mean and inverse variance with respect the batch axis
     self.x    = inpt
     self.mean = self.x.mean(axis=0)                        # shape = (w, h, c)
-    self.var  = 1. / np.sqrt((self.x.var(axis=0)) + epsil) # shape = (w, h, c)
+    variance  = self.x.var(axis=0)                         # shape = (w, h, c)
+    self.var  = 1. / np.sqrt(variance + epsil)             # shape = (w, h, c)
     # epsil is used to avoid divisions by zero
 
+    # Update the running statistics
+    if self.rolling_mean is None:
+      self.rolling_mean = np.zeros(shape=self.mean.shape, dtype=self.mean.dtype)
+      self.rolling_var  = np.ones(shape=self.mean.shape, dtype=self.mean.dtype)
+
+    self.rolling_mean = self.momentum * self.rolling_mean + (1. - self.momentum) * self.mean
+    self.rolling_var  = self.momentum * self.rolling_var  + (1. - self.momentum) * variance
+
     # Compute the normalized input
     self.x_norm = (self.x - self.mean) * self.var # shape (batch, w, h, c)
     self.output = self.x_norm.copy() # made a copy to store x_norm, used in Backward
@@ -121,7 +160,7 @@ class BatchNorm_layer(object):
       self.output += self.bias # Add bias
 
     # output_shape = (batch, w, h, c)
-    self.delta = np.zeros(shape=self.out_shape, dtype=float)
+    self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype) if self.trainable else None
 
 
   def backward(self, delta=None):
@@ -136,7 +175,7 @@ class BatchNorm_layer(object):
     '''
 
 
-    invN = 1. / np.prod(self.mean.shape)
+    invN = 1. / self.mean.size
 
     # Those are the explicit computation of every derivative involved in BackPropagation
     # of the batchNorm layer, where dbeta = dout / dbeta, dgamma = dout / dgamma etc...
@@ -159,6 +198,37 @@ class BatchNorm_layer(object):
     if delta is not None:
       delta[:] = self.delta
 
+  def folding_params(self, epsil=1e-8):
+    '''
+    Scale and shift of the affine transformation equivalent to the layer at
+    inference time, computed from the running statistics:
+
+                    output = input * scale + shift
+
+    They can be folded into the weights and bias of the previous layer (ref. Network.fuse)
+
+    Parameters:
+      epsil : float, used to avoid division by zero when computing 1. / sqrt(var)
+
+    Returns:
+      scale, shift : numpy arrays of shape (w, h, c)
+    '''
+
+    if self.rolling_mean is None:
+      raise LayerError('BatchNorm layer : running statistics not found. The layer must be trained before folding')
+
+    scale = 1. / np.sqrt(self.rolling_var + epsil)
+
+    if self.scales is not None:
+      scale = scale * self.scales
+
+    shift = -self.rolling_mean * scale
+
+    if self.bias is not None:
+      shift = shift + self.bias
+
+    return (scale, shift)
+
   def update(self):
     '''
     update function for the convolution layer
@@ -10,13 +10,14 @@ from NumPyNet.utils import _check_activation
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Connected Layer'
 
 
-class Connected_layer(object):
+class Connected_layer(BaseLayer):
 
   def __init__(self, input_shape, outputs, activation=Activations, weights=None, bias=None, **kwargs):
     '''
@@ -110,6 +111,7 @@ class Connected_layer(object):
             input or not.
     '''
 
+    self._out_shape = inpt.shape                                          # the batch follows the input
     inpt = inpt.reshape(self._out_shape[0], self.inputs)                  # shape (batch, w*h*c)
 
     # z = (inpt @ self.weights) + self.bias                # shape (batch, outputs)
@@ -118,7 +120,7 @@ class Connected_layer(object):
 
     # shape (batch, outputs), activated
     self.output = self.activation(z, copy=copy).reshape(-1, 1, 1, self.outputs)
-    self.delta = np.zeros(shape=self.out_shape, dtype=float)
+    self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype) if self.trainable else None
 
   def backward(self, inpt, delta=None, copy=False):
     '''
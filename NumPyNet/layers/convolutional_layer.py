@@ -4,13 +4,12 @@
 from __future__ import division
 from __future__ import print_function
 
-import itertools
-
 from NumPyNet.activations import Activations
 from NumPyNet.utils import _check_activation
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
@@ -18,12 +17,58 @@ __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Convolutional layer'
 
 
-class Convolutional_layer(object):
+# Winograd minimal filtering matrices F(m x m, 3 x 3) as (B^T, G, A^T), indexed by the output tile m.
+# Reference: A. Lavin, S. Gray, "Fast Algorithms for Convolutional Neural Networks", arXiv:1509.09308
+WINOGRAD_TRANSFORMS = {
+  2 : (np.array([[ 1.,  0., -1.,  0.],
+                 [ 0.,  1.,  1.,  0.],
+                 [ 0., -1.,  1.,  0.],
+                 [ 0.,  1.,  0., -1.]]),
+       np.array([[ 1.,  0.,  0.],
+                 [.5, .5, .5],
+                 [.5, -.5, .5],
+                 [ 0.,  0.,  1.]]),
+       np.array([[ 1.,  1.,  1.,  0.],
+                 [ 0.,  1., -1., -1.]])
+       ),
+
+  4 : (np.array([[ 4.,  0., -5.,  0.,  1.,  0.],
+                 [ 0., -4., -4.,  1.,  1.,  0.],
+                 [ 0.,  4., -4., -1.,  1.,  0.],
+                 [ 0., -2., -1.,  2.,  1.,  0.],
+                 [ 0.,  2., -1., -2.,  1.,  0.],
+                 [ 0.,  4.,  0., -5.,  0.,  1.]]),
+       np.array([[ 1. / 4.,        0.,        0.],
+                 [-1. / 6., -1. / 6., -1. / 6.],
+                 [-1. / 6.,  1. / 6., -1. / 6.],
+                 [1. / 24., 1. / 12.,  1. / 6.],
+                 [1. / 24., -1. / 12., 1. / 6.],
+                 [       0.,        0.,       1.]]),
+       np.array([[ 1.,  1.,  1.,  1.,  1.,  0.],
+                 [ 0.,  1., -1.,  2., -2.,  0.],
+                 [ 0.,  1.,  1.,  4.,  4.,  0.],
+                 [ 0.,  1., -1.,  8., -8.,  1.]])
+       ),
+}
+
+
+class Convolutional_layer(BaseLayer):
+
+  ALGORITHMS = ('auto', 'gemm', 'einsum', 'winograd', 'fft', 'pointwise')
+
+  # minimum number of kernel elements per output step (kx * ky / (st1 * st2)) for which
+  # the 'auto' algorithm prefers the fft (see timing/timing_conv_fft.py)
+  FFT_CROSSOVER = 49
 
   def __init__(self, input_shape, filters, size, stride=None,
                weights=None, bias=None,
                pad=False,
                activation=Activations,
+               groups=1,
+               dilation=1,
+               algorithm='auto',
+               winograd_tile=4,
+               workspace_bytes=None,
                **kwargs):
     '''
     Convolution Layer: the output is the convolution of of the input batch
@@ -35,10 +80,30 @@ class Convolutional_layer(object):
               the number of channels of the output
       size        : tuple of int, size of the kernel of shape (kx, ky)
       stride      : tuple of int, step of the kernel of shape (st1, st2)
-      weights     : filters array, with shape (kx, ky, channels_in, channels_out)
+      weights     : filters array, with shape (kx, ky, channels_in // groups, channels_out)
       pad         : boolean, if False the image is cutted along the last raws and columns, if True
                     the input is padded following keras SAME padding
       activation  : activation function of the layer
+      groups      : int, default 1. Number of groups of the grouped convolution: input and output
+                    channels are split in groups and every group of filters sees only its group of
+                    input channels. groups == channels_in is the depthwise convolution
+      dilation    : int or tuple of int, default 1. Spacing (dx, dy) between the kernel elements
+                    (atrous convolution): the kernel covers dx * (kx - 1) + 1 rows and dy * (ky - 1) + 1
+                    columns of the input without increasing the number of weights
+      algorithm   : string, default 'auto'. Convolution algorithm used in forward and backward.
+                    'gemm' packs the input patches in a contiguous matrix (im2col) and performs
+                    a single matrix product with the reshaped weights, 'einsum' contracts the
+                    strided view of the input with numpy.einsum, 'winograd' uses the Winograd
+                    minimal filtering (only 3x3 kernels with stride 1), 'fft' performs the products
+                    in the frequency domain (numpy.fft.rfft2), 'pointwise' (only 1x1 kernels) is a
+                    plain matrix product of the reshaped input with the weights. 'auto' chooses
+                    pointwise for 1x1 kernels, winograd when it is allowed, fft for large kernels
+                    and gemm otherwise
+      winograd_tile : int (2 or 4), default 4. Output tile of the Winograd F(m x m, 3 x 3) transform
+      workspace_bytes : int, default None. Memory budget of the temporary arrays (patches,
+                    transforms) of the convolution. If the whole batch needs more memory, the
+                    output is computed in tiles of images or of rows of a single image which fit
+                    the budget. None disables the tiling
     '''
 
     self.batch, self.w, self.h, self.c = input_shape
@@ -56,11 +121,48 @@ class Convolutional_layer(object):
     if not hasattr(self.stride, '__iter__'):
       self.stride = (int(self.stride), int(self.stride))
 
-    assert len(self.size) == 2 and len(self.stride) == 2
+    self.dilation = dilation
+    if not hasattr(self.dilation, '__iter__'):
+      self.dilation = (int(self.dilation), int(self.dilation))
+
+    assert len(self.size) == 2 and len(self.stride) == 2 and len(self.dilation) == 2
 
     self.pad = pad
     self.pad_left, self.pad_right, self.pad_bottom, self.pad_top = (0, 0, 0, 0)
 
+    if algorithm not in self.ALGORITHMS:
+      class_name = self.__class__.__name__
+      raise ValueError('{0}: incorrect value of algorithm given. Possible values are {1}'.format(class_name, self.ALGORITHMS))
+
+    if algorithm == 'winograd' and not self._winograd_allowed():
+      class_name = self.__class__.__name__
+      raise ValueError('{0}: winograd algorithm requires a 3 x 3 kernel with stride 1 and no dilation. Given size {1}, stride {2} and dilation {3}'.format(class_name, self.size, self.stride, self.dilation))
+
+    if algorithm == 'pointwise' and self.size != (1, 1):
+      class_name = self.__class__.__name__
+      raise ValueError('{0}: pointwise algorithm requires a 1 x 1 kernel. Given size {1}'.format(class_name, self.size))
+
+    if groups < 1 or self.channels_out % groups:
+      class_name = self.__class__.__name__
+      raise ValueError('{0}: the number of filters ({1}) must be divisible by the number of groups ({2})'.format(class_name, self.channels_out, groups))
+
+    if groups > 1 and algorithm in ('winograd', 'fft'):
+      class_name = self.__class__.__name__
+      raise ValueError('{0}: {1} algorithm is not available for grouped convolutions'.format(class_name, algorithm))
+
+    if tuple(self.dilation) != (1, 1) and algorithm == 'fft':
+      class_name = self.__class__.__name__
+      raise ValueError('{0}: fft algorithm is not available for dilated convolutions'.format(class_name))
+
+    if winograd_tile not in WINOGRAD_TRANSFORMS:
+      class_name = self.__class__.__name__
+      raise ValueError('{0}: incorrect value of winograd_tile given. Possible values are {1}'.format(class_name, tuple(WINOGRAD_TRANSFORMS.keys())))
+
+    self.groups = groups
+    self.algorithm = algorithm
+    self.winograd_tile = winograd_tile
+    self._algorithm = self._select_algorithm()
+
     activation = _check_activation(self, activation)
 
     # Activation function
@@ -69,12 +171,25 @@ class Convolutional_layer(object):
 
     self.delta, self.output = (None, None)
 
+    # memory budget of the tiled convolution and padded input kept for the tiled backward
+    self.workspace_bytes = workspace_bytes
+    self._tiled_input = None
+
+    # im2col buffer, reused across calls with the same input shape
+    self._col = None
+    # Winograd and fft transformed weights, cached until the next update of the weights
+    self._winograd_weights = None
+    self._fft_weights = None
+
     # Weights and bias
     if weights is None:
-      scale = np.sqrt(2 / (self.size[0] * self.size[1] * self.c))
-      self.weights = np.random.normal(loc=scale, scale=1., size=(self.size[0], self.size[1], self.c, self.channels_out))
+      self.weights = self._init_weights()
     else :
       self.weights = weights
+      self._check_weights()
+
+    # only the random weights are initialized again on a different input shape (ref. __call__)
+    self._random_weights = weights is None
 
     if bias is None:
       self.bias = np.zeros(shape=(self.channels_out, ), dtype=float)
@@ -87,8 +202,39 @@ class Convolutional_layer(object):
     self.optimizer      = None
 
 
+  @property
+  def _kernel_extent(self):
+    '''
+    Size (kx, ky) of the input region covered by the (dilated) kernel
+    '''
+    return tuple(d * (k - 1) + 1 for k, d in zip(self.size, self.dilation))
+
+  @property
+  def _weights_shape(self):
+    '''
+    Shape of the (grouped) weights (kx, ky, channels_in // groups, channels_out)
+    '''
+    return (self.size[0], self.size[1], self.c // self.groups, self.channels_out)
+
+  def _check_weights(self):
+    '''
+    Check that the given weights have the shape required by the input channels and the groups
+    '''
+    if np.shape(self.weights) != self._weights_shape:
+      class_name = self.__class__.__name__
+      raise LayerError('Incorrect weights shape found. Layer {} expects weights of shape {}. Given {}'.format(class_name, self._weights_shape, np.shape(self.weights)))
+
+  def _init_weights(self):
+    '''
+    Random initialization of the weights
+    '''
+    kx, ky, c, _ = self._weights_shape
+    scale = np.sqrt(2 / (kx * ky * c))
+    return np.random.normal(loc=scale, scale=1., size=self._weights_shape)
+
   def __str__(self):
     batch, out_w, out_h, out_c = self.out_shape
+    # the number of weights, and so the FLOPs, of a grouped convolution is reduced by a factor groups
     return 'conv   {:>4d} {} x {} / {}  {:>4d} x{:>4d} x{:>4d} x{:>4d}   ->  {:>4d} x{:>4d} x{:>4d} x{:>4d}  {:>5.3f} BFLOPs'.format(
            out_c, self.size[0], self.size[1], self.stride[0],
            self.batch, self.w, self.h, self.c,
@@ -99,16 +245,29 @@ class Convolutional_layer(object):
 
     if previous_layer.out_shape is None:
       class_name = self.__class__.__name__
-      prev_name  = layer.__class__.__name__
+      prev_name  = previous_layer.__class__.__name__
       raise LayerError('Incorrect shapes found. Layer {} cannot be connected to the previous {} layer.'.format(class_name, prev_name))
 
     self.batch, self.w, self.h, self.c = previous_layer.out_shape
 
+    if self.c % self.groups:
+      class_name = self.__class__.__name__
+      prev_name  = previous_layer.__class__.__name__
+      raise LayerError('Incorrect shapes found. Layer {} with {} groups cannot be connected to the previous {} layer with {} channels.'.format(class_name, self.groups, prev_name, self.c))
+
+    if self._random_weights and self.weights.shape != self._weights_shape:
+      # random weights initialized on a different input shape
+      self.weights = self._init_weights()
+
+    self._check_weights()
+
     if self.pad:
       self._evaluate_padding()
 
-    self.out_w = 1 + (self.w + self.pad_top + self.pad_bottom - self.size[0]) // self.stride[0]
-    self.out_h = 1 + (self.h + self.pad_left + self.pad_right - self.size[1]) // self.stride[1]
+    kx, ky = self._kernel_extent
+
+    self.out_w = 1 + (self.w + self.pad_top + self.pad_bottom - kx) // self.stride[0]
+    self.out_h = 1 + (self.h + self.pad_left + self.pad_right - ky) // self.stride[1]
 
     return self
 
@@ -128,9 +287,13 @@ class Convolutional_layer(object):
     pos += self.channels_out
 
     self.weights = chunck_weights[pos : pos + self.weights.size]
-    self.weights = self.weights.reshape(self.size[0], self.size[1], self.c, self.channels_out)
+    self.weights = self.weights.reshape(self._weights_shape)
+    self._random_weights = False
     pos += self.weights.size
 
+    self._winograd_weights = None
+    self._fft_weights = None
+
     return pos
 
   def save_weights(self):
@@ -139,10 +302,11 @@ class Convolutional_layer(object):
     '''
     return np.concatenate([self.bias.ravel(), self.weights.ravel()], axis=0).tolist()
 
-  def _asStride(self, arr, sub_shape, stride):
+  def _asStride(self, arr, sub_shape, stride, dilation=(1, 1)):
     '''
     _asStride returns a view of the input array such that a kernel of size = (kx,ky)
-    is slided over the image with stride = (st1, st2)
+    is slided over the image with stride = (st1, st2). The elements of the kernel are
+    spaced by dilation = (dx, dy), so the dilated kernel is still a view of the input
 
     better reference here :
     https://docs.scipy.org/doc/numpy/reference/generated/numpy.lib.stride_tricks.as_strided.html
@@ -154,26 +318,561 @@ class Convolutional_layer(object):
       inpt  : input batch of images to be stride with shape = ()
       size  : a tuple indicating the horizontal and vertical size of the kernel
       stride: a tuple indicating the horizontal and vertical steps of the kernel
+      dilation: a tuple indicating the horizontal and vertical spacing of the kernel elements
     '''
     B, s0, s1 = arr.strides[:3]
     b, m1, n1 = arr.shape[:3]
 
     m2, n2   = sub_shape
     st1, st2 = stride
+    d1, d2   = dilation
 
-    self.out_w = 1 + (m1 - m2) // st1 # output final shapes out_w, out_h
-    self.out_h = 1 + (n1 - n2) // st2
+    self.out_w = 1 + (m1 - d1 * (m2 - 1) - 1) // st1 # output final shapes out_w, out_h
+    self.out_h = 1 + (n1 - d2 * (n2 - 1) - 1) // st2
 
     # Shape of the final view
     view_shape = (b,) + (self.out_w, self.out_h) + (m2, n2) + arr.shape[3:]
 
     # strides of the final view
-    strides = (B,) + (st1 * s0,st2 * s1) + (s0, s1) + arr.strides[3:]
+    strides = (B,) + (st1 * s0,st2 * s1) + (d1 * s0, d2 * s1) + arr.strides[3:]
 
     subs = np.lib.stride_tricks.as_strided(arr, view_shape, strides=strides)
     # without any reshape, it's indeed a view of the input
     return subs
 
+  def _group_view(self, arr):
+    '''
+    Split the channels axis (the last one) of the array in (groups, channels // groups).
+    Splitting an axis is always possible without copies, so the result is still a view.
+
+    Parameters:
+      arr : array with the channels on the last axis
+    '''
+    return arr.reshape(arr.shape[:-1] + (self.groups, arr.shape[-1] // self.groups))
+
+  def _gemm_weights(self):
+    '''
+    Weights reshaped as a stack of matrices (groups, kx * ky * in_c // groups, out_c // groups).
+    With a single group this is a view of the weights.
+    '''
+    return self._group_view(self.weights.reshape(-1, self.channels_out)).transpose(1, 0, 2)
+
+  def _im2col(self, view):
+    '''
+    Pack the strided view of the input in a contiguous matrix of shape
+    (groups, batch * out_w * out_h, kx * ky * in_c // groups), one row for each patch
+    and one matrix for each group of channels.
+    The buffer is allocated only when the input shape changes and it is reused
+    by the following calls.
+
+    Parameters:
+      view : strided view of the input with shape (batch, out_w, out_h, kx, ky, in_c)
+    '''
+    b, out_w, out_h, kx, ky, c = view.shape
+    col_shape = (self.groups, b * out_w * out_h, kx * ky * c // self.groups)
+
+    # the patches of a lower precision input (float16 storage) are promoted to the weights precision
+    dtype = np.result_type(view.dtype, self.weights.dtype)
+
+    if self._col is None or self._col.shape != col_shape or self._col.dtype != dtype:
+      self._col = np.empty(shape=col_shape, dtype=dtype)
+
+    # the reshape of a contiguous buffer is a view, so the copy fills self._col
+    self._col.reshape((self.groups, ) + view.shape[:-1] + (c // self.groups, ))[:] = self._group_view(view).transpose(5, 0, 1, 2, 3, 4, 6)
+
+    return self._col
+
+  def _col2im(self, cols, out):
+    '''
+    Scatter-add the patches gradient back to the input positions, i.e. the
+    inverse of _im2col. Overlapping patches are accumulated with one strided
+    slice add for every kernel offset (kx * ky vectorized operations).
+
+    Parameters:
+      cols : array of shape (batch, out_w, out_h, kx, ky, in_c), gradient of every patch
+      out  : array of shape (batch, w, h, in_c) to be updated in place
+    '''
+    _, out_w, out_h, kx, ky, _ = cols.shape
+    sx, sy = self.stride
+    dx, dy = self.dilation
+
+    for i in range(kx):
+      for j in range(ky):
+        out[:, i * dx : i * dx + (out_w - 1) * sx + 1 : sx, j * dy : j * dy + (out_h - 1) * sy + 1 : sy, :] += cols[:, :, :, i, j, :]
+
+    return out
+
+  def _winograd_allowed(self):
+    '''
+    Check if the Winograd algorithm can be applied to the layer, i.e. 3 x 3 kernel, stride 1 and no dilation
+    '''
+    return tuple(self.size) == (3, 3) and tuple(self.stride) == (1, 1) and tuple(self.dilation) == (1, 1)
+
+  def _select_algorithm(self):
+    '''
+    Resolve the 'auto' algorithm into the convolution algorithm to use
+    '''
+    if self.algorithm != 'auto':
+      return self.algorithm
+
+    # the transformed algorithms are available only for the dense convolution.
+    # The depthwise convolution is a broadcast product, faster with einsum than with
+    # a stack of small matrix products
+    if tuple(self.size) == (1, 1):
+      return 'pointwise'
+
+    if self.groups > 1:
+      return 'einsum' if self.c == self.groups else 'gemm'
+
+    if self._winograd_allowed():
+      return 'winograd'
+
+    kx, ky = self.size
+    sx, sy = self.stride
+
+    if kx * ky >= self.FFT_CROSSOVER * sx * sy and tuple(self.dilation) == (1, 1):
+      return 'fft'
+
+    return 'gemm'
+
+  def _winograd_transform_weights(self):
+    '''
+    Compute the Winograd transformation of the weights U = G g G^T with
+    shape (t * t, in_c, out_c), where t = m + 2 is the input tile size.
+    The result is cached and recomputed only after an update of the weights.
+    '''
+    if self._winograd_weights is None:
+      _, G, _ = WINOGRAD_TRANSFORMS[self.winograd_tile]
+      G = G.astype(self.weights.dtype) # the transforms follow the weights precision
+      t = G.shape[0]
+
+      # (kx, ky, in_c, out_c) -> (t, ky, in_c, out_c) -> (t, t, in_c, out_c), ordered as the input tiles (y, x)
+      U = np.tensordot(G, self.weights, axes=(1, 0))
+      U = np.tensordot(G, U, axes=(1, 1))
+
+      self._winograd_weights = U.reshape(t * t, self.c, self.channels_out)
+
+    return self._winograd_weights
+
+  def _winograd(self, mat_pad):
+    '''
+    Convolution of the padded input with the Winograd minimal filtering algorithm F(m x m, 3 x 3).
+    The input is split in overlapping tiles of size (m + 2) x (m + 2) with step m, and for every tile
+
+      Y = A^T [ (G g G^T) * (B^T d B) ] A
+
+    where the element-wise product is performed for all the tiles and channels at
+    once as t * t batched matrix products (tiles, in_c) x (in_c, out_c)
+
+    Parameters:
+      mat_pad : padded input of shape (batch, out_w + 2, out_h + 2, in_c)
+    '''
+    BT, _, AT = WINOGRAD_TRANSFORMS[self.winograd_tile]
+    BT, AT = BT.astype(self.weights.dtype), AT.astype(self.weights.dtype)
+    m, t = AT.shape
+
+    b, w, h, c = mat_pad.shape
+    out_w, out_h = w - 2, h - 2
+
+    # number of tiles along each axis, the input is zero-padded to fit an integer number of tiles
+    nw = -(-out_w // m)
+    nh = -(-out_h // m)
+    tiles = np.pad(mat_pad, ((0, 0), (0, nw * m + 2 - w), (0, nh * m + 2 - h), (0, 0)), mode='constant', constant_values=(0., 0.))
+
+    B, s0, s1, s2 = tiles.strides
+    tiles = np.lib.stride_tricks.as_strided(tiles, shape=(b, nw, nh, t, t, c), strides=(B, m * s0, m * s1, s0, s1, s2))
+
+    # input transform V = B^T d B, with shape (t, t, batch, nw, nh, in_c) ordered as (y, x)
+    V = np.tensordot(BT, tiles, axes=(1, 3))
+    V = np.tensordot(BT, V, axes=(1, 4))
+    V = V.reshape(t * t, b * nw * nh, c)
+
+    # element-wise product in the Winograd domain as batched matrix products
+    M = np.matmul(V, self._winograd_transform_weights())
+    M = M.reshape(t, t, b * nw * nh, self.channels_out)
+
+    # output transform Y = A^T M A, with shape (m, m, tiles, out_c) ordered as (x, y)
+    Y = np.tensordot(AT, M, axes=(1, 1))
+    Y = np.tensordot(AT, Y, axes=(1, 1))
+
+    # (y, x, batch, nw, nh, out_c) -> (batch, nw, x, nh, y, out_c)
+    Y = Y.reshape(m, m, b, nw, nh, self.channels_out).transpose(2, 3, 1, 4, 0, 5)
+    Y = Y.reshape(b, nw * m, nh * m, self.channels_out)
+
+    return Y[:, :out_w, :out_h, :]
+
+  def _fft_size(self, n):
+    '''
+    Smallest integer greater or equal to n with only 2, 3 and 5 as prime factors,
+    i.e. a size for which the fft is fast.
+
+    Parameters:
+      n : int, minimum size of the transform
+    '''
+    best = 2 * n
+    p5 = 1
+    while p5 < best:
+      p35 = p5
+      while p35 < best:
+        p235 = p35
+        while p235 < n:
+          p235 *= 2
+        best = min(best, p235)
+        p35 *= 3
+      p5 *= 5
+
+    return best
+
+  def _fft_transform_weights(self, fft_shape):
+    '''
+    Compute the real fft of the weights zero-padded to the fft shape, with
+    shape (fw, fh // 2 + 1, in_c, out_c). The result is cached and recomputed only
+    after an update of the weights or if the fft shape changes.
+
+    Parameters:
+      fft_shape : tuple (fw, fh), size of the transform
+    '''
+    if self._fft_weights is None or self._fft_weights.shape[:2] != (fft_shape[0], fft_shape[1] // 2 + 1):
+      self._fft_weights = np.fft.rfft2(self.weights, s=fft_shape, axes=(0, 1))
+
+    return self._fft_weights
+
+  def _fft_subsample(self, arr, shape):
+    '''
+    Select the positions of the stride-1 correlation that correspond to the strided output
+
+    Parameters:
+      arr   : array of shape (batch, w, h, channels)
+      shape : tuple (out_w, out_h)
+    '''
+    sx, sy = self.stride
+    out_w, out_h = shape
+    return arr[:, : (out_w - 1) * sx + 1 : sx, : (out_h - 1) * sy + 1 : sy, :]
+
+  def _fft(self, mat_pad):
+    '''
+    Convolution of the padded input computed in the frequency domain. The cross-correlation
+    with every filter is the inverse transform of X * conj(W) summed over the input channels,
+    performed as a batch of matrix products (one for every frequency). The fft size is at
+    least the size of the padded input, so the circular wrap never reaches the valid outputs.
+
+    Parameters:
+      mat_pad : padded input of shape (batch, w, h, in_c)
+    '''
+    b, w, h, c = mat_pad.shape
+    kx, ky = self.size
+    sx, sy = self.stride
+
+    out_w = 1 + (w - kx) // sx
+    out_h = 1 + (h - ky) // sy
+
+    self._fft_transform_input(mat_pad)
+    Wf = self._fft_transform_weights(self._fft_shape) # (fw, fh // 2 + 1, in_c, out_c)
+
+    # (fw, fh // 2 + 1, batch, in_c) x (fw, fh // 2 + 1, in_c, out_c)
+    Zf = np.matmul(self._fft_input.transpose(1, 2, 0, 3), Wf.conj())
+    z  = np.fft.irfft2(Zf.transpose(2, 0, 1, 3), s=self._fft_shape, axes=(1, 2))
+
+    return self._fft_subsample(z, (out_w, out_h))
+
+  def _fft_transform_input(self, mat_pad):
+    '''
+    Compute the real fft of the padded input with shape (batch, fw, fh // 2 + 1, in_c).
+    The transform is stored for the weights gradient.
+
+    Parameters:
+      mat_pad : padded input of shape (batch, w, h, in_c)
+    '''
+    _, w, h, _ = mat_pad.shape
+
+    self._fft_input_shape = mat_pad.shape
+    self._fft_shape = (self._fft_size(w), self._fft_size(h))
+
+    self._fft_input = np.fft.rfft2(mat_pad, s=self._fft_shape, axes=(1, 2))
+
+    return self._fft_input
+
+  def _fft_backward(self, mat_pad):
+    '''
+    Weights gradient and input gradient of the fft convolution. The layer delta is
+    scattered on the stride-1 grid, then
+
+      dW = IFFT( sum_b conj(D) * X )  and  dX = IFFT( sum_o D * W )
+
+    restricted to the kernel size and to the input size, respectively.
+
+    Parameters:
+      mat_pad : padded global delta, updated in place with shape (batch, w, h, in_c)
+    '''
+    kx, ky = self.size
+    b, out_w, out_h, _ = self.delta.shape
+    fw, fh = self._fft_shape
+
+    delta = np.zeros(shape=(b, fw, fh, self.channels_out), dtype=self.delta.dtype)
+    self._fft_subsample(delta, (out_w, out_h))[:] = self.delta
+
+    Df = np.fft.rfft2(delta, axes=(1, 2)).transpose(1, 2, 0, 3) # (fw, fh // 2 + 1, batch, out_c)
+
+    # (fw, fh // 2 + 1, in_c, batch) x (fw, fh // 2 + 1, batch, out_c)
+    dWf = np.matmul(self._fft_input.transpose(1, 2, 3, 0), Df.conj())
+    self.weights_update = np.fft.irfft2(dWf, s=self._fft_shape, axes=(0, 1))[:kx, :ky, ...]
+
+    # (fw, fh // 2 + 1, batch, out_c) x (fw, fh // 2 + 1, out_c, in_c)
+    dXf = np.matmul(Df, self._fft_transform_weights(self._fft_shape).transpose(0, 1, 3, 2))
+    dX  = np.fft.irfft2(dXf.transpose(2, 0, 1, 3), s=self._fft_shape, axes=(1, 2))
+
+    # the valid part of the gradient has the same shape of the padded input of the forward
+    _, w, h, _ = self._fft_input_shape
+    mat_pad[:, :w, :h, :] += dX[:, :w, :h, :]
+
+    return mat_pad
+
+  def _patches_backward(self, mat_pad):
+    '''
+    Weights gradient and input gradient computed on the patches of the input
+    (im2col for gemm and winograd, strided view for einsum)
+
+    Parameters:
+      mat_pad : padded global delta, updated in place with shape (batch, w, h, in_c)
+    '''
+    # the gradients of the winograd layers are computed in the im2col form
+    if self._algorithm == 'winograd':
+      self._im2col(self.view)
+
+    b, out_w, out_h, kx, ky, c = self.view.shape
+
+    # this operation should be +=, as darknet suggest (?)
+    if self._algorithm in ('gemm', 'winograd'):
+      # the im2col buffer holds the patches of the last forward
+      group_delta = self._group_view(self.delta.reshape(-1, self.channels_out)).transpose(1, 0, 2) # (groups, batch*out_w*out_h, out_c // groups)
+      self.weights_update = np.matmul(self._col.transpose(0, 2, 1), group_delta)
+      self.weights_update = self.weights_update.transpose(1, 0, 2).reshape(self.weights.shape)
+
+      # Actual operation to be performed, it's basically the convolution of self.delta with weights.transpose
+      operator = np.matmul(group_delta, self._gemm_weights().transpose(0, 2, 1))          # (groups, batch*out_w*out_h, kx*ky*in_c // groups)
+      operator = operator.reshape(self.groups, b, out_w, out_h, kx, ky, c // self.groups).transpose(1, 2, 3, 4, 5, 0, 6)
+
+    else:
+      group_delta = self._group_view(self.delta)
+      self.weights_update = np.einsum('ijklmgn, ijkgo -> lmngo', self._group_view(self.view), group_delta)
+      self.weights_update = self.weights_update.reshape(self.weights.shape)
+
+      # Actual operation to be performed, it's basically the convolution of self.delta with weights.transpose
+      operator = np.einsum('ijkgl, mnogl -> ijkmngo', group_delta, self._group_view(self.weights))
+
+    operator = operator.reshape(b, out_w, out_h, kx, ky, c)
+
+    # Scatter every patch gradient in the (padded) delta
+    self._col2im(operator, mat_pad)
+
+    return mat_pad
+
+  def _pointwise(self, inpt):
+    '''
+    Convolution with a 1 x 1 kernel: the input (subsampled if stride > 1) is already
+    the im2col matrix, so the output is a plain matrix product of the reshaped input
+    with the weights. With stride 1 the reshape of a contiguous input is a view and
+    no copy is made.
+
+    Parameters:
+      inpt : input batch of images in format (batch, in_w, in_h, in_c)
+    '''
+    z = np.matmul(self._pointwise_patches(inpt), self._gemm_weights())             # (groups, batch*out_w*out_h, out_c // groups)
+    return z.transpose(1, 0, 2).reshape(inpt.shape[0], self.out_w, self.out_h, self.channels_out)
+
+  def _pointwise_patches(self, inpt):
+    '''
+    Input of the 1 x 1 convolution reshaped as (groups, batch * out_w * out_h, in_c // groups),
+    i.e. the im2col matrix of the 1 x 1 kernel. It is stored for the weights gradient.
+
+    Parameters:
+      inpt : input batch of images in format (batch, in_w, in_h, in_c)
+    '''
+    sx, sy = self.stride
+
+    if sx != 1 or sy != 1:
+      # strided subsample of the input, same positions of the (cut) strided view
+      inpt = inpt[:, ::sx, ::sy, :]
+
+    b, self.out_w, self.out_h, c = inpt.shape
+
+    self._pointwise_input = self._group_view(inpt.reshape(-1, c)).transpose(1, 0, 2) # (groups, batch*out_w*out_h, in_c // groups)
+
+    return self._pointwise_input
+
+  def _pointwise_backward(self, delta):
+    '''
+    Weights gradient and input gradient of the 1 x 1 convolution as matrix products
+
+    Parameters:
+      delta : global delta, updated in place with shape (batch, in_w, in_h, in_c)
+    '''
+    sx, sy = self.stride
+    b, out_w, out_h, _ = self.delta.shape
+
+    group_delta = self._group_view(self.delta.reshape(-1, self.channels_out)).transpose(1, 0, 2) # (groups, batch*out_w*out_h, out_c // groups)
+
+    self.weights_update = np.matmul(self._pointwise_input.transpose(0, 2, 1), group_delta)
+    self.weights_update = self.weights_update.transpose(1, 0, 2).reshape(self.weights.shape)
+
+    operator = np.matmul(group_delta, self._gemm_weights().transpose(0, 2, 1))            # (groups, batch*out_w*out_h, in_c // groups)
+    operator = operator.transpose(1, 0, 2).reshape(b, out_w, out_h, self.c)
+
+    delta[:, ::sx, ::sy, :] += operator
+
+    return delta
+
+  def _convolve(self, mat_pad):
+    '''
+    Convolution of the (padded) input with the weights, without bias and activation,
+    computed with the selected algorithm
+
+    Parameters:
+      mat_pad : padded input of shape (batch, w, h, in_c)
+    '''
+    if self._algorithm == 'pointwise':
+      return self._pointwise(mat_pad)
+
+    # Create the view of the array with shape (batch, out_w ,out_h, kx, ky, in_c)
+    self.view = self._asStride(mat_pad, self.size, self.stride, self.dilation) #self, is used also in backward. Better way?
+
+    if self._algorithm == 'winograd':
+      z = self._winograd(mat_pad)
+
+    elif self._algorithm == 'fft':
+      z = self._fft(mat_pad)
+
+    elif self._algorithm == 'gemm':
+      # im2col: a single matrix product (batch*out_w*out_h, kx*ky*in_c) x (kx*ky*in_c, out_c)
+      # for every group of channels
+      col = self._im2col(self.view)
+      z = np.matmul(col, self._gemm_weights())                                      # (groups, batch*out_w*out_h, out_c // groups)
+      z = z.transpose(1, 0, 2).reshape(self.view.shape[:3] + (self.channels_out, ))
+
+    else:
+      # the choice of numpy.einsum is due to reshape of self.view is a copy and not a view
+      # it seems to be slower though
+      # the optimized contraction of the grouped einsum falls back to slow products
+      z = np.einsum('lmnijgk,ijkgo -> lmngo', self._group_view(self.view), self._group_view(self.weights), optimize=self.groups == 1)
+      z = z.reshape(self.view.shape[:3] + (self.channels_out, ))
+
+    return z
+
+  def _workspace_size(self, mat_pad):
+    '''
+    Estimate of the bytes of the temporary arrays (patches and output rows) of the
+    convolution of the whole padded input
+
+    Parameters:
+      mat_pad : padded input of shape (batch, w, h, in_c)
+    '''
+    b, w, h, c = mat_pad.shape
+    kx, ky = self._kernel_extent
+    sx, sy = self.stride
+
+    out_w = 1 + (w - kx) // sx
+    out_h = 1 + (h - ky) // sy
+
+    # one im2col row and one output row for every output position
+    position = (self.size[0] * self.size[1] * c + self.channels_out) * mat_pad.itemsize
+
+    return b * out_w * out_h * position
+
+  def _tiles(self, mat_pad):
+    '''
+    Split the output in tiles whose workspace fits in workspace_bytes: groups of whole
+    images when a single image fits, blocks of output rows of a single image otherwise
+    (at least one row). Every tile is returned as the tuple of slices
+    (batch, output rows, input rows) of the padded input rows needed by the tile.
+
+    Parameters:
+      mat_pad : padded input of shape (batch, w, h, in_c)
+    '''
+    b, w, h, _ = mat_pad.shape
+    kx, ky = self._kernel_extent
+    sx, sy = self.stride
+
+    out_w = 1 + (w - kx) // sx
+
+    # workspace of a single output row of a single image
+    row_size = self._workspace_size(mat_pad[:1, : kx]) # input rows of one output row
+
+    rows   = max(1, self.workspace_bytes // row_size)
+    images = max(1, rows // out_w)
+    rows   = min(rows, out_w)
+
+    for i in range(0, b, images):
+      for r in range(0, out_w, rows):
+        r_end = min(r + rows, out_w)
+        yield slice(i, i + images), slice(r, r_end), slice(r * sx, (r_end - 1) * sx + kx)
+
+  def _tiled_convolve(self, mat_pad):
+    '''
+    Convolution computed tile by tile (see _tiles), so that the temporary arrays never
+    exceed workspace_bytes. The result is the same of _convolve.
+
+    Parameters:
+      mat_pad : padded input of shape (batch, w, h, in_c)
+    '''
+    z = None
+
+    for batch, out_rows, in_rows in self._tiles(mat_pad):
+      tile = self._convolve(mat_pad[batch, in_rows])
+
+      if z is None:
+        b, _, out_h, out_c = tile.shape
+        out_w = 1 + (mat_pad.shape[1] - self._kernel_extent[0]) // self.stride[0]
+        z = np.empty(shape=(mat_pad.shape[0], out_w, out_h, out_c), dtype=tile.dtype)
+
+      z[batch, out_rows] = tile
+
+    # the tiles overwrite the output sizes and the view of the whole input
+    _, self.out_w, self.out_h, _ = z.shape
+    self.view = None
+
+    return z
+
+  def _tiled_convolve_backward(self, mat_pad):
+    '''
+    Backward computed tile by tile on the input stored by the forward: the patches of
+    every tile are recomputed, the gradients are scattered in the rows of the tile and
+    the weights gradients of the tiles are accumulated.
+
+    Parameters:
+      mat_pad : padded global delta, updated in place with shape (batch, w, h, in_c)
+    '''
+    layer_delta = self.delta
+    weights_update = np.zeros(shape=self.weights.shape, dtype=self.weights.dtype)
+
+    for batch, out_rows, in_rows in self._tiles(self._tiled_input):
+      tile = self._tiled_input[batch, in_rows]
+      self.delta = layer_delta[batch, out_rows]
+
+      if self._algorithm == 'pointwise':
+        self._pointwise_patches(tile)
+        self._pointwise_backward(mat_pad[batch, in_rows])
+
+      elif self._algorithm == 'fft':
+        self._fft_transform_input(tile)
+        self._fft_backward(mat_pad[batch, in_rows])
+
+      else:
+        self.view = self._asStride(tile, self.size, self.stride, self.dilation)
+
+        if self._algorithm == 'gemm':
+          self._im2col(self.view)
+
+        self._patches_backward(mat_pad[batch, in_rows])
+
+      weights_update += self.weights_update
+
+    self.delta = layer_delta
+    self.weights_update = weights_update
+    _, self.out_w, self.out_h, _ = layer_delta.shape
+    self.view = None
+
+    return mat_pad
+
   def _evaluate_padding(self):
     '''
     Compute padding dimensions following keras SAME padding
@@ -181,17 +880,20 @@ class Convolutional_layer(object):
     https://stackoverflow.com/questions/53819528/how-does-tf-keras-layers-conv2d-with-padding-same-and-strides-1-behave
     '''
 
+    # the dilated kernel is padded as a kernel of the same extent
+    kx, ky = self._kernel_extent
+
     # Compute how many Raws are needed to pad the image in the 'w' axis
     if (self.w % self.stride[0] == 0):
-      pad_w = max(self.size[0] - self.stride[0], 0)
+      pad_w = max(kx - self.stride[0], 0)
     else:
-      pad_w = max(self.size[0] - (self.w % self.stride[0]), 0)
+      pad_w = max(kx - (self.w % self.stride[0]), 0)
 
     # Compute how many Columns are needed to pad the image in 'h' axis
     if (self.h % self.stride[1] == 0):
-      pad_h = max(self.size[1] - self.stride[1], 0)
+      pad_h = max(ky - self.stride[1], 0)
     else:
-      pad_h = max(self.size[1] - (self.h % self.stride[1]), 0)
+      pad_h = max(ky - (self.h % self.stride[1]), 0)
 
     # Number of raws/columns to be added for every directons
     self.pad_top    = pad_w >> 1 # bit shift, integer division by two
@@ -225,28 +927,49 @@ class Convolutional_layer(object):
             modifies it's input, if True make a copy instead
     '''
 
-    kx, ky = self.size
+    kx, ky = self._kernel_extent
     sx, sy = self.stride
 
+    # the batch follows the input, the other dimensions are fixed by the layer
+    self.batch = inpt.shape[0]
+
+    self._algorithm = self._select_algorithm()
+
+    if self._algorithm == 'pointwise':
+      # the 1 x 1 kernel needs neither padding (SAME padding is always zero) nor the strided view
+      if self.pad:
+        self._evaluate_padding()
+
+      mat_pad = inpt
+
     # Padding
-    if self.pad :
+    elif self.pad :
       self._evaluate_padding()
       mat_pad = self._pad(inpt)
     else :
       # If no pad, every image in the batch is cut
       mat_pad = inpt[:, : (self.w - kx) // sx*sx + kx, : (self.h - ky) // sy*sy + ky, ...]
 
+    if self.workspace_bytes is not None and self._workspace_size(mat_pad) > self.workspace_bytes:
+      # the input is kept to recompute the patches of every tile in backward
+      self._tiled_input = mat_pad
+      z = self._tiled_convolve(mat_pad)
 
-    # Create the view of the array with shape (batch, out_w ,out_h, kx, ky, in_c)
-    self.view = self._asStride(mat_pad, self.size, self.stride) #self, is used also in backward. Better way?
-
-    # the choice of numpy.einsum is due to reshape of self.view is a copy and not a view
-    # it seems to be slower though
+    else:
+      self._tiled_input = None
+      z = self._convolve(mat_pad)
 
-    z = np.einsum('lmnijk,ijko -> lmno', self.view, self.weights, optimize=True) + self.bias
+    z += self.bias
 
     self.output = self.activation(z, copy=copy) # (batch, out_w, out_h, out_c)
-    self.delta = np.zeros(shape=self.out_shape, dtype=float)
+
+    if self.trainable:
+      self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype)
+
+    else:
+      # the views and transforms of the input are needed only by backward
+      self.view, self._tiled_input, self._fft_input, self._pointwise_input = (None, None, None, None)
+      self.delta = None
 
   def backward(self, delta, copy=False):
     '''
@@ -259,40 +982,35 @@ class Convolutional_layer(object):
         return a copy of its input
     '''
 
+    self.delta *= self.gradient(self.output, copy=copy)
+
+    # out_c number of bias_updates.
+    self.bias_update = self.delta.sum(axis=(0, 1, 2)) # shape = (channels_out,)
+
     # delta padding to match dimension with padded input when computing the view
-    if self.pad:
+    if self.pad and self._algorithm != 'pointwise':
       mat_pad = self._pad(delta) # padded with same values as input
     else  :
       mat_pad = delta
 
-    # View on delta, I can use this to modify it
-    delta_view = self._asStride(mat_pad, self.size, self.stride)
+    if self._tiled_input is not None:
+      self._tiled_convolve_backward(mat_pad)
 
-    self.delta *= self.gradient(self.output, copy=copy)
+    elif self._algorithm == 'pointwise':
+      # 1 x 1 kernel: no padding and no scatter of the patches
+      self._pointwise_backward(mat_pad)
 
-    # this operation should be +=, as darknet suggest (?)
-    self.weights_update = np.einsum('ijklmn, ijko -> lmno', self.view, self.delta)
+    elif self._algorithm == 'fft':
+      # weights update and scatter of the delta in the frequency domain
+      self._fft_backward(mat_pad)
 
-    # out_c number of bias_updates.
-    self.bias_update = self.delta.sum(axis=(0, 1, 2)) # shape = (channels_out,)
-
-    # to access every pixel one at a time I need to create every combinations of indexes
-    b, w, h, kx, ky, c = delta_view.shape
-    combo = itertools.product(range(b), range(w), range(h) , range(kx), range(ky), range(c))
-
-    # Actual operation to be performed, it's basically the convolution of self.delta with weights.transpose
-    operator = np.einsum('ijkl, mnol -> ijkmno', self.delta, self.weights)
-
-    # Atomically modify , really slow as for maxpool and avgpool
-    for i, j, k, l, m, n in combo:
-      delta_view[i, j, k, l, m, n] += operator[i, j, k, l, m, n]
+    else:
+      self._patches_backward(mat_pad)
 
     # Here delta is updated correctly
-    if self.pad :
+    if self.pad and self._algorithm != 'pointwise':
       _ , w_pad, h_pad, _ = mat_pad.shape
       delta[:] = mat_pad[:, self.pad_top : w_pad-self.pad_bottom, self.pad_left : h_pad - self.pad_right ,:]
-    else  :
-      delta[:] = mat_pad
 
 
   def update(self):
@@ -306,6 +1024,10 @@ class Convolutional_layer(object):
                                                     gradients=[self.bias_update, self.weights_update]
                                                    )
 
+    # the transformed weights are no more valid
+    self._winograd_weights = None
+    self._fft_weights = None
+
 
 
 if __name__ == '__main__':
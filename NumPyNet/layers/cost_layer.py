@@ -10,6 +10,8 @@ from enum import Enum
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
+from NumPyNet.utils import SECRET_NUM
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
@@ -27,7 +29,7 @@ class cost_type(Enum):
   hinge = 7
   logcosh = 8
 
-class Cost_layer(object):
+class Cost_layer(BaseLayer):
 
   def __init__(self, input_shape, cost_type, scale=1., ratio=0., noobject_scale=1., threshold=0., smoothing=0., **kwargs):
     '''
@@ -51,9 +53,7 @@ class Cost_layer(object):
     self.smoothing = smoothing
 
     self._out_shape = input_shape
-    # Need an empty initialization to work out _smooth_l1 and _wgan
-    self.output = np.empty(shape=self._out_shape)
-    self.delta = np.empty(shape=self._out_shape)
+    self.output, self.delta = (None, None)
 
   def __str__(self):
     return 'cost                  {0:>4d} x{1:>4d} x{2:>4d} x{3:>4d}   ->  {0:>4d} x{1:>4d} x{2:>4d} x{3:>4d}'.format(*self.out_shape)
@@ -85,7 +85,13 @@ class Cost_layer(object):
 
     if truth is not None:
 
-      if self.smoothing: self._smoothing(truth)                              # smooth is applied on truth
+      # the masked entries are selected before the smoothing of truth
+      ignored = truth == SECRET_NUM if self.cost_type == cost_type.masked else None
+
+      if self.smoothing: truth = self._smoothing(truth)                      # smooth is applied on a copy of truth
+
+      if ignored is not None:                                                # l2 Masked truth values if selected
+        inpt = self._masked(inpt, truth, ignored)
 
       if   self.cost_type == cost_type.smooth:    self._smooth_l1(inpt, truth)  # smooth_l1 if smooth not zero
       elif self.cost_type == cost_type.mae:       self._l1(inpt, truth)         # call for l1 if mae is cost
@@ -98,9 +104,6 @@ class Cost_layer(object):
       if self.cost_type == cost_type.seg and self.noobject_scale != 1.:      # seg if noobject_scale is not 1.
         self._seg(truth)
 
-      if self.cost_type == cost_type.masked:                                 # l2 Masked truth values if selected
-        self._masked(inpt, truth)
-
       if self.ratio:                                                         #
         self._ratio(truth)
 
@@ -125,16 +128,16 @@ class Cost_layer(object):
 
   def _smoothing(self, truth):
     '''
-    _smoothing function :
+    _smoothing function : it returns the smoothed truth, the given array is not modified
 
     Parameters:
       truth : array, truth values
     '''
 
     scale = 1. - self.smoothing
-    bias  = self.smoothing / self.output.size
+    bias  = self.smoothing / truth.size
 
-    truth[:] = truth * scale + bias
+    return truth * scale + bias
 
   def _smooth_l1(self, inpt, truth):
     '''
@@ -148,6 +151,9 @@ class Cost_layer(object):
     diff = inpt - truth
     abs_diff = np.abs(diff)
 
+    self.output = np.empty(shape=inpt.shape, dtype=diff.dtype)
+    self.delta  = np.empty(shape=inpt.shape, dtype=diff.dtype)
+
     mask_index = abs_diff < 1.
     self.output[ mask_index ] = diff[ mask_index ] * diff[ mask_index ]
     self.delta [ mask_index ] = diff[ mask_index ]
@@ -182,13 +188,15 @@ class Cost_layer(object):
       inpt  : array output of the network
       truth : array, truth values
     '''
+    self.output = np.empty(shape=inpt.shape, dtype=inpt.dtype)
+
     mask_index = truth != 0
     # mask_index = truth[ truth != 0 ]
     self.output[mask_index] = -inpt[mask_index]
     mask_index = ~mask_index
     self.output[mask_index] =  inpt[mask_index]
 
-    self.delta = np.sign(truth)
+    self.delta = np.sign(truth).astype(inpt.dtype)
 
 
   def _l2(self, inpt, truth):
@@ -265,17 +273,18 @@ class Cost_layer(object):
     self.output[mask_index] *= self.noobject_scale
     self.delta[ mask_index] *= self.noobject_scale
 
-  def _masked(self, inpt, truth):
+  def _masked(self, inpt, truth, ignored):
     '''
-    _masked function : set to zero the part of the input where the condition is true.
-     used to ignore certain classes
+    _masked function : set the input equal to the truth where the truth is SECRET_NUM, so that
+     the ignored entries (ex. unlabeled classes) have zero cost and zero delta. It returns the
+     masked input, the given array is not modified
 
     Parameters:
-      inpt  : array output of the network
-      truth : array, truth values
+      inpt    : array output of the network
+      truth   : array, truth values
+      ignored : array of bool, entries whose truth is SECRET_NUM
     '''
-    # utils is not here yet
-    inpt[truth == utils.SECRET_NUM] = 0.
+    return np.where(ignored, truth, inpt)
 
   def _ratio(self, truth):
     '''
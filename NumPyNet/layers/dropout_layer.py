@@ -7,12 +7,13 @@ from __future__ import print_function
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Dropout Layer'
 
-class Dropout_layer(object):
+class Dropout_layer(BaseLayer):
 
   def __init__(self, prob, **kwargs):
     '''
@@ -30,6 +31,7 @@ class Dropout_layer(object):
 
 
     self.output, self.delta = (None, None)
+
     self._out_shape = None
 
   def __str__(self):
@@ -57,7 +59,7 @@ class Dropout_layer(object):
     '''
     Forward function of the Dropout layer: it create a random mask for every input
       in the batch and set to zero the chosen values. Other pixels are scaled
-      with the scale variable.
+      with the scale variable. In inference mode the input is returned unchanged.
 
     Parameters :
       inpt : array of shape (batch, w, h, c), input of the layer
@@ -65,9 +67,15 @@ class Dropout_layer(object):
 
     self._out_shape = inpt.shape
 
+    if not self.trainable:
+      # the expected value of the training output is the input itself
+      self.output = inpt
+      self.rnd, self.delta = (None, None)
+      return
+
     self.rnd = np.random.uniform(low=0., high=1., size=self.out_shape) > self.probability
     self.output = self.rnd * inpt * self.scale
-    self.delta = np.zeros(shape=inpt.shape)
+    self.delta = np.zeros(shape=inpt.shape, dtype=self.output.dtype)
 
   def backward(self, delta=None):
     '''
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
+
+__author__ = ['Mattia Ceccarelli', 'Nico Curti']
+__email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
+__package__ = 'Global Avgpool Layer'
+
+
+class GlobalAvgpool_layer(BaseLayer):
+
+  def __init__(self, input_shape=None, **kwargs):
+    '''
+    Global Avgpool layer: average of every channel over the whole spatial extent
+    of the image, equivalent to an Avgpool_layer with a kernel as large as the image
+
+    Parameters:
+      input_shape : tuple, default None. Shape of the input in the format (batch, w, h, c)
+    '''
+
+    if input_shape is not None:
+      self.batch, self.w, self.h, self.c = input_shape
+    else:
+      self.batch, self.w, self.h, self.c = (0, 0, 0, 0)
+
+    self.output, self.delta = (None, None)
+
+  def __str__(self):
+    batch, out_width, out_height, out_channels = self.out_shape
+    return 'avg                    {:>4d} x{:>4d} x{:>4d} x{:>4d}   ->  {:>4d} x{:>4d} x{:>4d}'.format(
+           self.batch, self.w, self.h, self.c,
+           out_width, out_height, out_channels)
+
+  def __call__(self, previous_layer):
+
+    if previous_layer.out_shape is None:
+      class_name = self.__class__.__name__
+      prev_name  = layer.__class__.__name__
+      raise LayerError('Incorrect shapes found. Layer {} cannot be connected to the previous {} layer.'.format(class_name, prev_name))
+
+    self.batch, self.w, self.h, self.c = previous_layer.out_shape
+
+    return self
+
+  @property
+  def out_shape(self):
+    return (self.batch, 1, 1, self.c)
+
+  def forward(self, inpt):
+    '''
+    Forward function of the global average pool layer: it computes the mean of
+    every image in the batch over the width and height axes.
+
+    Parameters:
+      inpt : input batch of image, with the shape (batch, input_w, input_h, input_c)
+    '''
+
+    self.batch, self.w, self.h, self.c = inpt.shape
+
+    self.output = inpt.mean(axis=(1, 2), keepdims=True) # shape (batch, 1, 1, c)
+    self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype) if self.trainable else None
+
+  def backward(self, delta):
+    '''
+    Backward function of the global average pool layer: every pixel of the image
+    receives the layer delta of its channel, normalized by the number of pixels.
+
+    Parameters:
+      delta : global delta to be backpropagated with shape (batch, w, h, c)
+    '''
+
+    delta += self.delta * (1. / (self.w * self.h)) # broadcast over width and height
+
+
+if __name__ == '__main__':
+
+  import os
+
+  from PIL import Image
+
+  img_2_float = lambda im : ((im - im.min()) * (1./(im.max() - im.min()) * 1.)).astype(float)
+
+  filename = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'dog.jpg')
+  inpt = np.asarray(Image.open(filename), dtype=float)
+  inpt.setflags(write=1)
+  inpt = img_2_float(inpt)
+
+  inpt = np.expand_dims(inpt, axis=0)
+
+  # Model initialization
+  layer = GlobalAvgpool_layer()
+
+  # FORWARD
+
+  layer.forward(inpt)
+  forward_out = layer.output.copy()
+
+  print(layer)
+  print('Channels average : {}'.format(forward_out.ravel()))
+
+  # BACKWARD
+
+  delta = np.zeros(shape=inpt.shape, dtype=float)
+  layer.delta = np.ones(layer.out_shape, dtype=float)
+  layer.backward(delta)
+
+  print('Backward delta of the first pixel : {}'.format(delta[0, 0, 0]))
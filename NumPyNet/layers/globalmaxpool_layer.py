@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
+
+__author__ = ['Mattia Ceccarelli', 'Nico Curti']
+__email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
+__package__ = 'Global Maxpool Layer'
+
+
+class GlobalMaxpool_layer(BaseLayer):
+
+  def __init__(self, input_shape=None, **kwargs):
+    '''
+    Global Maxpool layer: maximum of every channel over the whole spatial extent
+    of the image, equivalent to a Maxpool_layer with a kernel as large as the image
+
+    Parameters:
+      input_shape : tuple, default None. Shape of the input in the format (batch, w, h, c)
+    '''
+
+    if input_shape is not None:
+      self.batch, self.w, self.h, self.c = input_shape
+    else:
+      self.batch, self.w, self.h, self.c = (0, 0, 0, 0)
+
+    self.output, self.indexes, self.delta = (None, None, None)
+
+  def __str__(self):
+    batch, out_width, out_height, out_channels = self.out_shape
+    return 'max                    {:>4d} x{:>4d} x{:>4d} x{:>4d}   ->  {:>4d} x{:>4d} x{:>4d} x{:>4d}'.format(
+           self.batch, self.w, self.h, self.c,
+           batch, out_width, out_height, out_channels)
+
+  def __call__(self, previous_layer):
+
+    if previous_layer.out_shape is None:
+      class_name = self.__class__.__name__
+      prev_name  = layer.__class__.__name__
+      raise LayerError('Incorrect shapes found. Layer {} cannot be connected to the previous {} layer.'.format(class_name, prev_name))
+
+    self.batch, self.w, self.h, self.c = previous_layer.out_shape
+
+    return self
+
+  @property
+  def out_shape(self):
+    return (self.batch, 1, 1, self.c)
+
+  @property
+  def _index_dtype(self):
+    '''
+    Smallest integer type able to store the position of the maximum inside the image
+    '''
+    for dtype in (np.int8, np.int16, np.int32):
+      if self.w * self.h <= np.iinfo(dtype).max:
+        return dtype
+
+    return np.int64
+
+  def forward(self, inpt):
+    '''
+    Forward function of the global max pool layer: it computes the maximum of
+    every image in the batch over the width and height axes.
+
+    Parameters:
+      inpt : input batch of image, with the shape (batch, input_w, input_h, input_c)
+    '''
+
+    self.batch, self.w, self.h, self.c = inpt.shape
+
+    # Every channel of the image is flattened, shape (batch, w * h, c)
+    flat = inpt.reshape(self.batch, -1, self.c)
+
+    if not self.trainable:
+      # the positions of the maxima are needed only by backward
+      self.output = flat.max(axis=1).reshape(self.out_shape)
+      self.indexes, self.delta = (None, None)
+      return
+
+    # Position of the maximum inside every image, as flat index x * h + y, shape (batch, c)
+    self.indexes = flat.argmax(axis=1).astype(self._index_dtype)
+
+    self.output = np.take_along_axis(flat, self.indexes[:, np.newaxis, :], axis=1)  # shape (batch, 1, c)
+    self.output = self.output.reshape(self.out_shape)
+    self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype)
+
+  def backward(self, delta):
+    '''
+    Backward function of the global max pool layer: only the maximum of every
+    channel receives the layer delta, with batch * c indexed updates.
+
+    Parameters:
+      delta : global delta to be backpropagated with shape (batch, w, h, c)
+    '''
+
+    x, y = np.divmod(self.indexes.astype(np.intp), self.h)
+    b = np.arange(self.batch).reshape(-1, 1)
+    k = np.arange(self.c).reshape(1, -1)
+
+    # every (b, k) couple is unique, so the indexed add does not need to accumulate
+    delta[b, x, y, k] += self.delta[:, 0, 0, :]
+
+
+if __name__ == '__main__':
+
+  import os
+
+  from PIL import Image
+
+  img_2_float = lambda im : ((im - im.min()) * (1./(im.max() - im.min()) * 1.)).astype(float)
+
+  filename = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'dog.jpg')
+  inpt = np.asarray(Image.open(filename), dtype=float)
+  inpt.setflags(write=1)
+  inpt = img_2_float(inpt)
+
+  inpt = np.expand_dims(inpt, axis=0)
+
+  # Model initialization
+  layer = GlobalMaxpool_layer()
+
+  # FORWARD
+
+  layer.forward(inpt)
+  forward_out = layer.output.copy()
+
+  print(layer)
+  print('Channels maximum : {}'.format(forward_out.ravel()))
+
+  # BACKWARD
+
+  delta = np.zeros(shape=inpt.shape, dtype=float)
+  layer.delta = np.ones(layer.out_shape, dtype=float)
+  layer.backward(delta)
+
+  print('Number of pixels with non-zero delta : {}'.format(np.count_nonzero(delta)))
@@ -6,13 +6,14 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Input Layer'
 
 
-class Input_layer(object):
+class Input_layer(BaseLayer):
 
   def __init__(self, input_shape, **kwargs):
     '''
@@ -46,7 +47,7 @@ class Input_layer(object):
       raise ValueError('Forward Input layer. Incorrect input shape. Expected {} and given {}'.format(self.out_shape, inpt.shape))
 
     self.output[:] = inpt
-    self.delta = np.zeros(shape=self.out_shape, dtype=float)
+    self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype) if self.trainable else None
 
   def backward(self, delta):
     '''
@@ -7,13 +7,14 @@ from __future__ import print_function
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'L1Normalization Layer'
 
 
-class L1Norm_layer(object):
+class L1Norm_layer(BaseLayer):
 
   def __init__(self, axis=None, **kwargs):
     '''
@@ -57,8 +58,13 @@ class L1Norm_layer(object):
     norm = np.abs(inpt).sum(axis=self.axis, keepdims=True)
     norm = 1. / (norm + 1e-8)
     self.output = inpt * norm
-    self.scales = -np.sign(self.output)
-    self.delta  = np.zeros(shape=self.out_shape, dtype=float)
+
+    if self.trainable:
+      self.scales = -np.sign(self.output)
+      self.delta  = np.zeros(shape=self.out_shape, dtype=self.output.dtype)
+
+    else:
+      self.scales, self.delta = (None, None)
 
   def backward(self, delta, copy=False):
     '''
@@ -7,13 +7,14 @@ from __future__ import print_function
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Logistic Layer'
 
 
-class Logistic_layer(object):
+class Logistic_layer(BaseLayer):
 
   def __init__(self, **kwargs):
     '''
@@ -68,7 +69,7 @@ class Logistic_layer(object):
       # self.cost = np.mean(self.loss)
       self.cost = np.sum(self.loss) # as for darknet
     else :
-      self.delta = np.zeros(shape=self._out_shape, dtype=float)
+      self.delta = np.zeros(shape=self._out_shape, dtype=self.output.dtype) if self.trainable else None
 
   def backward(self, delta=None):
     '''
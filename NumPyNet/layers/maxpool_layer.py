@@ -4,19 +4,18 @@
 from __future__ import division
 from __future__ import print_function
 
-import itertools
-
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Maxpool Layer'
 
 
-class Maxpool_layer(object):
+class Maxpool_layer(BaseLayer):
 
-  def __init__(self, size, stride=None, padding=None, **kwargs):
+  def __init__(self, size, stride=None, padding=None, dilation=1, **kwargs):
 
     '''
     MaxPool Layer: perfmors a downsample of the image through the slide of a kernel
@@ -27,6 +26,8 @@ class Maxpool_layer(object):
       stride : tuple of int, step of the kernel with shape (st1, st2)
       padding: boolean, default is None. If True pad the image following keras SAME
         padding. If False the image is not padded
+      dilation : int or tuple of int, default 1. Spacing (dx, dy) between the elements
+        of the kernel
     '''
 
     self.size = size
@@ -41,7 +42,11 @@ class Maxpool_layer(object):
     if not hasattr(self.stride, '__iter__'):
       self.stride = (int(self.stride), int(self.stride))
 
-    assert len(self.size) == 2 and len(self.stride) == 2
+    self.dilation = dilation
+    if not hasattr(self.dilation, '__iter__'):
+      self.dilation = (int(self.dilation), int(self.dilation))
+
+    assert len(self.size) == 2 and len(self.stride) == 2 and len(self.dilation) == 2
 
     self.batch, self.w, self.h, self.c = (0, 0, 0, 0)
 
@@ -73,17 +78,26 @@ class Maxpool_layer(object):
 
     return self
 
+  @property
+  def _kernel_extent(self):
+    '''
+    Size (kx, ky) of the input region covered by the (dilated) kernel
+    '''
+    return tuple(d * (k - 1) + 1 for k, d in zip(self.size, self.dilation))
+
   @property
   def out_shape(self):
-    out_height   = (self.h + self.pad_left + self.pad_right - self.size[1]) // self.stride[1] + 1
-    out_width    = (self.w + self.pad_top + self.pad_bottom - self.size[0]) // self.stride[0] + 1
+    kx, ky = self._kernel_extent
+    out_height   = (self.h + self.pad_left + self.pad_right - ky) // self.stride[1] + 1
+    out_width    = (self.w + self.pad_top + self.pad_bottom - kx) // self.stride[0] + 1
     out_channels = self.c
     return (self.batch, out_width, out_height, out_channels)
 
-  def _asStride(self, inpt, size, stride):
+  def _asStride(self, inpt, size, stride, dilation=(1, 1)):
     '''
     _asStride returns a view of the input array such that a kernel of size = (kx,ky)
-    is slided over the image with stride = (st1, st2)
+    is slided over the image with stride = (st1, st2) and its elements are spaced
+    by dilation = (dx, dy)
 
     better reference here :
     https://docs.scipy.org/doc/numpy/reference/generated/numpy.lib.stride_tricks.as_strided.html
@@ -95,20 +109,22 @@ class Maxpool_layer(object):
       inpt  : input batch of images to be stride with shape = ()
       size  : a tuple indicating the horizontal and vertical size of the kernel
       stride: a tuple indicating the horizontal and vertical steps of the kernel
+      dilation: a tuple indicating the horizontal and vertical spacing of the kernel elements
     '''
     batch_stride, s0, s1 = inpt.strides[:3]
     batch,        w,  h  = inpt.shape[:3]
     kx, ky     = size
     st1, st2   = stride
+    d1, d2     = dilation
 
-    out_w = 1 + (w - kx)//st1
-    out_h = 1 + (h - ky)//st2
+    out_w = 1 + (w - d1 * (kx - 1) - 1)//st1
+    out_h = 1 + (h - d2 * (ky - 1) - 1)//st2
 
     # Shape of the final view
     view_shape = (batch, out_w , out_h) + inpt.shape[3:] + (kx, ky)
 
     # strides of the final view
-    strides = (batch_stride, st1 * s0, st2 * s1) + inpt.strides[3:] + (s0, s1)
+    strides = (batch_stride, st1 * s0, st2 * s1) + inpt.strides[3:] + (d1 * s0, d2 * s1)
 
     subs = np.lib.stride_tricks.as_strided(inpt, view_shape, strides = strides)
     return subs
@@ -117,17 +133,20 @@ class Maxpool_layer(object):
     '''
     Compute padding dimensions
     '''
+    # the dilated kernel is padded as a kernel of the same extent
+    kx, ky = self._kernel_extent
+
     # Compute how many raws are needed to pad the image in the 'w' axis
     if (self.w % self.stride[0] == 0):
-      pad_w = max(self.size[0] - self.stride[0], 0)
+      pad_w = max(kx - self.stride[0], 0)
     else:
-      pad_w = max(self.size[0] - (self.w % self.stride[0]), 0)
+      pad_w = max(kx - (self.w % self.stride[0]), 0)
 
     # Compute how many Columns are needed
     if (self.h % self.stride[1] == 0):
-      pad_h = max(self.size[1] - self.stride[1], 0)
+      pad_h = max(ky - self.stride[1], 0)
     else:
-      pad_h = max(self.size[1] - (self.h % self.stride[1]), 0)
+      pad_h = max(ky - (self.h % self.stride[1]), 0)
 
     # Number of raws/columns to be added for every directons
     self.pad_top    = pad_w >> 1 # bit shift, integer division by two
@@ -137,7 +156,8 @@ class Maxpool_layer(object):
 
   def _pad(self, inpt):
     '''
-    Padd every image in a batch with np.nan following keras SAME padding
+    Padd every image in a batch with -np.inf following keras SAME padding, so
+    the padded pixels are never the maximum of a window
     See also:
       https://stackoverflow.com/questions/53819528/how-does-tf-keras-layers-conv2d-with-padding-same-and-strides-1-behave
 
@@ -145,9 +165,31 @@ class Maxpool_layer(object):
       inpt    : input images in the format (batch, width, height, channels)
     '''
 
-    # return the nan-padded image, in the same format as inpt (batch, width + pad_w, height + pad_h, channels)
+    # return the padded image, in the same format as inpt (batch, width + pad_w, height + pad_h, channels)
     return np.pad(inpt, ((0, 0), (self.pad_top, self.pad_bottom), (self.pad_left, self.pad_right), (0, 0)),
-                  mode='constant', constant_values=(np.nan, np.nan))
+                  mode='constant', constant_values=(-np.inf, -np.inf))
+
+  @property
+  def _index_dtype(self):
+    '''
+    Smallest integer type able to store the position of the maximum inside a window
+    '''
+    kx, ky = self.size
+
+    for dtype in (np.int8, np.int16, np.int32):
+      if kx * ky <= np.iinfo(dtype).max:
+        return dtype
+
+    return np.int64
+
+  @property
+  def _non_overlapping(self):
+    '''
+    Check if the windows tile the input without overlapping (size == stride, without
+    dilation and padding): in this case the pooling is a reduction over a reshape of the input
+    '''
+    return (tuple(self.size) == tuple(self.stride) and tuple(self.dilation) == (1, 1) and
+            not any((self.pad_top, self.pad_bottom, self.pad_left, self.pad_right)))
 
   def forward(self, inpt):
 
@@ -163,71 +205,102 @@ class Maxpool_layer(object):
     '''
 
     self.batch, self.w, self.h, self.c = inpt.shape
-    kx , ky  = self.size
+    kx , ky  = self._kernel_extent
     st1, st2 = self.stride
 
     if self.pad:
       self._evaluate_padding()
-      mat_pad = self._pad(inpt)
+
+    if self._non_overlapping:
+
+      # The windows are the blocks of the cut input reshaped as (batch, out_w, kx, out_h, ky, c)
+      _, out_w, out_h, _ = self.out_shape
+      windows = inpt[:, : out_w * kx, : out_h * ky, :].reshape(self.batch, out_w, kx, out_h, ky, self.c)
+
+      self.output = windows.max(axis=(2, 4)) # final shape (batch, out_w, out_h, c)
+
+      if self.trainable:
+
+        # Position of the first maximum inside every window, as flat index x * ky + y
+        self.indexes = np.zeros(shape=self.output.shape, dtype=self._index_dtype)
+        found = np.zeros(shape=self.output.shape, dtype=bool)
+
+        for pos in range(kx * ky):
+          x, y = divmod(pos, ky)
+          is_max = windows[:, :, x, :, y, :] == self.output
+          is_max &= ~found
+          found |= is_max
+          self.indexes += is_max * self.indexes.dtype.type(pos)
+
     else:
-      # If no padding, cut the last raws/columns in every image in the batch
-      mat_pad = inpt[:, : (self.w - kx) // st1*st1 + kx, : (self.h - ky) // st2*st2 + ky, ...]
 
-    # Return a strided view of the input array, shape: (batch, 1+(w-kx)//st1,1+(h-ky)//st2 ,c, kx, ky)
-    view = self._asStride(mat_pad, self.size, self.stride)
+      if self.pad:
+        mat_pad = self._pad(inpt)
+      else:
+        # If no padding, cut the last raws/columns in every image in the batch
+        mat_pad = inpt[:, : (self.w - kx) // st1*st1 + kx, : (self.h - ky) // st2*st2 + ky, ...]
+
+      # Return a strided view of the input array, shape: (batch, 1+(w-kx)//st1,1+(h-ky)//st2 ,c, kx, ky)
+      view = self._asStride(mat_pad, self.size, self.stride, self.dilation)
+
+      # Flatten every window, shape: (batch, out_w, out_h, c, kx * ky)
+      view = view.reshape(view.shape[:4] + (-1, ))
+
+      if self.trainable:
+        # Position of the maximum inside every window, as flat index x * ky + y
+        self.indexes = view.argmax(axis=-1).astype(self._index_dtype)
 
-    self.output = np.nanmax(view, axis=(4, 5)) # final shape (batch, out_w, out_h, c)
+        self.output = np.take_along_axis(view, self.indexes[..., np.newaxis], axis=-1)[..., 0] # final shape (batch, out_w, out_h, c)
 
-    # New shape for view, to access the single sub matrix and retrieve couples of indexes
-    new_shape = (np.prod(view.shape[:-2]), view.shape[-2], view.shape[-1])
+      else:
+        self.output = view.max(axis=-1)
 
-    # Retrives a tuple of indexes (x,y) for every sub-matrix of the view array, that indicates
-    # where the maximum value is.
-    # In the loop I change the shape of view in order to have access to its last 2 dimension with r.
-    # r take the values of every sub matrix
-    self.indexes = [np.unravel_index(np.nanargmax(r), r.shape) for r in view.reshape(new_shape)]
-    self.indexes = np.asarray(self.indexes).T
-    self.delta = np.zeros(shape=self.out_shape, dtype=float)
+    if self.trainable:
+      self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype)
+
+    else:
+      # the positions of the maxima are needed only by backward
+      self.indexes, self.delta = (None, None)
 
 
   def backward(self, delta):
     '''
     Backward function of maxpool layer: it access avery position where in the input image
     there's a chosen maximum and add the correspondent self.delta value.
-    Since we work with a 'view' of delta, the same pixel may appear more than one time,
-    and an atomic acces to it's value is needed to correctly modifiy it.
+    The positions of the maxima are converted to flat indexes of the input image and
+    the same pixel may be the maximum of more than one window, so the values are
+    accumulated with a single scatter-add (bincount).
+    If the windows do not overlap, every position inside the window is added to
+    its strided view of delta.
 
     Parameters:
       delta : the global delta to be backpropagated with shape (batch, w, h, c)
     '''
 
-    # Padding delta in order to create another view
-    if self.pad:
-      mat_pad = self._pad(delta)
-    else:
-      mat_pad = delta
+    _, out_w, out_h, _ = self.output.shape
+    kx, ky = self.size
+    st1, st2 = self.stride
+    d1, d2 = self.dilation
 
-    # Create a view of net delta, following the padding true or false
-    net_delta_view = self._asStride(mat_pad, self.size, self.stride) #that is a view on mat_pad
+    if self._non_overlapping:
 
-    # Create every possibile combination of index for the first four dimensions of
-    # a six dimensional array
-    b, w, h, c = self.output.shape
-    combo = itertools.product(range(b), range(w), range(h), range(c))
-    combo = np.asarray(list(combo)).T
-    # here I left the transposition, because of self.indexes
+      for pos in range(kx * ky):
+        x, y = divmod(pos, ky)
+        delta[:, x : out_w * kx : kx, y : out_h * ky : ky, :] += self.delta * (self.indexes == pos)
 
-    # those indexes are usefull to acces 'Atomically'(one at a time) every element in net_delta_view
-    # that needs to be modified
-    for b, i, j, k, x, y in zip(combo[0], combo[1], combo[2], combo[3], self.indexes[0], self.indexes[1]):
-      net_delta_view[b, i, j, k, x, y] += self.delta[b, i, j, k]
+      return
 
-    # Here delta is correctly modified
-    if self.pad:
-      _ , w_pad, h_pad, _ = mat_pad.shape
-      delta[:] = mat_pad[:, self.pad_top : w_pad-self.pad_bottom, self.pad_left : h_pad - self.pad_right, :]
-    else:
-      delta[:] = mat_pad
+    # Coordinates (x, y) of the maxima in the input image, the padding is removed
+    x, y = np.divmod(self.indexes.astype(np.intp), ky)
+    x = x * d1 + (np.arange(out_w) * st1 - self.pad_top).reshape(1, -1, 1, 1)
+    y = y * d2 + (np.arange(out_h) * st2 - self.pad_left).reshape(1, 1, -1, 1)
+
+    # Flat indexes of the maxima in the input image, shape (batch, out_w, out_h, c)
+    b = np.arange(self.batch).reshape(-1, 1, 1, 1)
+    k = np.arange(self.c).reshape(1, 1, 1, -1)
+    indexes = ((b * self.w + x) * self.h + y) * self.c + k
+
+    delta += np.bincount(indexes.ravel(), weights=self.delta.ravel(), minlength=delta.size).reshape(delta.shape)
 
 if __name__ == '__main__':
 
@@ -6,13 +6,14 @@ from __future__ import print_function
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Route layer'
 
 
-class Route_layer():
+class Route_layer(BaseLayer):
 
   def __init__(self, input_layers, by_channels=True, **kwargs):
     '''
@@ -91,7 +92,7 @@ class Route_layer():
     '''
     
     self.output = np.concatenate([network[layer_idx].output for layer_idx in self.input_layers], axis=self.axis)
-    self.delta  = np.zeros(shape=self.out_shape, dtype=float)
+    self.delta  = np.zeros(shape=self.out_shape, dtype=self.output.dtype) if self.trainable else None
 
   def backward(self, delta, network):
     '''
@@ -112,7 +113,7 @@ class Route_layer():
 
     elif self.axis == 0:          # this works for concatenation by batch axis
       batch_sum = 0
-      for idx in self.self.input_layers:
+      for idx in self.input_layers:
         batches = network[idx].out_shape[0]
         network[idx].delta += self.delta[batch_sum : batch_sum + batches,:,:,:]
         batch_sum += batches
@@ -8,29 +8,34 @@ from NumPyNet.activations import Activations
 from NumPyNet.utils import _check_activation
 
 import numpy as np
-from itertools import product
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Shortcut Layer'
 
 
-class Shortcut_layer(object):
+class Shortcut_layer(BaseLayer):
 
-  def __init__(self, activation=Activations, alpha=1., beta=1., **kwargs):
+  def __init__(self, activation=Activations, alpha=1., beta=1., input_layers=None, **kwargs):
 
     '''
     Shortcut layer: activation of the linear combination of the output of two layers
 
                 layer1 * alpha + layer2 * beta = output
 
-    Now working only with same shapes input
+    The inputs can have different sizes, as in darknet: the output has the shape of the first
+    input and the second one is combined on its strided pixels, over the common channels
 
     Parameters :
       activation   : activation function of the layer
       alpha        : float, default = 1., first weight of the combination
       beta         : float, default = 1., second weight of the combination
+      input_layers : iterable of two int, default None. Indexes in the Network model of the two
+                     combined layers, negative indexes are relative to the shortcut layer
+                     (ex. (-1, -3) combines the previous layer and the third layer before, as
+                     the darknet from=-3). None for a layer used outside a Network model
 
     '''
 
@@ -40,11 +45,12 @@ class Shortcut_layer(object):
     self.gradient = activation.gradient
 
     self.alpha, self.beta = alpha, beta
+    self.input_layers = None if input_layers is None else tuple(input_layers)
 
     self.output, self.delta = (None, None)
     self._out_shape = None
-    self.ix, self.jx, self.kx = (None, None, None)
-    self.iy, self.jy, self.ky = (None, None, None)
+    # strided pixels of the output and of the second input combined by inputs of different sizes
+    self._out_index, self._add_index = (None, None)
 
   def __str__(self):
     (b1, w1, h1, c1), (b2, w2, h2, c2) = self._out_shape
@@ -56,8 +62,8 @@ class Shortcut_layer(object):
 
     if prev1.out_shape is None or prev2.out_shape is None:
       class_name = self.__class__.__name__
-      prev_name  = layer.__class__.__name__
-      raise LayerError('Incorrect shapes found. Layer {} cannot be connected to the previous {} layer.'.format(class_name, prev_name))
+      prev_names = (prev1.__class__.__name__, prev2.__class__.__name__)
+      raise LayerError('Incorrect shapes found. Layer {} cannot be connected to the previous {} and {} layers.'.format(class_name, *prev_names))
 
     self._out_shape = [prev1.out_shape, prev2.out_shape]
 
@@ -67,27 +73,31 @@ class Shortcut_layer(object):
 
   @property
   def out_shape(self):
-    return max(self._out_shape)
+    return self._out_shape[0]
 
   def _stride_index (self, shape1, shape2):
     '''
-    Evaluate the strided indexes if the input shapes are different
+    Evaluate the strided indexes if the input shapes are different, as in darknet: the second
+    input is read every stride pixels and added to the output every sample pixels, over the
+    common channels
+
+    Parameters:
+      shape1 : tuple, shape of the first input (and of the output)
+      shape2 : tuple, shape of the second input
     '''
     _, w2, h2, c2 = shape1
     _, w1, h1, c1 = shape2
-    stride = w1 // w2
-    sample = w2 // w1
+    stride = max(w1 // w2, 1)
+    sample = max(w2 // w1, 1)
 
-    if not ( stride == h1 // h2 and sample == h2 // h1 ):
+    if stride != max(h1 // h2, 1) or sample != max(h2 // h1, 1):
       class_name = self.__class__.__name__
-      prev_name  = layer.__class__.__name__
-      raise LayerError('Incorrect shapes found. Layer {} cannot be connected to the previous {} layer.'.format(class_name, prev_name))
+      raise LayerError('Incorrect shapes found. Layer {} cannot combine inputs with different width and height ratios. Given {} and {}'.format(class_name, shape1, shape2))
 
-    idx = product(range(0, w2, sample), range(0, h2, sample), range(0, c2, sample))
-    self.ix, self.jx, self.kx = zip(*idx)
+    w, h, c = (min(w1, w2), min(h1, h2), min(c1, c2))
 
-    idx = product(range(0, w1, stride), range(0, w1, stride), range(0, c1, stride))
-    self.iy, self.jy, self.ky = zip(*idx)
+    self._out_index = (slice(None), slice(0, w * sample, sample), slice(0, h * sample, sample), slice(0, c))
+    self._add_index = (slice(None), slice(0, w * stride, stride), slice(0, h * stride, stride), slice(0, c))
 
 
   def forward(self, inpt, prev_output):
@@ -121,15 +131,14 @@ class Shortcut_layer(object):
       #           [2, 1, 2, 1],
       #           [1, 1, 1, 1]]
 
-      if (self.ix, self.iy, self.kx) is (None, None, None):
-        self._stride_index(inpt.shape, prev_output.shape)
+      self._stride_index(inpt.shape, prev_output.shape)
 
-      self.output = inpt.copy()
-      self.output[:, ix, jx, kx] = self.alpha * self.outpu[:, ix, jx, kx] + self.beta * prev_output[:, iy, jy, ky]
+      self.output = inpt * self.alpha
+      self.output[self._out_index] += self.beta * prev_output[self._add_index]
 
 
     self.output = self.activation(self.output)
-    self.delta = np.zeros(shape=self.out_shape, dtype=float)
+    self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype) if self.trainable else None
 
   def backward(self, delta, prev_delta):
     '''
@@ -146,11 +155,11 @@ class Shortcut_layer(object):
 
     delta[:]   += self.delta * self.alpha
 
-    if (self.ix, self.iy, self.kx) is (None, None, None): # same shapes
+    if prev_delta.shape == self.delta.shape: # same shapes
       prev_delta[:] += self.delta[:] * self.beta
 
-    else: # different shapes
-      prev_delta[:, self.ix, self.jx, self.kx] += self.beta * self.delta[:, self.iy, self.jy, self.ky]
+    else: # different shapes, the strided pixels of the second input are the ones combined in forward
+      prev_delta[self._add_index] += self.beta * self.delta[self._out_index]
 
 
 
@@ -7,13 +7,14 @@ from __future__ import print_function
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'PixelShuffle Layer'
 
 
-class Shuffler_layer(object):
+class Shuffler_layer(BaseLayer):
 
   def __init__(self, scale, **kwargs):
     '''
@@ -112,7 +113,7 @@ class Shuffler_layer(object):
                                   for i in range(channel_output)], axis=3)
 
     # output shape = (batch, in_w * scale, in_h * scale, in_c // scale**2)
-    self.delta = np.zeros(shape=self.out_shape, dtype=float)
+    self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype) if self.trainable else None
 
   def backward(self, delta):
     '''
@@ -6,13 +6,14 @@ from __future__ import print_function
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Softmax layer'
 
 
-class Softmax_layer():
+class Softmax_layer(BaseLayer):
 
   def __init__(self, groups=1, spatial=False, temperature=1., **kwargs):
     '''
@@ -74,7 +75,7 @@ class Softmax_layer():
       self.output *= s
 
     else : # first implementation with groups, inspired from darknet, mhe
-      self.output = np.empty(inpt.shape)
+      self.output = np.empty(inpt.shape, dtype=inpt.dtype)
       inputs = self.w * self.h * self.c
       group_offset = inputs // self.groups
       flat_input = inpt.ravel()
@@ -94,7 +95,7 @@ class Softmax_layer():
       # s = self.output.sum(axis=(1,2,3), keepdims=True)
 
     # value of delta if truth is None
-    self.delta = np.zeros(shape=self.out_shape, dtype=float)
+    self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype) if self.trainable else None
 
     if truth is not None:
       out = self.output * (1. / self.output.sum())
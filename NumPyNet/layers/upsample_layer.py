@@ -8,13 +8,14 @@ from __future__ import print_function
 import numpy as np
 from numpy.lib.stride_tricks import as_strided
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Upsample Layer'
 
 
-class Upsample_layer(object):
+class Upsample_layer(BaseLayer):
 
   def __init__(self, stride=(2, 2), scale=1., **kwargs):
     '''
@@ -107,7 +108,7 @@ class Upsample_layer(object):
     else:            # Upsample
       self.output = self._upsample(inpt) * self.scale
 
-    self.delta = np.zeros(shape=inpt.shape, dtype=float)
+    self.delta = np.zeros(shape=inpt.shape, dtype=self.output.dtype) if self.trainable else None
 
   def backward(self, delta):
     '''
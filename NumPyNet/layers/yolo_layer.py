@@ -9,6 +9,7 @@ import itertools
 
 import numpy as np
 from NumPyNet.exception import LayerError
+from NumPyNet.layers.base import BaseLayer
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
@@ -16,7 +17,7 @@ __package__ = 'Yolo Layer'
 
 # Reference: https://github.com/experiencor/keras-yolo3/blob/master/yolo.py
 
-class Yolo_layer(object):
+class Yolo_layer(BaseLayer):
 
   def __init__(self, input_shape, anchors, max_grid,
                      #warmup_batches,
@@ -86,7 +87,7 @@ class Yolo_layer(object):
       if index >= wh2 and index < whcoords: continue
       else:                                 1. / (1. + np.exp(-self.ouput[i]))
 
-    self.delta = np.zeros(shape=self.out_shape, dtype=float)
+    self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype)
 
     if not self.trainable:
       return
@@ -215,7 +216,7 @@ class Yolo_layer(object):
     print('Yolo {:d} Avg IOU: {:.3f}, Class: {:.3f}, Obj: {:.3f}, No Obj: {:.3f}, .5R: {:.3f}, .75R: {:.3f}, count: {:d}'.format(
           index, avg_iou, avg_cat, avg_obj, avg_noobj, recall50, recall75, count))
 
-    self.delta = np.zeros(shape=self.out_shape, dtype=float)
+    self.delta = np.zeros(shape=self.out_shape, dtype=self.output.dtype)
 
   def backward(self, delta):
     '''
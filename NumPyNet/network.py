@@ -7,9 +7,14 @@ from __future__ import print_function
 
 import os
 import re
+import copy
 import pickle
 import numpy as np
 from time import time as now
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
 
 from NumPyNet.layers.activation_layer import Activation_layer
 from NumPyNet.layers.avgpool_layer import Avgpool_layer
@@ -18,6 +23,8 @@ from NumPyNet.layers.connected_layer import Connected_layer
 from NumPyNet.layers.convolutional_layer import Convolutional_layer
 from NumPyNet.layers.cost_layer import Cost_layer
 from NumPyNet.layers.dropout_layer import Dropout_layer
+from NumPyNet.layers.globalavgpool_layer import GlobalAvgpool_layer
+from NumPyNet.layers.globalmaxpool_layer import GlobalMaxpool_layer
 from NumPyNet.layers.input_layer import Input_layer
 from NumPyNet.layers.l1norm_layer import L1Norm_layer
 from NumPyNet.layers.l2norm_layer import L2Norm_layer
@@ -30,6 +37,7 @@ from NumPyNet.layers.softmax_layer import Softmax_layer
 from NumPyNet.layers.upsample_layer import Upsample_layer
 from NumPyNet.layers.yolo_layer import Yolo_layer
 
+from NumPyNet.activations import Linear
 from NumPyNet.optimizer import Optimizer
 
 from NumPyNet.parser import net_config
@@ -42,6 +50,32 @@ __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Network model'
 
 
+# Step of the execution plan: bound methods of a layer with the call signatures already resolved and
+# the edges of the graph, i.e. the layers whose outputs and deltas are the inputs and delta buffers of
+# the step (shared marks the inputs read by more than one layer, whose deltas are accumulated).
+# sources and readers are the indexes of the input layers and of the layers which read the output.
+# With the checkpoints (ref. checkpoint) only the kept layers store their activations in training,
+# the others are recomputed before the backward of the kept layer which follows them (recompute)
+_Step = namedtuple('_Step', ['index', 'layer', 'inputs', 'shared', 'sources', 'readers',
+                             'forward', 'backward', 'update',
+                             'with_truth', 'forward_network', 'backward_inpt', 'backward_network', 'cast',
+                             'release', 'kept', 'recompute'])
+
+# updates computed by the backward of the layers with parameters and the parameters they update
+GRADIENTS = (('weights_update', 'weights'),
+             ('bias_update', 'bias'),
+             ('bias_updates', 'bias'),
+             ('scales_updates', 'scales'),
+            )
+
+# outputs, deltas and intermediate results stored by the layers in forward and backward: the replicas
+# of the model (ref. Network._replica) store their own, some of them are filled in place (ex. the im2col
+# buffer of Convolutional_layer) and can not be shared by concurrent threads
+SCRATCH = ('output', 'delta', 'view', 'indexes', 'rnd',
+           '_col', '_tiled_input', '_fft_input', '_pointwise_input',
+          )
+
+
 class Network(object):
 
   LAYERS = {'activation'    :  Activation_layer,
@@ -51,6 +85,8 @@ class Network(object):
             'convolutional' :  Convolutional_layer,
             'cost'          :  Cost_layer,
             'dropout'       :  Dropout_layer,
+            'globalavgpool' :  GlobalAvgpool_layer,
+            'globalmaxpool' :  GlobalMaxpool_layer,
             'input'         :  Input_layer,
             'l1norm'        :  L1Norm_layer,
             'l2norm'        :  L2Norm_layer,
@@ -64,11 +100,46 @@ class Network(object):
             'yolo'          :  Yolo_layer,
             }
 
-  def __init__(self, batch, input_shape=None, train=None):
+  def __init__(self, batch, input_shape=None, train=None, workspace_bytes=None, dtype=np.float64, storage_dtype=None, workers=None):
     '''
+    Network model
+
+    Parameters:
+      batch           : int, batch size
+      input_shape     : tuple, shape of the input (width, height, channels)
+      train           : bool, default None. Training flag: False builds the model in inference
+                        mode (ref. eval), None or True in training mode (ref. train)
+      workspace_bytes : int, default None. Memory budget of the temporary arrays of every layer
+                        which supports the tiled execution (ex. Convolutional_layer). Layers
+                        with their own workspace_bytes keep it. None disables the tiling
+      dtype           : floating point dtype, default float64. Precision of the parameters, of the
+                        deltas and of the computation of every layer. Inputs, truth and loaded
+                        weights are converted to it. float32 halves the memory and speeds up the
+                        BLAS calls at the cost of precision
+      storage_dtype   : floating point dtype, default None. Lower precision (ex. float16) used to
+                        store the outputs of the layers between forward and backward. The layers
+                        with weights read the stored outputs and accumulate their products in dtype,
+                        the other layers read them converted to dtype. None stores them in dtype
+      workers         : int, default None. Number of threads which compute concurrently the layers of
+                        independent branches of the graph (ex. the heads after a Route_layer) in forward
+                        and backward. None or 1 computes the layers one at a time in the model order
     '''
     self.batch = batch
-    self.train = train
+    self.trainable = train is None or bool(train)
+    self.workspace_bytes = workspace_bytes
+    self.workers = workers
+
+    if workers is not None and (int(workers) != workers or workers < 1):
+      raise ValueError('Network model : incorrect number of workers. Expected a positive integer. Given {}'.format(workers))
+
+    self.dtype = np.dtype(dtype)
+    self.storage_dtype = None if storage_dtype is None else np.dtype(storage_dtype)
+
+    if self.dtype.kind != 'f':
+      raise ValueError('Network model : incorrect dtype. Expected a floating point dtype. Given {}'.format(self.dtype))
+
+    if self.storage_dtype is not None and (self.storage_dtype.kind != 'f' or self.storage_dtype.itemsize > self.dtype.itemsize):
+      raise ValueError('Network model : incorrect storage_dtype. Expected a floating point dtype not larger than {}. Given {}'.format(self.dtype, self.storage_dtype))
 
     if input_shape is not None:
 
@@ -85,6 +156,15 @@ class Network(object):
       self._net = []
 
     self._fitted = False
+    # BatchNorm layers removed by fuse with the original parameters of the previous layer
+    # and original input indexes of the layers with more inputs
+    self._fused, self._rewired = ([], [])
+    # execution plan of forward and backward and estimated peak memory of the outputs (ref. compile)
+    self._plan, self._peak_bytes = (None, None)
+    # start and stop of every layer in the last forward and backward (ref. concurrency)
+    self.layer_times = {'forward' : None, 'backward' : None}
+    # indexes of the layers whose activations are kept in training (ref. checkpoint)
+    self.checkpoints = None
 
 
   def add(self, layer):
@@ -104,18 +184,41 @@ class Network(object):
     if type_layer == 'input':
       self._net.append(layer)
 
-    elif type_layer == 'route':
-      prev_layers = []
-      for idx in layer.input_layers:
-        prev_layers.append(self._net[idx]) # i need layers' info to init route
+    elif getattr(layer, 'input_layers', None) is not None:
+      # layers with more inputs (ex. Route_layer, Shortcut_layer) are initialized on the selected layers,
+      # whose indexes are stored as absolute positions in the model
+      layer.input_layers = tuple(j if j >= 0 else self.num_layers + j for j in layer.input_layers)
 
-      self._net.append(layer(prev_layers))
+      if not all(0 <= j < self.num_layers for j in layer.input_layers):
+        raise LayerError('Incorrect input layers found. Given {} for a model of {:d} layers'.format(layer.input_layers, self.num_layers))
+
+      self._net.append(layer([self._net[j] for j in layer.input_layers]))
 
     else:
       self._net.append(layer(self._net[-1]))
 
+    self._set_policy(self._net[-1])
+    self._plan = None
+
     return self
 
+  def _set_policy(self, layer):
+    '''
+    Apply the network policies to the layer: the memory budget is shared with the layers which
+    support the tiled execution, the layer follows the training or inference mode of the model
+    and the parameters are converted to the network dtype
+    '''
+    if getattr(layer, 'workspace_bytes', False) is None:
+      layer.workspace_bytes = self.workspace_bytes
+
+    layer.trainable = self.trainable
+
+    for param in ('weights', 'bias', 'scales'):
+      value = getattr(layer, param, None)
+
+      if isinstance(value, np.ndarray) and value.dtype != self.dtype:
+        setattr(layer, param, value.astype(self.dtype))
+
   def __iter__(self):
     self.layer_index = 0
     return self
@@ -140,6 +243,11 @@ class Network(object):
     for i, layer in enumerate(self._net):
       print('{:>4d} {}'.format(i, self._net[i]), flush=True, end='\n')
 
+    if self._plan is None:
+      self._build_plan()
+
+    print('Estimated peak memory of the outputs in inference: {:d} bytes (widest live set)'.format(self._peak_bytes), flush=True, end='\n')
+
 
   def load(self, cfg_filename, weights=None):
     '''
@@ -156,6 +264,8 @@ class Network(object):
 
     input_shape = (self.batch, self.w, self.h, self.c)
     self._net = [ Input_layer(input_shape=input_shape) ]
+    self._fused, self._rewired = ([], [])
+    self._plan, self.checkpoints = (None, None)
 
     print('layer     filters    size              input                output')
 
@@ -163,6 +273,10 @@ class Network(object):
       layer_t = re.split(r'\d+', layer)[0]
       params = dict(model.get_params(layer))
 
+      # darknet avgpool without size pools the whole image
+      if layer_t == 'avgpool' and 'size' not in params:
+        layer_t = 'globalavgpool'
+
       layer_params = {}
       for k, v in params.items():
         try:
@@ -174,16 +288,20 @@ class Network(object):
 
         layer_params[k] = val
 
-      if layer_t == 'shortcut':
-        _from = model.get(layer, 'from', 0)
-        self._net.append( self.LAYERS[layer_t](input_shape=input_shape, **layer_params)([self._net[-1], self._net[_from]]) )
+      if layer_t in ('shortcut', 'route'):
+        # darknet indexes are relative to the layer if negative, otherwise absolute without the input layer
+        sources = layer_params.pop('from' if layer_t == 'shortcut' else 'layers')
+        sources = [j if j < 0 else j + 1 for j in np.ravel(sources).tolist()]
 
-      elif layer_t == 'route':
-        _layers = model.get(layer, 'layers', [])
-        self._net.append( self.LAYERS[layer_t](input_shape=input_shape, **layer_params)(self._net[_layers]) )
+        if layer_t == 'shortcut':
+          sources = [-1] + sources
+
+        self.add( self.LAYERS[layer_t](input_layers=sources, **layer_params) )
 
       else:
-        self._net.append( self.LAYERS[layer_t](input_shape=input_shape, **layer_params)(self._net[-1]) )
+        # layers are initialized on the output shape of the previous one (ex. grouped convolutions)
+        self._net.append( self.LAYERS[layer_t](input_shape=self._net[-1].out_shape, **layer_params)(self._net[-1]) )
+        self._set_policy(self._net[-1])
 
       print('{:>4d} {}'.format(i, self._net[-1]), flush=True, end='\n')
 
@@ -203,8 +321,11 @@ class Network(object):
     '''
     with open(weights_filename, 'rb') as fp:
 
-      major, minor, revision = np.fromfile(fp, dtype=np.int, count=3)
-      full_weights = np.fromfile(fp, dtype=np.float, count=-1)
+      major, minor, revision = np.fromfile(fp, dtype=np.int64, count=3)
+      full_weights = np.fromfile(fp, dtype=np.float64, count=-1)
+
+    # the weights are stored in double precision and loaded in the network dtype
+    full_weights = full_weights.astype(self.dtype)
 
     pos = 0
     for layer in self:
@@ -225,8 +346,8 @@ class Network(object):
       if hasattr(layer, 'save_weights'):
         full_weights += layer.save_weights()
 
-    full_weights = np.asarray(full_weights, dtype=np.float)
-    version = np.array([1, 0, 0], dtype=np.int)
+    full_weights = np.asarray(full_weights, dtype=np.float64)
+    version = np.array([1, 0, 0], dtype=np.int64)
 
     with open(filename, 'wb') as fp:
       version.tofile(fp, sep='')
@@ -258,8 +379,106 @@ class Network(object):
 
     return self
 
+  def fuse(self, epsil=1e-8):
+    '''
+    Fold the BatchNorm layers into the weights and bias of the previous Convolutional or
+    Connected layer and remove them from the model. The fused model computes the inference
+    of the BatchNorm layers with their running statistics without a further pass over the
+    outputs. The folding is exact only if the previous layer has a Linear activation and,
+    for the Convolutional layer, if the BatchNorm parameters and statistics are the same
+    for every pixel of each channel, and if the output of the previous layer is read only by
+    the BatchNorm layer: the other BatchNorm layers are kept. The indexes of the layers read by
+    Route and Shortcut layers are updated to the fused model.
+    The model is un-fused by fit (ref. unfuse).
+
+    Parameters:
+      epsil : float, used to avoid division by zero when computing 1. / sqrt(var)
+    '''
+
+    # the positions of the removed layers refer to the original model
+    if self._fused:
+      self.unfuse()
+
+    readers = np.bincount([j for i in range(1, self.num_layers) for j in self._sources(i)], minlength=self.num_layers)
+
+    net = [self._net[0]]
+    # position in the fused model of the output of every layer
+    index = [0] * self.num_layers
+
+    for i, layer in enumerate(self._net[1:], start=1):
+
+      prev = net[-1]
+      index[i] = len(net) - 1
+
+      if isinstance(layer, BatchNorm_layer) and layer.rolling_mean is not None and readers[i - 1] == 1 and \
+         isinstance(prev, (Convolutional_layer, Connected_layer)) and prev.activation is Linear.activate:
+
+        scale, shift = layer.folding_params(epsil=epsil)
+
+        # the same transformation must be applied to every pixel of each channel
+        if np.allclose(scale, scale[:1, :1]) and np.allclose(shift, shift[:1, :1]):
+
+          self._fused.append((i, layer, prev, prev.weights, prev.bias))
+
+          prev.weights = (prev.weights * scale[0, 0]).astype(prev.weights.dtype)
+          prev.bias = (prev.bias * scale[0, 0] + shift[0, 0]).astype(prev.bias.dtype)
+          self._reset_cache(prev)
+
+          continue
+
+      net.append(layer)
+      index[i] = len(net) - 1
+
+    # the removed layers are replaced by the previous one, which computes their output
+    for layer in net:
+
+      inputs = getattr(layer, 'input_layers', None)
+
+      if inputs is not None and self._fused:
+        self._rewired.append((layer, inputs))
+        layer.input_layers = tuple(index[j] for j in inputs)
+
+    self._net = net
+    self._build_plan()
+
+    return self
+
+  def unfuse(self):
+    '''
+    Restore the BatchNorm layers removed by fuse and the original weights and bias
+    of the previous layers
+    '''
+
+    # the parameters are restored in the reverse order of the folding
+    for i, layer, prev, weights, bias in reversed(self._fused):
+      prev.weights, prev.bias = (weights, bias)
+      self._reset_cache(prev)
+
+    # the layers are inserted in the order of their original position
+    for i, layer, _, _, _ in self._fused:
+      layer.trainable = self.trainable
+      self._net.insert(i, layer)
+
+    for layer, inputs in self._rewired:
+      layer.input_layers = inputs
+
+    self._fused, self._rewired = ([], [])
+    self._build_plan()
+
+    return self
+
+  @staticmethod
+  def _reset_cache(layer):
+    '''
+    Remove the transformed weights cached by the layer (ex. Winograd and fft in Convolutional_layer)
+    '''
+    for cache in ('_winograd_weights', '_fft_weights'):
+      if hasattr(layer, cache):
+        setattr(layer, cache, None)
+
   def compile(self, optimizer=Optimizer):
     '''
+    Set the optimizer of the layers with parameters and build the execution plan of the model
     '''
 
     for layer in self:
@@ -267,13 +486,277 @@ class Network(object):
       if hasattr(layer, 'optimizer'):
         layer.optimizer = optimizer()
 
-  def fit(self, X, y, max_iter=100, shuffle=True):
+    self._build_plan()
+
+    return self
+
+  def _build_plan(self):
+    '''
+    Resolve once the call signatures of forward and backward of every layer, so that
+    _forward and _backward iterate over the steps without introspection.
+    The plan is rebuilt when the layers of the model change (ex. add, load, fuse)
+    '''
+
+    sources = [self._sources(i) for i in range(self.num_layers)]
+
+    for i, inputs in enumerate(sources[1:], start=1):
+      if not all(0 <= j < i for j in inputs):
+        raise NetworkError('Network model : layer {:d} reads the layers {} which are not computed before it'.format(i, inputs))
+
+    # layers which read every output, the deltas of the outputs read more than once are accumulated
+    readers = [[] for _ in self._net]
+
+    for i, inputs in enumerate(sources[1:], start=1):
+      for j in inputs:
+        readers[j].append(i)
+
+    last_use = self._liveness()
+    release = [[] for _ in self._net]
+
+    # the output of the last layer is returned, the input is owned by the caller
+    for j, i in enumerate(last_use[1:-1], start=1):
+      release[i].append(j)
+
+    self._peak_bytes = self._peak_memory(last_use)
+
+    kept = self._kept(readers)
+
+    plan = []
+
+    # the layers are added after their inputs, so the order of the model is a topological order of the graph
+    for i, layer in enumerate(self._net[1:], start=1):
+
+      forward_code = layer.forward.__code__
+      backward_code = layer.backward.__code__
+      forward_args = forward_code.co_varnames[:forward_code.co_argcount]
+      backward_args = backward_code.co_varnames[:backward_code.co_argcount]
+
+      plan.append(_Step(index=i,
+                        layer=layer,
+                        inputs=tuple(self._net[j] for j in sources[i]),
+                        shared=tuple(len(readers[j]) > 1 for j in sources[i]),
+                        sources=sources[i],
+                        readers=tuple(readers[i]),
+                        forward=layer.forward,
+                        backward=layer.backward,
+                        update=getattr(layer, 'update', None),
+                        with_truth='truth' in forward_args,
+                        forward_network='network' in forward_args,
+                        backward_inpt='inpt' in backward_args,
+                        backward_network='network' in backward_args,
+                        # the layers with weights read the stored outputs in their precision
+                        cast=not hasattr(layer, 'weights'),
+                        release=tuple(release[i]),
+                        kept=kept[i],
+                        recompute=()))
+
+    # the layers between two kept layers are recomputed before the backward of the second one
+    for i, step in enumerate(plan, start=1):
+      if not step.kept:
+        end = next(j for j in range(i + 1, self.num_layers) if kept[j])
+        plan[end - 1] = plan[end - 1]._replace(recompute=plan[end - 1].recompute + (step, ))
+
+    self._plan = tuple(plan)
+
+    return self._plan
+
+  def _sources(self, i):
+    '''
+    Indexes of the layers whose outputs are read by the forward of the i-th layer, i.e. the edges
+    of the graph: the selected layers for the layers with input_layers (ex. Route_layer and
+    Shortcut_layer), the previous one otherwise
+    '''
+    if i == 0:
+      return ()
+
+    inputs = getattr(self._net[i], 'input_layers', None)
+
+    if inputs is None:
+      return (i - 1, )
+
+    # negative indexes are relative to the layer, as when the layer is added to the model
+    return tuple(j if j >= 0 else i + j for j in inputs)
+
+  def _liveness(self):
+    '''
+    Index of the last layer which reads the output of every layer in the forward.
+    The outputs which are never read die with the layer itself
+    '''
+    last_use = list(range(self.num_layers))
+
+    for i in range(1, self.num_layers):
+      for j in self._sources(i):
+        last_use[j] = max(last_use[j], i)
+
+    return last_use
+
+  def _kept(self, readers):
+    '''
+    Flag of the layers whose activations are kept in training with the checkpoints: the input, the last
+    layer, the checkpoints and the layers which can not be recomputed, i.e. the layers whose forward is
+    not a function of the inputs only (ex. the random mask of Dropout_layer, the running statistics of
+    BatchNorm_layer, the truth of Cost_layer) and the layers without readers. The other layers are
+    recomputed, so their outputs must be read only by layers up to the next kept layer: the layers read
+    after it are kept as well.
+
+    Parameters:
+      readers : list of lists, indexes of the layers which read every output (ref. _build_plan)
+    '''
+    if self.checkpoints is None:
+      return [True] * self.num_layers
+
+    kept = [True] * self.num_layers
+
+    for i, layer in enumerate(self._net[1:-1], start=1):
+      code = layer.forward.__code__
+      stateful = isinstance(layer, (BatchNorm_layer, Dropout_layer)) or 'truth' in code.co_varnames[:code.co_argcount]
+      kept[i] = i in self.checkpoints or stateful or not readers[i]
+
+    while True:
+      # next kept layer after every layer
+      following, end = ([0] * self.num_layers, self.num_layers - 1)
+
+      for i in reversed(range(self.num_layers)):
+        following[i] = end
+        end = i if kept[i] else end
+
+      late = [i for i in range(self.num_layers) if not kept[i] and max(readers[i]) > following[i]]
+
+      if not late:
+        return kept
+
+      for i in late:
+        kept[i] = True
+
+  def _peak_memory(self, last_use):
+    '''
+    Estimate of the peak memory of the outputs in inference mode, where every output is released
+    after the last layer which reads it (ref. _forward): the widest set of outputs alive at the same
+    time, in bytes. The input of the model and the temporary arrays of the layers are not included.
+    The layers allocate their own outputs: the model does not preallocate nor reuse their buffers.
+
+    Parameters:
+      last_use : list of int, index of the last layer which reads every output (ref. _liveness)
+    '''
+    itemsize = (self.storage_dtype or self.dtype).itemsize
+
+    sizes = [0] * self.num_layers
+    live, peak = (0, 0)
+
+    for i in range(1, self.num_layers):
+
+      try:
+        sizes[i] = int(np.prod(self._net[i].out_shape)) * itemsize
+      except TypeError: # layers without a defined output shape
+        pass
+
+      live += sizes[i]
+      peak = max(peak, live)
+
+      # the outputs read for the last time by this layer are dead
+      for j in range(1, i + 1):
+        if last_use[j] == i and j != self.num_layers - 1:
+          live -= sizes[j]
+
+    return peak
+
+  def checkpoint(self, layers=None):
     '''
+    Enable the gradient checkpointing: in training only the checkpoints (and the layers which can not
+    be recomputed, ref. _kept) store their activations, while the outputs and the intermediate results
+    of the layers between them are dropped in forward and recomputed, one segment at a time, by the
+    backward. The peak memory of the training is reduced at the cost of a further forward of the
+    recomputed layers. The checkpointing is disabled by uncheckpoint.
+
+    Parameters:
+      layers : list of int, default None. Indexes of the checkpoints. None selects a layer every
+               sqrt(N), with N the number of layers of the model
     '''
+    if layers is None:
+      every = int(np.ceil(np.sqrt(self.num_layers)))
+      layers = range(every, self.num_layers, every)
+
+    layers = tuple(sorted(j if j >= 0 else self.num_layers + j for j in layers))
+
+    if not all(0 <= j < self.num_layers for j in layers):
+      raise ValueError('Network model : incorrect checkpoints. Given {} for a model of {:d} layers'.format(layers, self.num_layers))
+
+    self.checkpoints = layers
+    self._plan = None
+
+    return self
+
+  def uncheckpoint(self):
+    '''
+    Disable the gradient checkpointing: every layer stores its activations in training
+    '''
+    self.checkpoints = None
+    self._plan = None
+
+    return self
+
+  def train(self):
+    '''
+    Set the model in training mode: every layer stores the deltas and the intermediate
+    results needed by the backward, Dropout drops its inputs and BatchNorm normalizes
+    with the statistics of the batch, updating the running ones
+    '''
+    self.trainable = True
+
+    for layer in self._net:
+      layer.trainable = True
+
+    return self
+
+  def eval(self):
+    '''
+    Set the model in inference mode: the trainable flag of every layer (ref. BaseLayer) is
+    cleared, so the layers store only their output and neither the deltas nor the intermediate
+    results of the backward (ex. the input views of Convolutional_layer, the indexes of
+    Maxpool_layer) are allocated. Dropout is the identity and BatchNorm normalizes with the
+    running statistics.
+    The backward is not available until the model is set back in training mode (ref. train)
+    '''
+    self.trainable = False
+
+    for layer in self._net:
+      layer.trainable = False
+
+    return self
+
+  def fit(self, X, y, max_iter=100, shuffle=True, accumulate_steps=1):
+    '''
+    Train the model on the data in batches of the model batch size
+
+    Parameters:
+      X                : array-like, input data
+      y                : array-like, truth data
+      max_iter         : int, default 100. Number of epochs
+      shuffle          : bool, default True. Shuffle the order of the batches at every epoch
+      accumulate_steps : int, default 1. Number of batches (micro-batches) whose updates are
+                         accumulated before updating the parameters: the optimizer sees the
+                         updates of accumulate_steps * batch samples, while the memory of the
+                         layers is the one of a single batch
+    '''
+
+    if int(accumulate_steps) != accumulate_steps or accumulate_steps < 1:
+      raise ValueError('Network model : incorrect accumulate_steps. Expected a positive integer. Given {}'.format(accumulate_steps))
+
+    # the fused parameters are not trainable
+    if self._fused:
+      self.unfuse()
+
+    self.train()
 
     num_data = len(X)
 
     batches = np.array_split(range(num_data), indices_or_sections=num_data // self.batch)
+    # every batch is a contiguous range of the data, so it is a view of X and y and not a copy
+    batches = [slice(idx[0], idx[-1] + 1) for idx in batches]
+
+    # sums of the updates of the micro-batches, allocated once for the whole training
+    accumulators = [(layer, name, np.zeros(shape=np.shape(getattr(layer, param)), dtype=self.dtype))
+                    for layer, name, param in self._gradients()] if accumulate_steps > 1 else []
 
     for _ in range(max_iter):
 
@@ -288,16 +771,41 @@ class Network(object):
 
       for i, idx in enumerate(batches):
 
-        input = X[idx, ...]
-        truth = y[idx, ...]
+        input = X[idx]
+        truth = y[idx]
 
         out = self._forward(X=input, truth=truth)
-        self._backward(X=input)
 
-        loss += self._get_loss() / len(idx)
+        if not accumulators:
+          self._backward(X=input)
+
+        else:
+          self._backward(X=input, update=False)
+
+          first = i - i % accumulate_steps
+          group = batches[first : first + accumulate_steps]
+          # the updates are averaged over the micro-batch, their mean over the group is a weighted sum
+          weight = len(input) / sum(idx.stop - idx.start for idx in group)
+
+          for layer, name, accumulator in accumulators:
+            update = getattr(layer, name)
+            update *= weight
+            accumulator += update
+
+          if i == first + len(group) - 1:
+
+            for layer, name, accumulator in accumulators:
+              setattr(layer, name, accumulator)
+
+            self._update()
+
+            for layer, name, accumulator in accumulators:
+              accumulator.fill(0.)
+
+        loss += self._get_loss() / len(input)
 
         done = int(50 * (i + 1) / len(batches))
-        print('\r{:>3d}/{:<3d} |{}{}| ({:1.1f} sec/iter) loss: {:3.3f}'.format( len(idx) * (i + 1),
+        print('\r{:>3d}/{:<3d} |{}{}| ({:1.1f} sec/iter) loss: {:3.3f}'.format( len(input) * (i + 1),
                                                                                 num_data,
                                                                                r'█' * done,
                                                                                 '-' * (50 - done),
@@ -316,6 +824,8 @@ class Network(object):
     Fit function using a train generator (ref. DataGenerator in data.py)
     '''
 
+    # the batches are generated in the network dtype
+    Xy_generator.dtype = self.dtype
     Xy_generator.start()
 
     for i in range(max_iter):
@@ -334,14 +844,58 @@ class Network(object):
     self._fitted = True
 
 
-  def predict(self, X, truth=None):
+  def predict(self, X, truth=None, batch_size=None, workers=None):
     '''
-    Predict the given input
+    Predict the given input. Use eval to predict without the training bookkeeping.
+    With batch_size the input is streamed in chunks and the outputs are written, in the order
+    of the input, in a preallocated array. With more workers the chunks are computed concurrently
+    by replicas of the model which share its parameters (ref. _replica): the layers of the model
+    are not modified.
+
+    Parameters:
+      X          : array-like, input data
+      truth      : array-like, default None. Truth data, read by the cost layers
+      batch_size : int, default None. Number of samples of every chunk. None computes the
+                   whole input at once
+      workers    : int, default None. Number of threads which compute the chunks. None or 1
+                   computes them in the calling thread
     '''
     if not self._fitted:
       raise NetworkError('This Network model instance is not fitted yet. Please use the "fit" function before the predict')
 
-    output = self._forward(X, truth)
+    if batch_size is None:
+      output = self._forward(X, truth)
+      return output
+
+    if int(batch_size) != batch_size or batch_size < 1:
+      raise ValueError('Network model : incorrect batch_size. Expected a positive integer. Given {}'.format(batch_size))
+
+    if workers is not None and (int(workers) != workers or workers < 1):
+      raise ValueError('Network model : incorrect number of workers. Expected a positive integer. Given {}'.format(workers))
+
+    num_data = len(X)
+    chunks = [slice(start, min(start + batch_size, num_data)) for start in range(0, num_data, batch_size)]
+
+    output = np.empty(shape=(num_data, ) + tuple(self._net[-1].out_shape[1:]), dtype=self.dtype)
+
+    def predict(model, chunks):
+      for idx in chunks:
+        output[idx] = model._forward(X[idx], truth=None if truth is None else truth[idx])
+
+    if workers is None or workers == 1:
+      predict(self, chunks)
+      return output
+
+    workers = min(workers, len(chunks))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+
+      # every replica computes every workers-th chunk
+      futures = [pool.submit(predict, self._replica(), chunks[i::workers]) for i in range(workers)]
+
+      for future in futures:
+        future.result()
+
     return output
 
   def evaluate(self, X, truth):
@@ -354,56 +908,336 @@ class Network(object):
     return (loss, output)
 
 
+  def context(self):
+    '''
+    Inference context of the model: a replica of the model in inference mode which shares the
+    parameters of the model and stores the outputs and buffers of its own layers (ref. _replica).
+    The predict of a context is used by one thread at a time, while its infer, as the infer of the
+    model, can be called by more threads. A context must be created again when the parameters are
+    updated or replaced (ex. fit, fuse, load_weights)
+    '''
+    context = self._replica()
+    context.eval()
+
+    return context
+
+  def infer(self, X, batch_size=None):
+    '''
+    Thread-safe prediction of the given input in inference mode. The outputs and the buffers of the
+    layers are stored in a new context of every call (ref. context), so the concurrent calls on the
+    same model share its parameters without copying them and never modify its layers
+
+    Parameters:
+      X          : array-like, input data
+      batch_size : int, default None. Number of samples of every chunk (ref. predict). None computes
+                   the whole input at once
+    '''
+    return self.context().predict(X, batch_size=batch_size)
+
+  def _replica(self):
+    '''
+    Copy of the model whose layers share the parameters (weights, bias, scales and running
+    statistics) of the model but store their own outputs, deltas and intermediate results
+    (ref. SCRATCH). The parameters must not be updated while the replica is used
+    '''
+    replica = copy.copy(self)
+    replica._net = [copy.copy(layer) for layer in self._net]
+
+    for layer in replica._net:
+      for attr in SCRATCH:
+        if getattr(layer, attr, None) is not None:
+          setattr(layer, attr, None)
+
+    replica.layer_times = {'forward' : None, 'backward' : None}
+    replica._build_plan()
+
+    return replica
+
   def _forward(self, X, truth=None):
     '''
     Forward function.
-    Apply the forward method on all layers
+    Apply the forward method on all layers.
+    The input is not copied if it has already the network dtype: the layers never modify their input.
+    The layers are computed in the order of the model, which is a topological order of the graph,
+    and every layer reads the outputs of its input layers (ref. _sources). With more workers the
+    layers are computed as soon as their input layers are completed (ref. _schedule)
     '''
 
-    y = X.copy()
+    plan = self._plan if self._plan is not None else self._build_plan()
+    storage_dtype = self.storage_dtype if self.storage_dtype != self.dtype else None
 
-    for layer in self:
+    # the input layer holds a reference to the input, as output of the first node of the graph
+    inpt = self._net[0]
+    inpt.output = np.asarray(X, dtype=self.dtype)
+    inpt.delta = np.zeros(shape=inpt.output.shape, dtype=self.dtype) if self.trainable else None
+
+    if truth is not None:
+      truth = truth.astype(self.dtype, copy=False)
 
-      forward_args = layer.forward.__code__.co_varnames
+    # readers of every output which are not completed yet: the concurrent layers are not completed
+    # in the order of the model, so the outputs are dropped after the last completed reader
+    pending = {step.index : len(step.readers) for step in plan}
+    # in inference mode every output is dropped after its last reader (ref. _liveness), in training mode
+    # only the outputs of the layers recomputed by backward (ref. checkpoint)
+    dropped = [not self.trainable or not step.kept for step in plan]
 
-      if 'truth' in forward_args and truth is not None:
-        layer.forward(inpt=y, truth=truth)
+    def forward(step):
+
+      if not self.trainable or step.kept:
+        self._compute(step, truth, storage_dtype)
+        return
+
+      # the layers recomputed by backward store only their output
+      step.layer.trainable = False
+
+      try:
+        self._compute(step, truth, storage_dtype)
 
-      if 'network' in forward_args:
-        layer.forward(network=self)
+      finally:
+        step.layer.trainable = True
 
-      else :
-        layer.forward(inpt=y)
+    def release(step, _):
 
-      y = layer.output
+      if not self._concurrent:
+        for j in step.release:
+          if dropped[j - 1]:
+            self._net[j].output = None
 
-    return y
+        return
 
-  def _backward(self, X):
+      for j, layer in zip(step.sources, step.inputs):
+
+        if j:
+          pending[j] -= 1
+
+          if not pending[j] and j != self.num_layers - 1 and dropped[j - 1]:
+            layer.output = None
+
+    self.layer_times['forward'] = self._schedule(plan, depends=lambda step : step.sources, job=forward, done=release)
+
+    return self._net[-1].output.astype(self.dtype, copy=False)
+
+  def _compute(self, step, truth=None, storage_dtype=None):
     '''
-    BackPropagate the error
+    Forward of a step of the plan on the outputs of its input layers
+
+    Parameters:
+      step          : _Step, step of the plan
+      truth         : array, default None. Truth data, read by the layers with truth (ex. Cost_layer)
+      storage_dtype : dtype, default None. Precision of the stored output, None keeps the
+                      precision of the layer
     '''
+    if step.forward_network:
+      step.forward(network=self)
 
-    for i in reversed(range(1, self.num_layers)):
+    else:
+      inputs = [layer.output for layer in step.inputs]
+
+      # the stored outputs are read in the computation dtype, except by the layers with weights
+      # which accumulate their products in the weights dtype
+      if step.cast:
+        inputs = [x if x.dtype == self.dtype else x.astype(self.dtype) for x in inputs]
+
+      if step.with_truth and truth is not None:
+        step.forward(*inputs, truth=truth)
+
+      else:
+        step.forward(*inputs)
+
+    if storage_dtype is not None:
+      step.layer.output = step.layer.output.astype(storage_dtype)
 
-      input = self._net[i - 1].output[:]
-      delta = self._net[i - 1].delta[:]
+  def _backward(self, X, update=True):
+    '''
+    BackPropagate the error in the reverse order of the forward. The layers read by more
+    than one layer (fan-out) receive the sum of the deltas of all their readers: every
+    reader writes its delta in a new buffer which is then added to the delta of the input.
+    With more workers the layers are computed as soon as all their readers are completed
+    (ref. _schedule)
+
+    Parameters:
+      X      : input of the forward, held by the input layer of the graph
+      update : bool, default True. If False the updates of the parameters are computed but
+               not applied, so that they can be combined before the update (ref. _update)
+    '''
 
-      backward_args = self._net[i].backward.__code__.co_varnames
+    if not self.trainable:
+      raise NetworkError('The Network model is in inference mode. Please use the "train" function before the backward')
 
-      if 'inpt' in backward_args:
-        self._net[i].backward(inpt=input, delta=delta[:])
+    plan = self._plan if self._plan is not None else self._build_plan()
+    storage_dtype = self.storage_dtype if self.storage_dtype != self.dtype else None
 
-      elif 'network' in backward_args:
-        self._net[i].backward(delta=delta[:], network=self)
+    # attributes left empty by the forward of every recomputed layer, i.e. its activations (ref. checkpoint)
+    empty = {}
+    updates = {name for name, _ in GRADIENTS}
+
+    def backward(step):
+
+      # the layers between the previous kept layer and this one are recomputed with their activations
+      for other in step.recompute:
+        empty[other.index] = [name for name, value in vars(other.layer).items() if value is None and name not in updates]
+        self._compute(other, None, storage_dtype)
+
+      if step.backward_network:
+        # the layer adds its delta to the deltas of the selected layers (ex. Route_layer)
+        step.backward(delta=None, network=self)
+        deltas = ()
 
       else:
-        self._net[i].backward(delta=delta[:])
+        deltas = [np.zeros_like(layer.delta) if shared else layer.delta for layer, shared in zip(step.inputs, step.shared)]
+
+        if step.backward_inpt:
+          step.backward(inpt=step.inputs[0].output, delta=deltas[0])
+
+        else:
+          step.backward(*deltas)
+
+      if update and step.update is not None:
+        step.update()
+
+      return deltas
+
+    def accumulate(step, deltas):
+
+      # the deltas of the shared inputs are added by a single thread
+      for layer, shared, delta in zip(step.inputs, step.shared, deltas):
+        if shared:
+          layer.delta += delta
+
+      # the recomputed layers drop their activations after their backward
+      for name in empty.pop(step.index, ()):
+        setattr(step.layer, name, None)
+
+    # the layers which add their delta to the deltas of the inputs are computed in the calling thread,
+    # with the accumulation of the deltas of the other readers
+    self.layer_times['backward'] = self._schedule(reversed(plan), depends=lambda step : step.readers,
+                                                  job=backward, done=accumulate,
+                                                  inline=lambda step : step.backward_network)
+
+  def _gradients(self):
+    '''
+    Updates computed by the backward of the layers with parameters: list of (layer, name of the
+    update, name of the parameter) in the order of the model (ref. GRADIENTS)
+    '''
+    return [(layer, name, param) for layer in self._net[1:] if hasattr(layer, 'update')
+                                 for name, param in GRADIENTS if hasattr(layer, name)]
+
+  def _update(self):
+    '''
+    Apply the updates computed by the last backward to the parameters of every layer
+    (ref. _backward with update=False)
+    '''
+
+    plan = self._plan if self._plan is not None else self._build_plan()
+
+    for step in plan:
+      if step.update is not None:
+        step.update()
+
+  def _schedule(self, steps, depends, job, done, inline=lambda step : False):
+    '''
+    Run the job of every step of the plan after the jobs of the steps it depends on and return the
+    start and stop times of every layer, in seconds from the beginning of the run.
+    With more workers the steps whose dependencies are completed run concurrently on a pool of
+    threads, otherwise one at a time in the given order. NumPy releases the GIL in the BLAS calls and
+    in most of the ufuncs, so the layers of independent branches of the graph overlap.
+
+    Parameters:
+      steps   : iterable of _Step, in an order which satisfies the dependencies
+      depends : function, indexes of the layers whose steps must be completed before the step
+      job     : function, computation of a step. It must modify only the layer of the step and the
+                buffers returned as result
+      done    : function, called in the calling thread with the step and the result of its job,
+                in the order of completion
+      inline  : function, True for the steps which must run in the calling thread
+    '''
+
+    times = np.zeros(shape=(self.num_layers, 2), dtype=float)
+    origin = now()
+
+    def timed(step):
+      start = now()
+      result = job(step)
+      times[step.index] = (start - origin, now() - origin)
+      return result
+
+    if not self._concurrent:
+
+      for step in steps:
+        done(step, timed(step))
+
+      return times
+
+    steps = list(steps)
+    indexes = {step.index for step in steps}
+    # number of dependencies not completed of every step and steps which depend on every step
+    waiting = {step.index : 0 for step in steps}
+    dependents = {step.index : [] for step in steps}
+
+    for step in steps:
+      for j in depends(step):
+        # the layers out of the plan (ex. the input layer) are always completed
+        if j in indexes:
+          waiting[step.index] += 1
+          dependents[j].append(step)
+
+    ready = [step for step in steps if not waiting[step.index]]
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=self.workers) as pool:
+
+      while ready or running:
+
+        completed = []
+
+        for step in ready:
+          if inline(step):
+            completed.append((step, timed(step)))
+          else:
+            running[pool.submit(timed, step)] = step
+
+        ready = []
+
+        if not completed:
+          finished, _ = wait(running, return_when=FIRST_COMPLETED)
+          completed = [(running.pop(future), future.result()) for future in finished]
+
+        for step, result in completed:
+
+          done(step, result)
+
+          for other in dependents[step.index]:
+            waiting[other.index] -= 1
+
+            if not waiting[other.index]:
+              ready.append(other)
+
+    return times
+
+  @property
+  def _concurrent(self):
+    '''
+    True if the layers are computed by more workers
+    '''
+    return self.workers is not None and self.workers > 1
+
+  def concurrency(self, phase='forward'):
+    '''
+    Concurrency achieved in the last forward or backward, i.e. the sum of the wall times of the
+    layers divided by the wall time of the whole pass. The value is 1 if the layers are computed
+    one at a time and up to the number of workers
+
+    Parameters:
+      phase : str, 'forward' or 'backward'
+    '''
+    times = self.layer_times.get(phase, None)
+
+    if times is None:
+      raise NetworkError('Network model : the {} of the model is not computed yet'.format(phase))
 
-      if hasattr(self._net[i], 'update'):
-        self._net[i].update()
+    elapsed = times[:, 1].max() - times[1:, 0].min()
 
-    self._net[0].backward(delta[:])
+    return np.sum(times[:, 1] - times[:, 0]) / elapsed if elapsed > 0. else 1.
 
 
   def _get_loss(self):
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import multiprocessing as mp
+from time import time as now
+from threading import BrokenBarrierError
+
+try:
+  from multiprocessing import shared_memory
+
+except ImportError: # python < 3.8
+  shared_memory = None
+
+from NumPyNet.exception import NetworkError
+
+__author__ = ['Mattia Ceccarelli', 'Nico Curti']
+__email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
+__package__ = 'Data parallel training'
+
+
+# commands sent by the main process to the workers
+_STOP, _STEP = (0, 1)
+
+
+def _gradients(model):
+  '''
+  Layout of the updates of the model in a flat buffer: list of (layer, name, start, stop) for every
+  update of the layers with parameters, in the order of the model (ref. Network._gradients).
+  The layout is the same for every replica of the model
+  '''
+  layout = []
+  pos = 0
+
+  for layer, name, param in model._gradients():
+    size = np.size(getattr(layer, param))
+    layout.append((layer, name, pos, pos + size))
+    pos += size
+
+  return layout
+
+
+def _split(start, stop, parts, rank):
+  '''
+  Contiguous range of the rank-th of parts chunks of [start, stop), as np.array_split
+  '''
+  size, rest = divmod(stop - start, parts)
+  begin = start + rank * size + min(rank, rest)
+  return slice(begin, begin + size + (rank < rest))
+
+
+def _attach(spec):
+  '''
+  Open a shared memory block created by the main process and return it with its array
+
+  Parameters:
+    spec : tuple, (name, shape, dtype) of the shared array
+  '''
+  name, shape, dtype = spec
+  shm = shared_memory.SharedMemory(name=name)
+  return (shm, np.ndarray(shape=shape, dtype=dtype, buffer=shm.buf))
+
+
+def _step(model, rank, processes, buffers, barrier, layout):
+  '''
+  Train step of a replica on its shard of the batch selected by the main process.
+  The updates of every replica, weighted by the fraction of the batch in its shard, are
+  written in its row of the shared gradients. The sum over the replicas is split in as many
+  chunks as the processes, every process reduces one chunk (reduce-scatter) and then every
+  replica reads the whole sum (all-gather) and applies the same update to its parameters.
+
+  Parameters:
+    model     : Network object, replica of the model
+    rank      : int, index of the replica
+    processes : int, number of replicas
+    buffers   : dict, shared arrays (data, truth, control, loss, gradients, reduced)
+    barrier   : multiprocessing.Barrier, synchronization of the processes
+    layout    : list, layout of the updates in the shared gradients (ref. _gradients)
+  '''
+  _, start, stop = buffers['control']
+  # the shard is a contiguous range of the batch
+  shard = _split(start, stop, processes, rank)
+  # the cost and the deltas are averaged over the shard, their mean over the batch is a weighted sum
+  weight = float(shard.stop - shard.start) / (stop - start)
+
+  # the layers keep views of their inputs, which must not refer to the shared memory when it is closed
+  X = buffers['data'][shard].copy()
+  y = buffers['truth'][shard].copy()
+
+  model._forward(X=X, truth=y)
+  model._backward(X=X, update=False)
+
+  gradients = buffers['gradients'][rank]
+
+  for layer, name, begin, end in layout:
+    np.multiply(getattr(layer, name).ravel(), weight, out=gradients[begin:end])
+
+  buffers['loss'][rank] = model._get_loss() * weight
+
+  barrier.wait()
+
+  chunk = _split(0, buffers['reduced'].size, processes, rank)
+  np.sum(buffers['gradients'][:, chunk], axis=0, out=buffers['reduced'][chunk])
+
+  barrier.wait()
+
+  reduced = buffers['reduced']
+
+  for layer, name, begin, end in layout:
+    update = getattr(layer, name)
+    update[...] = reduced[begin:end].reshape(update.shape)
+
+  model._update()
+
+
+def _worker(model, rank, processes, specs, barrier, seed):
+  '''
+  Loop of a worker process: it runs the train steps selected by the main process
+  until the stop command
+
+  Parameters:
+    model     : Network object, replica of the model
+    rank      : int, index of the replica
+    processes : int, number of replicas
+    specs     : dict, (name, shape, dtype) of the shared arrays
+    barrier   : multiprocessing.Barrier, synchronization of the processes
+    seed      : int, seed of the random generator of the replica
+  '''
+  blocks, buffers = ({}, {})
+  layout = _gradients(model)
+
+  # the forked workers inherit the random state of the main process
+  np.random.seed(seed)
+
+  try:
+
+    for key, spec in specs.items():
+      blocks[key], buffers[key] = _attach(spec)
+
+    while True:
+
+      barrier.wait()
+
+      if buffers['control'][0] == _STOP:
+        break
+
+      _step(model, rank, processes, buffers, barrier, layout)
+
+  except BrokenBarrierError:
+    # the main process aborted the training
+    pass
+
+  except:
+    barrier.abort()
+    raise
+
+  finally:
+    buffers.clear()
+
+    for shm in blocks.values():
+      shm.close()
+
+
+class DataParallel (object):
+
+  def __init__ (self, model, processes=2):
+    '''
+    Data parallel training of a Network model on more processes.
+    Every batch is split in as many shards as the processes and every process computes the
+    forward and backward of a replica of the model on its shard. The updates of the replicas
+    are summed (all-reduce) through shared memory and every replica applies the same update,
+    so the replicas keep the same parameters of the model trained on the whole batch. The
+    BatchNorm layers normalize with the statistics of the shard of their replica and the random
+    layers (ex. Dropout) draw independent masks on every shard.
+
+    Parameters:
+      model     : Network object, compiled model to train. The main process trains it as
+                  the first replica
+      processes : int, default 2. Number of replicas, each one in its own process
+    '''
+
+    if shared_memory is None:
+      raise NetworkError('Data parallel training requires python >= 3.8 (multiprocessing.shared_memory)')
+
+    if int(processes) != processes or processes < 1:
+      raise ValueError('DataParallel : incorrect number of processes. Expected a positive integer. Given {}'.format(processes))
+
+    self.model = model
+    self.processes = int(processes)
+
+  def fit (self, X, y, max_iter=100, shuffle=True, seed=None):
+    '''
+    Train the model on the data with the same batches of Network.fit.
+    The data are copied once in shared memory, read by every process
+
+    Parameters:
+      X        : array-like, input data
+      y        : array-like, truth data
+      max_iter : int, default 100. Number of epochs
+      shuffle  : bool, default True. Shuffle the order of the batches at every epoch
+      seed     : int, default None. Seed of the random generators: the replica of rank r is seeded
+                 with seed + r, the main process included. None keeps the random state of the main
+                 process and draws the seed of the workers from it
+    '''
+    model = self.model
+
+    if model.batch < self.processes:
+      raise ValueError('DataParallel : the batch size ({:d}) must be at least the number of processes ({:d})'.format(model.batch, self.processes))
+
+    # the fused parameters are not trainable
+    if model._fused:
+      model.unfuse()
+
+    model.train()
+
+    num_data = len(X)
+
+    batches = np.array_split(range(num_data), indices_or_sections=num_data // model.batch)
+    batches = [slice(idx[0], idx[-1] + 1) for idx in batches]
+
+    layout = _gradients(model)
+    size = layout[-1][-1] if layout else 0
+
+    if seed is None:
+      seed = np.random.randint(0, 2**31 - self.processes)
+    else:
+      np.random.seed(seed)
+
+    X, y = (np.asarray(X), np.asarray(y))
+
+    # data, control of the workers (command and range of the batch), weighted losses and updates of the replicas
+    shapes = {'data'      : (X.shape, model.dtype),
+              'truth'     : (y.shape, model.dtype),
+              'control'   : ((3, ), np.int64),
+              'loss'      : ((self.processes, ), np.float64),
+              'gradients' : ((self.processes, size), model.dtype),
+              'reduced'   : ((size, ), model.dtype),
+             }
+
+    ctx = mp.get_context()
+    barrier = ctx.Barrier(self.processes)
+    blocks, buffers, specs = ({}, {}, {})
+    workers = []
+
+    try:
+
+      for key, (shape, dtype) in shapes.items():
+        dtype = np.dtype(dtype)
+        blocks[key] = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        buffers[key] = np.ndarray(shape=shape, dtype=dtype, buffer=blocks[key].buf)
+        specs[key] = (blocks[key].name, shape, dtype)
+
+      buffers['data'][...] = X
+      buffers['truth'][...] = y
+
+      # the replicas are copies of the model at the beginning of the training
+      for rank in range(1, self.processes):
+        worker = ctx.Process(target=_worker, args=(model, rank, self.processes, specs, barrier, seed + rank))
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+
+      for _ in range(max_iter):
+
+        start = now()
+
+        print('Epoch {:d}/{:d}'.format(_ + 1, max_iter), flush=True)
+
+        loss = 0.
+
+        if shuffle:
+          np.random.shuffle(batches)
+
+        for i, idx in enumerate(batches):
+
+          buffers['control'][:] = (_STEP, idx.start, idx.stop)
+          barrier.wait()
+
+          _step(model, 0, self.processes, buffers, barrier, layout)
+
+          loss += buffers['loss'].sum() / (idx.stop - idx.start)
+
+          done = int(50 * (i + 1) / len(batches))
+          print('\r{:>3d}/{:<3d} |{}{}| ({:1.1f} sec/iter) loss: {:3.3f}'.format( (idx.stop - idx.start) * (i + 1),
+                                                                                  num_data,
+                                                                                 r'█' * done,
+                                                                                  '-' * (50 - done),
+                                                                                  now() - start,
+                                                                                  loss
+                                                                                ), flush=True, end='')
+          start = now()
+
+        print('\n', end='', flush=True)
+
+      buffers['control'][0] = _STOP
+      barrier.wait()
+
+    except BrokenBarrierError:
+      raise NetworkError('DataParallel : a worker process failed during the training')
+
+    finally:
+      # the workers blocked on the barrier are released
+      barrier.abort()
+
+      for worker in workers:
+        worker.join()
+
+      buffers.clear()
+
+      for shm in blocks.values():
+        shm.close()
+        shm.unlink()
+
+    model._fitted = True
+
+    return model
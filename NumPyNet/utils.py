@@ -12,6 +12,9 @@ __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
 __package__ = 'Utilities'
 
+# truth value of the entries ignored by the masked cost (ref. Cost_layer)
+SECRET_NUM = -1234.
+
 def _check_activation (layer, activation_func):
   '''
   Check if the activation function is valid.
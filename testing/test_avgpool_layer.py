@@ -11,6 +11,7 @@ import keras.backend as K
 from NumPyNet.layers.avgpool_layer import Avgpool_layer
 from keras.layers import AvgPool2D
 
+import itertools
 import numpy as np
 from hypothesis import strategies as st
 from hypothesis import given, settings
@@ -85,6 +86,85 @@ def test_avgpool_layer(batch, w, h, c, size, stride, pad):
   assert delta.shape == inpt.shape
   assert np.allclose(delta, delta_keras, atol=1e-8)
 
+@given(batch = st.integers(min_value=1, max_value=3),
+       w     = st.integers(min_value=10, max_value=30),
+       h     = st.integers(min_value=10, max_value=30),
+       c     = st.integers(min_value=1, max_value=3),
+       size  = st.integers(min_value=1, max_value=4),
+       pad   = st.booleans())
+@settings(max_examples=10,
+          deadline=None)
+def test_avgpool_non_overlapping(batch, w, h, c, size, pad):
+  '''
+  Tests:
+    if the average pool with size == stride is the same as the mean over
+    every window, both in forward and backward
+  '''
+
+  inpt = np.random.uniform(low=0., high=1., size=(batch, w, h, c))
+
+  numpynet = Avgpool_layer(size=size, stride=size, padding=pad)
+  numpynet.forward(inpt)
+
+  numpynet.delta = np.random.uniform(low=0., high=1., size=numpynet.out_shape)
+  delta = np.random.uniform(low=0., high=1., size=inpt.shape)
+  delta_check = delta.copy()
+  numpynet.backward(delta)
+
+  forward_out = np.empty(shape=numpynet.out_shape, dtype=float)
+  _, out_w, out_h, _ = numpynet.out_shape
+
+  for b, i, j, k in itertools.product(range(batch), range(out_w), range(out_h), range(c)):
+    x = max(i * size - numpynet.pad_top, 0)
+    y = max(j * size - numpynet.pad_left, 0)
+    window = (b, slice(x, (i + 1) * size - numpynet.pad_top), slice(y, (j + 1) * size - numpynet.pad_left), k)
+    forward_out[b, i, j, k] = inpt[window].mean()
+    delta_check[window] += numpynet.delta[b, i, j, k] / inpt[window].size
+
+  assert np.allclose(numpynet.output, forward_out)
+  assert np.allclose(delta, delta_check)
+
+@given(batch  = st.integers(min_value=1, max_value=3),
+       w      = st.integers(min_value=10, max_value=30),
+       h      = st.integers(min_value=10, max_value=30),
+       c      = st.integers(min_value=1, max_value=3),
+       size   = st.integers(min_value=1, max_value=5),
+       stride = st.integers(min_value=1, max_value=4),
+       pad    = st.booleans())
+@settings(max_examples=10,
+          deadline=None)
+def test_avgpool_norm(batch, w, h, c, size, stride, pad):
+  '''
+  Tests:
+    if the average pool normalizes every window by the number of image pixels,
+    padding excluded, both in forward and backward, also with overlapping windows
+  '''
+
+  inpt = np.random.uniform(low=0., high=1., size=(batch, w, h, c))
+
+  numpynet = Avgpool_layer(size=size, stride=stride, padding=pad)
+  numpynet.forward(inpt)
+
+  numpynet.delta = np.random.uniform(low=0., high=1., size=numpynet.out_shape)
+  delta = np.random.uniform(low=0., high=1., size=inpt.shape)
+  delta_check = delta.copy()
+  numpynet.backward(delta)
+
+  forward_out = np.empty(shape=numpynet.out_shape, dtype=float)
+  _, out_w, out_h, _ = numpynet.out_shape
+
+  for b, i, j, k in itertools.product(range(batch), range(out_w), range(out_h), range(c)):
+    x = max(i * stride - numpynet.pad_top, 0)
+    y = max(j * stride - numpynet.pad_left, 0)
+    window = (b, slice(x, i * stride + size - numpynet.pad_top), slice(y, j * stride + size - numpynet.pad_left), k)
+    forward_out[b, i, j, k] = inpt[window].mean()
+    delta_check[window] += numpynet.delta[b, i, j, k] / inpt[window].size
+
+  assert np.allclose(numpynet.output, forward_out)
+  assert np.allclose(delta, delta_check)
+
 if __name__ == '__main__':
 
   test_avgpool_layer()
+  test_avgpool_non_overlapping()
+  test_avgpool_norm()
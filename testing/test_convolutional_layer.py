@@ -13,9 +13,14 @@ from NumPyNet.activations import Logistic
 from NumPyNet.activations import Linear
 from NumPyNet.activations import Tanh
 from NumPyNet.layers.convolutional_layer import Convolutional_layer
+from NumPyNet.layers.input_layer import Input_layer
+from NumPyNet.optimizer import SGD
+from NumPyNet.exception import LayerError
 from keras.layers import Conv2D
 
+import itertools
 import numpy as np
+import pytest
 
 __author__ = ['Mattia Ceccarelli', 'Nico Curti']
 __email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
@@ -115,6 +120,397 @@ def test_convolutional_layer():
         assert np.allclose(numpynet.weights_update, weights_updates_keras, atol=1e-3, rtol=1e-3) # for a lot of operations, atol is lower
         assert np.allclose(numpynet.bias_update,    bias_updates_keras,    atol=1e-8, rtol=1e-3)
 
+
+def test_convolutional_algorithms():
+  '''
+  Tests:
+    if the gemm (im2col) forward and backward are consistent with the einsum ones
+  '''
+  np.random.seed(123)
+
+  sizes   = [(1, 1), (3, 3), (5, 5)]
+  strides = [(1, 1), (2, 2), (3, 3)]
+
+  for size, stride in zip(sizes, strides):
+    for pad in [False, True]:
+
+      inpt    = np.random.uniform(low=-1., high=1., size=(3, 31, 29, 4))
+      filters = np.random.uniform(low=-1., high=1., size=size + (4, 8))
+      bias    = np.random.uniform(low=-1., high=1., size=(8,))
+
+      outputs = []
+
+      for algorithm in ['einsum', 'gemm']:
+
+        layer = Convolutional_layer(filters=8, input_shape=inpt.shape,
+                                    weights=filters, bias=bias,
+                                    activation=Logistic,
+                                    size=size, stride=stride,
+                                    pad=pad, algorithm=algorithm)
+
+        layer.forward(inpt, copy=True)
+        out = layer.output.copy()
+
+        delta = np.zeros(shape=inpt.shape, dtype=float)
+        layer.delta = np.ones(shape=layer.out_shape, dtype=float)
+        layer.backward(delta, copy=True)
+
+        outputs.append((out, delta, layer.weights_update, layer.bias_update))
+
+      for einsum_res, gemm_res in zip(*outputs):
+        assert np.allclose(einsum_res, gemm_res, atol=1e-8, rtol=1e-5)
+
+
+def test_convolutional_backward():
+  '''
+  Tests:
+    if the vectorized col2im of the backward is the same as the
+    element-wise scatter of every patch gradient
+  '''
+  np.random.seed(123)
+
+  sizes   = [(2, 2), (3, 3), (4, 4)]
+  strides = [(1, 1), (2, 2), (3, 3)]
+
+  for size, stride in zip(sizes, strides):
+    for pad in [False, True]:
+
+      inpt    = np.random.uniform(low=-1., high=1., size=(2, 11, 13, 3))
+      filters = np.random.uniform(low=-1., high=1., size=size + (3, 5))
+      bias    = np.random.uniform(low=-1., high=1., size=(5,))
+
+      layer = Convolutional_layer(filters=5, input_shape=inpt.shape,
+                                  weights=filters, bias=bias,
+                                  activation=Linear,
+                                  size=size, stride=stride, pad=pad)
+
+      layer.forward(inpt)
+
+      layer.delta = np.random.uniform(low=-1., high=1., size=layer.out_shape)
+      init_delta  = np.random.uniform(low=-1., high=1., size=inpt.shape)
+
+      # reference: element-wise scatter on the (padded) delta
+      operator = np.einsum('ijkl, mnol -> ijkmno', layer.delta, filters)
+      mat_pad  = layer._pad(init_delta) if pad else init_delta.copy()
+      delta_view = layer._asStride(mat_pad, layer.size, layer.stride)
+
+      for i, j, k, l, m, n in itertools.product(*map(range, delta_view.shape)):
+        delta_view[i, j, k, l, m, n] += operator[i, j, k, l, m, n]
+
+      _, w_pad, h_pad, _ = mat_pad.shape
+      delta_check = mat_pad[:, layer.pad_top : w_pad - layer.pad_bottom, layer.pad_left : h_pad - layer.pad_right, :]
+
+      delta = init_delta.copy()
+      layer.backward(delta)
+
+      assert np.allclose(delta, delta_check, atol=1e-8, rtol=1e-5)
+
+
+def test_convolutional_winograd():
+  '''
+  Tests:
+    if the winograd forward is consistent with the gemm one for both the output tiles
+    if the transformed weights are recomputed after the update
+  '''
+  np.random.seed(123)
+
+  for tile in [2, 4]:
+    for pad in [False, True]:
+
+      inpt    = np.random.uniform(low=-1., high=1., size=(2, 15, 14, 3))
+      filters = np.random.uniform(low=-1., high=1., size=(3, 3, 3, 6))
+      bias    = np.random.uniform(low=-1., high=1., size=(6,))
+
+      gemm = Convolutional_layer(filters=6, input_shape=inpt.shape,
+                                 weights=filters.copy(), bias=bias.copy(),
+                                 activation=Linear, size=3, stride=1,
+                                 pad=pad, algorithm='gemm')
+
+      winograd = Convolutional_layer(filters=6, input_shape=inpt.shape,
+                                     weights=filters.copy(), bias=bias.copy(),
+                                     activation=Linear, size=3, stride=1,
+                                     pad=pad, algorithm='auto', winograd_tile=tile)
+
+      for layer in [gemm, winograd]:
+        layer.optimizer = SGD(lr=.1)
+        layer.forward(inpt)
+        layer.delta = np.ones(shape=layer.out_shape, dtype=float)
+        layer.backward(np.zeros(shape=inpt.shape, dtype=float))
+        layer.update()
+        layer.forward(inpt)
+
+      assert winograd._algorithm == 'winograd'
+      assert np.allclose(gemm.output, winograd.output, atol=1e-8, rtol=1e-5)
+
+
+def test_convolutional_fft():
+  '''
+  Tests:
+    if the fft forward and backward are consistent with the gemm ones
+    if the auto algorithm chooses the fft for large kernels
+  '''
+  np.random.seed(123)
+
+  sizes   = [(3, 3), (7, 7), (9, 9)]
+  strides = [(2, 2), (1, 1), (3, 3)]
+
+  for size, stride in zip(sizes, strides):
+    for pad in [False, True]:
+
+      inpt    = np.random.uniform(low=-1., high=1., size=(2, 23, 19, 3))
+      filters = np.random.uniform(low=-1., high=1., size=size + (3, 4))
+      bias    = np.random.uniform(low=-1., high=1., size=(4,))
+
+      outputs = []
+
+      for algorithm in ['gemm', 'fft']:
+
+        layer = Convolutional_layer(filters=4, input_shape=inpt.shape,
+                                    weights=filters, bias=bias,
+                                    activation=Logistic,
+                                    size=size, stride=stride,
+                                    pad=pad, algorithm=algorithm)
+
+        layer.forward(inpt, copy=True)
+        out = layer.output.copy()
+
+        delta = np.zeros(shape=inpt.shape, dtype=float)
+        layer.delta = np.ones(shape=layer.out_shape, dtype=float)
+        layer.backward(delta, copy=True)
+
+        outputs.append((out, delta, layer.weights_update, layer.bias_update))
+
+      for gemm_res, fft_res in zip(*outputs):
+        assert np.allclose(gemm_res, fft_res, atol=1e-8, rtol=1e-5)
+
+  layer = Convolutional_layer(filters=4, input_shape=(1, 50, 50, 3), size=7, stride=1)
+  assert layer._algorithm == 'fft'
+
+
+def test_convolutional_groups():
+  '''
+  Tests:
+    if the grouped (and depthwise) convolution is the same as the concatenation
+    of a dense convolution for every group, both in forward and backward
+  '''
+  np.random.seed(123)
+
+  configs = [(2, 4, 6), (4, 4, 8), (6, 6, 6)] # (groups, channels_in, channels_out)
+
+  for groups, c_in, c_out in configs:
+    for algorithm in ['gemm', 'einsum']:
+
+      inpt    = np.random.uniform(low=-1., high=1., size=(2, 14, 13, c_in))
+      filters = np.random.uniform(low=-1., high=1., size=(3, 3, c_in // groups, c_out))
+      bias    = np.random.uniform(low=-1., high=1., size=(c_out,))
+
+      layer = Convolutional_layer(filters=c_out, input_shape=inpt.shape,
+                                  weights=filters, bias=bias,
+                                  activation=Logistic, size=3, stride=2,
+                                  pad=True, groups=groups, algorithm=algorithm)
+
+      layer.forward(inpt, copy=True)
+      layer_delta = np.random.uniform(low=-1., high=1., size=layer.out_shape)
+      layer.delta = layer_delta.copy()
+      delta = np.zeros(shape=inpt.shape, dtype=float)
+      layer.backward(delta, copy=True)
+
+      c_g, out_g = c_in // groups, c_out // groups
+
+      for g in range(groups):
+
+        group = Convolutional_layer(filters=out_g, input_shape=inpt.shape[:3] + (c_g, ),
+                                    weights=filters[..., g * out_g : (g + 1) * out_g],
+                                    bias=bias[g * out_g : (g + 1) * out_g],
+                                    activation=Logistic, size=3, stride=2, pad=True)
+
+        group.forward(inpt[..., g * c_g : (g + 1) * c_g], copy=True)
+        group.delta = layer_delta[..., g * out_g : (g + 1) * out_g].copy()
+        group_delta = np.zeros(shape=inpt.shape[:3] + (c_g, ), dtype=float)
+        group.backward(group_delta, copy=True)
+
+        assert np.allclose(group.output, layer.output[..., g * out_g : (g + 1) * out_g], atol=1e-8, rtol=1e-5)
+        assert np.allclose(group_delta, delta[..., g * c_g : (g + 1) * c_g], atol=1e-8, rtol=1e-5)
+        assert np.allclose(group.weights_update, layer.weights_update[..., g * out_g : (g + 1) * out_g], atol=1e-8, rtol=1e-5)
+
+  # the given weights are never replaced: the dense weights do not fit the grouped convolution
+  filters = np.random.uniform(low=-1., high=1., size=(3, 3, 4, 6))
+
+  with pytest.raises(LayerError):
+    Convolutional_layer(filters=6, input_shape=(2, 14, 13, 4), weights=filters, size=3, groups=2)
+
+  # nor when the previous layer has a different number of channels
+  layer = Convolutional_layer(filters=6, input_shape=(2, 14, 13, 4), weights=filters, size=3)
+  previous = Input_layer(input_shape=(2, 14, 13, 8))
+
+  with pytest.raises(LayerError):
+    layer(previous)
+
+  # the random weights follow the channels of the previous layer
+  layer = Convolutional_layer(filters=6, input_shape=(2, 14, 13, 4), size=3)
+  layer(previous)
+  assert layer.weights.shape == (3, 3, 8, 6)
+
+
+def test_convolutional_pointwise():
+  '''
+  Tests:
+    if the 1 x 1 convolution with the pointwise algorithm is the same as the gemm one,
+    both in forward and backward, for dense and grouped convolutions with stride 1 and 2
+    if the 'auto' algorithm chooses pointwise for 1 x 1 kernels
+    if the pointwise algorithm raises ValueError for larger kernels
+  '''
+  np.random.seed(123)
+
+  for groups, stride, pad in itertools.product([1, 4], [1, 2, 3], [False, True]):
+
+    inpt    = np.random.uniform(low=-1., high=1., size=(2, 15, 14, 8))
+    filters = np.random.uniform(low=-1., high=1., size=(1, 1, 8 // groups, 12))
+    bias    = np.random.uniform(low=-1., high=1., size=(12,))
+    layer_delta = None
+
+    results = []
+
+    for algorithm in ['gemm', 'pointwise']:
+
+      layer = Convolutional_layer(filters=12, input_shape=inpt.shape,
+                                  weights=filters, bias=bias,
+                                  activation=Logistic, size=1, stride=stride,
+                                  pad=pad, groups=groups, algorithm=algorithm)
+
+      layer.forward(inpt, copy=True)
+
+      if layer_delta is None:
+        layer_delta = np.random.uniform(low=-1., high=1., size=layer.out_shape)
+
+      layer.delta = layer_delta.copy()
+      delta = np.zeros(shape=inpt.shape, dtype=float)
+      layer.backward(delta, copy=True)
+
+      results.append((layer.output, delta, layer.weights_update, layer.bias_update))
+
+    for gemm, pointwise in zip(*results):
+      assert np.allclose(gemm, pointwise, atol=1e-8, rtol=1e-5)
+
+  layer = Convolutional_layer(filters=12, input_shape=inpt.shape, size=1, stride=2)
+  assert layer._algorithm == 'pointwise'
+
+  with pytest.raises(ValueError):
+    layer = Convolutional_layer(filters=12, input_shape=inpt.shape, size=3, algorithm='pointwise')
+
+
+def test_convolutional_dilation():
+  '''
+  Tests:
+    if the dilated convolution is the same as the convolution with the kernel
+    dilated by zeros, both in forward and backward, for different strides, padding
+    and groups
+  '''
+  np.random.seed(123)
+
+  for size, stride, dilation, pad, groups in itertools.product([2, 3], [1, 2], [2, 3], [False, True], [1, 2]):
+
+    inpt    = np.random.uniform(low=-1., high=1., size=(2, 17, 15, 4))
+    filters = np.random.uniform(low=-1., high=1., size=(size, size, 4 // groups, 6))
+    bias    = np.random.uniform(low=-1., high=1., size=(6,))
+
+    extent = dilation * (size - 1) + 1
+    dilated_filters = np.zeros(shape=(extent, extent, 4 // groups, 6), dtype=float)
+    dilated_filters[::dilation, ::dilation] = filters
+
+    layer = Convolutional_layer(filters=6, input_shape=inpt.shape,
+                                weights=filters, bias=bias,
+                                activation=Logistic, size=size, stride=stride,
+                                dilation=dilation, pad=pad, groups=groups)
+
+    check = Convolutional_layer(filters=6, input_shape=inpt.shape,
+                                weights=dilated_filters, bias=bias,
+                                activation=Logistic, size=extent, stride=stride,
+                                pad=pad, groups=groups, algorithm='gemm')
+
+    layer.forward(inpt, copy=True)
+    check.forward(inpt, copy=True)
+
+    assert layer.out_shape == check.out_shape
+    assert np.allclose(layer.output, check.output, atol=1e-8, rtol=1e-5)
+
+    layer.delta = np.random.uniform(low=-1., high=1., size=layer.out_shape)
+    check.delta = layer.delta.copy()
+
+    delta = np.zeros(shape=inpt.shape, dtype=float)
+    delta_check = np.zeros(shape=inpt.shape, dtype=float)
+
+    layer.backward(delta, copy=True)
+    check.backward(delta_check, copy=True)
+
+    assert np.allclose(delta, delta_check, atol=1e-8, rtol=1e-5)
+    assert np.allclose(layer.weights_update, check.weights_update[::dilation, ::dilation], atol=1e-8, rtol=1e-5)
+
+  # the transformed algorithms are not used for dilated kernels
+  layer = Convolutional_layer(filters=6, input_shape=inpt.shape, size=3, stride=1, dilation=2)
+  assert layer._algorithm == 'gemm'
+
+  with pytest.raises(ValueError):
+    layer = Convolutional_layer(filters=6, input_shape=inpt.shape, size=3, stride=1, dilation=2, algorithm='winograd')
+
+  with pytest.raises(ValueError):
+    layer = Convolutional_layer(filters=6, input_shape=inpt.shape, size=9, stride=1, dilation=2, algorithm='fft')
+
+
+def test_convolutional_tiled():
+  '''
+  Tests:
+    if the tiled convolution (batch tiles and row tiles) is the same as the
+    untiled one for every algorithm, both in forward and backward
+  '''
+  np.random.seed(123)
+
+  configs = [(3, 1, 1, 'gemm'), (3, 2, 1, 'einsum'), (3, 1, 1, 'winograd'), (7, 1, 1, 'fft'),
+             (1, 2, 1, 'pointwise'), (3, 2, 2, 'gemm')] # (size, stride, dilation, algorithm)
+
+  for (size, stride, dilation, algorithm), pad, workspace in itertools.product(configs, [False, True], [1, 4096, 65536]):
+
+    inpt    = np.random.uniform(low=-1., high=1., size=(3, 16, 13, 4))
+    filters = np.random.uniform(low=-1., high=1., size=(size, size, 4, 6))
+    bias    = np.random.uniform(low=-1., high=1., size=(6,))
+    layer_delta = None
+
+    results = []
+
+    for workspace_bytes in [None, workspace]:
+
+      layer = Convolutional_layer(filters=6, input_shape=inpt.shape,
+                                  weights=filters, bias=bias,
+                                  activation=Logistic, size=size, stride=stride,
+                                  dilation=dilation, pad=pad, algorithm=algorithm,
+                                  workspace_bytes=workspace_bytes)
+
+      layer.forward(inpt, copy=True)
+
+      if layer_delta is None:
+        layer_delta = np.random.uniform(low=-1., high=1., size=layer.out_shape)
+
+      layer.delta = layer_delta.copy()
+      delta = np.zeros(shape=inpt.shape, dtype=float)
+      layer.backward(delta, copy=True)
+
+      results.append((layer.output, delta, layer.weights_update, layer.bias_update))
+
+    assert layer._tiled_input is not None or workspace == 65536
+
+    for untiled, tiled in zip(*results):
+      assert untiled.shape == tiled.shape
+      assert np.allclose(untiled, tiled, atol=1e-8, rtol=1e-5)
+
+
 if __name__ == '__main__':
 
   test_convolutional_layer()
+  test_convolutional_algorithms()
+  test_convolutional_backward()
+  test_convolutional_winograd()
+  test_convolutional_fft()
+  test_convolutional_groups()
+  test_convolutional_pointwise()
+  test_convolutional_dilation()
+  test_convolutional_tiled()
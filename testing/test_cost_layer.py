@@ -12,6 +12,7 @@ import tensorflow as tf
 
 from NumPyNet.layers import cost_layer as cl
 from NumPyNet.layers.cost_layer import Cost_layer
+from NumPyNet.utils import SECRET_NUM
 
 from keras.losses import mean_squared_error
 from keras.losses import mean_absolute_error
@@ -36,7 +37,6 @@ def test_cost_layer():
         _threshold
         _ratio
         noobject_scale
-        masked
         _seg
         _wgan
   '''
@@ -104,6 +104,45 @@ def test_cost_layer():
 
     # all passed
 
+def test_cost_masked():
+  '''
+  Tests:
+    if the entries whose truth is SECRET_NUM contribute zero loss and zero delta
+    if the other entries have the mse loss and delta
+    if the input is not modified
+  '''
+  np.random.seed(123)
+
+  inpt = np.random.uniform(low=0., high=1., size=(2, 3, 3, 4))
+  truth = np.random.uniform(low=0., high=1., size=inpt.shape)
+  truth[..., 1] = SECRET_NUM
+  truth[0, 0, 0, 2] = SECRET_NUM
+
+  ignored = truth == SECRET_NUM
+  copy = inpt.copy()
+
+  masked = Cost_layer(input_shape=inpt.shape, cost_type=cl.cost_type.masked)
+  masked.forward(inpt, truth)
+
+  mse = Cost_layer(input_shape=inpt.shape, cost_type=cl.cost_type.mse)
+  mse.forward(inpt, np.where(ignored, inpt, truth))
+
+  np.testing.assert_array_equal(inpt, copy)
+
+  assert np.all(masked.output[ignored] == 0.)
+  assert np.all(masked.delta[ignored] == 0.)
+
+  np.testing.assert_allclose(masked.output, mse.output)
+  np.testing.assert_allclose(masked.delta, mse.delta)
+  np.testing.assert_allclose(masked.cost, mse.cost)
+
+  delta = np.zeros(shape=inpt.shape, dtype=float)
+  masked.backward(delta)
+
+  assert np.all(delta[ignored] == 0.)
+
+
 if __name__ == '__main__':
 
   test_cost_layer()
+  test_cost_masked()
@@ -0,0 +1,58 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+
+from NumPyNet.layers.globalavgpool_layer import GlobalAvgpool_layer
+from NumPyNet.layers.avgpool_layer import Avgpool_layer
+
+import numpy as np
+from hypothesis import strategies as st
+from hypothesis import given, settings
+
+__author__ = ['Mattia Ceccarelli', 'Nico Curti']
+__email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
+__package__ = 'Global AvgPool Layer testing'
+
+@given(batch = st.integers(min_value=1, max_value=15),
+       w     = st.integers(min_value=1, max_value=30),
+       h     = st.integers(min_value=1, max_value=30),
+       c     = st.integers(min_value=1, max_value=10))
+@settings(max_examples=10,
+          deadline=None)
+def test_globalavgpool_layer(batch, w, h, c):
+  '''
+  Tests:
+    if the global avgpool forward and backward are the same as the avgpool
+    with a kernel as large as the image
+  '''
+
+  inpt = np.random.uniform(low=0., high=1., size=(batch, w, h, c))
+
+  numpynet = GlobalAvgpool_layer(input_shape=inpt.shape)
+  reference = Avgpool_layer(size=(w, h), stride=(w, h))
+
+  assert numpynet.out_shape == (batch, 1, 1, c)
+
+  numpynet.forward(inpt)
+  reference.forward(inpt)
+
+  assert numpynet.output.shape == numpynet.out_shape
+  assert np.allclose(numpynet.output, reference.output)
+
+  numpynet.delta = np.random.uniform(low=0., high=1., size=numpynet.out_shape)
+  reference.delta = numpynet.delta.copy()
+
+  delta = np.random.uniform(low=0., high=1., size=inpt.shape)
+  delta_check = delta.copy()
+
+  numpynet.backward(delta)
+  reference.backward(delta_check)
+
+  assert np.allclose(delta, delta_check)
+
+
+if __name__ == '__main__':
+
+  test_globalavgpool_layer()
@@ -9,6 +9,7 @@ import tensorflow as tf
 
 from NumPyNet.layers.maxpool_layer import Maxpool_layer
 
+import itertools
 import numpy as np
 from hypothesis import strategies as st
 from hypothesis import given, settings
@@ -88,8 +89,164 @@ def test_maxpool_layer(batch, w, h, c, size, stride, pad):
   assert delta.shape == inpt.shape
   assert np.allclose(delta, delta_keras, atol=1e-8)
 
+@given(batch    = st.integers(min_value=1, max_value=3),
+       w        = st.integers(min_value=15, max_value=30),
+       h        = st.integers(min_value=15, max_value=30),
+       c        = st.integers(min_value=1, max_value=3),
+       size     = st.integers(min_value=2, max_value=3),
+       stride   = st.integers(min_value=1, max_value=3),
+       dilation = st.integers(min_value=1, max_value=3))
+@settings(max_examples=10,
+          deadline=None)
+def test_maxpool_dilation(batch, w, h, c, size, stride, dilation):
+  '''
+  Tests:
+    if the NumPyNet maxpool layer with dilated kernel is the same as the
+    maximum over the dilated windows, both in forward and backward
+  '''
+
+  inpt = np.random.uniform(low=0., high=1., size=(batch, w, h, c))
+
+  numpynet = Maxpool_layer(size=size, stride=stride, padding=False, dilation=dilation)
+  numpynet.forward(inpt)
+
+  extent = dilation * (size - 1) + 1
+  out_w = (w - extent) // stride + 1
+  out_h = (h - extent) // stride + 1
+
+  assert numpynet.out_shape == (batch, out_w, out_h, c)
+
+  numpynet.delta = np.random.uniform(low=0., high=1., size=numpynet.out_shape)
+  delta = np.zeros(shape=inpt.shape, dtype=float)
+  numpynet.backward(delta)
+
+  forward_out = np.empty(shape=(batch, out_w, out_h, c), dtype=float)
+  delta_check = np.zeros(shape=inpt.shape, dtype=float)
+
+  for b, i, j, k in itertools.product(range(batch), range(out_w), range(out_h), range(c)):
+    window = inpt[b, i * stride : i * stride + extent : dilation, j * stride : j * stride + extent : dilation, k]
+    x, y = np.unravel_index(np.argmax(window), window.shape)
+    forward_out[b, i, j, k] = window[x, y]
+    delta_check[b, i * stride + x * dilation, j * stride + y * dilation, k] += numpynet.delta[b, i, j, k]
+
+  assert np.allclose(numpynet.output, forward_out)
+  assert np.allclose(delta, delta_check)
+
+@given(batch  = st.integers(min_value=1, max_value=3),
+       w      = st.integers(min_value=10, max_value=30),
+       h      = st.integers(min_value=10, max_value=30),
+       c      = st.integers(min_value=1, max_value=3),
+       size   = st.integers(min_value=1, max_value=5),
+       stride = st.integers(min_value=1, max_value=3),
+       pad    = st.booleans())
+@settings(max_examples=10,
+          deadline=None)
+def test_maxpool_indexes(batch, w, h, c, size, stride, pad):
+  '''
+  Tests:
+    if the indexes of the maxima are stored as compact integers inside the window
+    if the backward accumulates the delta of the overlapping windows, with and without padding
+  '''
+
+  inpt = np.random.uniform(low=0., high=1., size=(batch, w, h, c))
+
+  numpynet = Maxpool_layer(size=size, stride=stride, padding=pad)
+  numpynet.forward(inpt)
+
+  assert numpynet.indexes.dtype == np.int8
+  assert numpynet.indexes.shape == numpynet.out_shape
+
+  numpynet.delta = np.random.uniform(low=0., high=1., size=numpynet.out_shape)
+  delta = np.random.uniform(low=0., high=1., size=inpt.shape)
+  delta_check = delta.copy()
+  numpynet.backward(delta)
+
+  _, out_w, out_h, _ = numpynet.out_shape
+
+  for b, i, j, k in itertools.product(range(batch), range(out_w), range(out_h), range(c)):
+    x, y = divmod(int(numpynet.indexes[b, i, j, k]), size)
+    x = i * stride + x - numpynet.pad_top
+    y = j * stride + y - numpynet.pad_left
+    assert inpt[b, x, y, k] == numpynet.output[b, i, j, k]
+    delta_check[b, x, y, k] += numpynet.delta[b, i, j, k]
+
+  assert np.allclose(delta, delta_check)
+
+@given(batch  = st.integers(min_value=1, max_value=3),
+       w      = st.integers(min_value=10, max_value=30),
+       h      = st.integers(min_value=10, max_value=30),
+       c      = st.integers(min_value=1, max_value=3),
+       size   = st.integers(min_value=1, max_value=4),
+       pad    = st.booleans())
+@settings(max_examples=10,
+          deadline=None)
+def test_maxpool_non_overlapping(batch, w, h, c, size, pad):
+  '''
+  Tests:
+    if the max pool with size == stride chooses the first maximum of every window,
+    also with repeated values, both in forward and backward
+  '''
+
+  inpt = np.random.uniform(low=0., high=1., size=(batch, w, h, c))
+  inpt[inpt < .5] = 0. # repeated maxima, as after a Relu activation
+
+  numpynet = Maxpool_layer(size=size, stride=size, padding=pad)
+  numpynet.forward(inpt)
+
+  numpynet.delta = np.random.uniform(low=0., high=1., size=numpynet.out_shape)
+  delta = np.random.uniform(low=0., high=1., size=inpt.shape)
+  delta_check = delta.copy()
+  numpynet.backward(delta)
+
+  forward_out = np.empty(shape=numpynet.out_shape, dtype=float)
+  _, out_w, out_h, _ = numpynet.out_shape
+
+  for b, i, j, k in itertools.product(range(batch), range(out_w), range(out_h), range(c)):
+    x = max(i * size - numpynet.pad_top, 0)
+    y = max(j * size - numpynet.pad_left, 0)
+    window = inpt[b, x : (i + 1) * size - numpynet.pad_top, y : (j + 1) * size - numpynet.pad_left, k]
+    dx, dy = np.unravel_index(np.argmax(window), window.shape)
+    forward_out[b, i, j, k] = window[dx, dy]
+    delta_check[b, x + dx, y + dy, k] += numpynet.delta[b, i, j, k]
+
+  assert np.allclose(numpynet.output, forward_out)
+  assert np.allclose(delta, delta_check)
+
+@given(batch  = st.integers(min_value=1, max_value=3),
+       w      = st.integers(min_value=10, max_value=30),
+       h      = st.integers(min_value=10, max_value=30),
+       c      = st.integers(min_value=1, max_value=3),
+       size   = st.integers(min_value=1, max_value=4),
+       stride = st.integers(min_value=1, max_value=4),
+       pad    = st.booleans())
+@settings(max_examples=10,
+          deadline=None)
+def test_maxpool_inference(batch, w, h, c, size, stride, pad):
+  '''
+  Tests:
+    if the max pool in inference mode gives the same output of the training mode
+    without storing the indexes and the delta
+  '''
+
+  inpt = np.random.uniform(low=0., high=1., size=(batch, w, h, c))
+
+  numpynet = Maxpool_layer(size=size, stride=stride, padding=pad)
+  numpynet.forward(inpt)
+  forward_out = numpynet.output.copy()
+
+  numpynet.trainable = False
+  numpynet.forward(inpt)
+
+  assert np.allclose(numpynet.output, forward_out)
+  assert numpynet.indexes is None
+  assert numpynet.delta is None
+
 if __name__ == '__main__':
   test_maxpool_layer()
+  test_maxpool_dilation()
+  test_maxpool_indexes()
+  test_maxpool_non_overlapping()
+  test_maxpool_inference()
 
   
   
@@ -0,0 +1,893 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+
+from NumPyNet.network import Network
+from NumPyNet.layers.activation_layer import Activation_layer
+from NumPyNet.layers.avgpool_layer import Avgpool_layer
+from NumPyNet.layers.batchnorm_layer import BatchNorm_layer
+from NumPyNet.layers.connected_layer import Connected_layer
+from NumPyNet.layers.convolutional_layer import Convolutional_layer
+from NumPyNet.layers.cost_layer import Cost_layer
+from NumPyNet.layers.dropout_layer import Dropout_layer
+from NumPyNet.layers.globalavgpool_layer import GlobalAvgpool_layer
+from NumPyNet.layers.maxpool_layer import Maxpool_layer
+from NumPyNet.layers.route_layer import Route_layer
+from NumPyNet.layers.shortcut_layer import Shortcut_layer
+from NumPyNet.optimizer import Adam
+from NumPyNet.optimizer import SGD
+from NumPyNet.exception import NetworkError
+from NumPyNet.exception import LayerError
+
+import os
+import copy
+import tempfile
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+__author__ = ['Mattia Ceccarelli', 'Nico Curti']
+__email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
+__package__ = 'Network model testing'
+
+
+def _build_network(batch=4, **kwargs):
+  '''
+  Small convolutional model used by the tests, with fixed weights initialization
+  '''
+  np.random.seed(123)
+
+  model = Network(batch=batch, input_shape=(8, 8, 3), **kwargs)
+  model.add(Convolutional_layer(input_shape=(batch, 8, 8, 3), filters=4, size=3, stride=1, pad=True, activation='Relu'))
+  model.add(Maxpool_layer(size=2, stride=2))
+  model.add(Activation_layer(activation='Logistic'))
+  model.add(Connected_layer(input_shape=(batch, 4, 4, 4), outputs=5, activation='Linear'))
+  model.add(Cost_layer(input_shape=(batch, 1, 1, 5), cost_type='mse'))
+  model.compile(optimizer=Adam)
+
+  return model
+
+
+def test_network_dtype():
+  '''
+  Tests:
+    if the parameters, outputs, deltas and updates of every layer follow the
+    network dtype during the training
+    if the float16 storage keeps the outputs in float16 and the deltas and
+    parameters in float32, with results close to the float64 ones
+    if wrong dtypes raise ValueError
+  '''
+  np.random.seed(123)
+
+  X = np.random.uniform(low=0., high=1., size=(8, 8, 8, 3))
+  y = np.random.uniform(low=0., high=1., size=(8, 1, 1, 5))
+
+  outputs = []
+
+  for dtype, storage_dtype in [(np.float64, None), (np.float32, None), (np.float32, np.float16)]:
+
+    model = _build_network(dtype=dtype, storage_dtype=storage_dtype)
+    model.fit(X, y, max_iter=2, shuffle=False)
+
+    out = model._forward(X[:4], truth=y[:4])
+    assert out.dtype == dtype
+
+    for layer in model:
+
+      assert layer.output.dtype == (storage_dtype or dtype)
+      assert layer.delta.dtype == dtype
+
+      if hasattr(layer, 'weights'):
+        assert layer.weights.dtype == dtype
+        assert layer.bias.dtype == dtype
+        assert layer.weights_update.dtype == dtype
+
+    outputs.append(out)
+
+  out64, out32, out16 = outputs
+
+  assert np.allclose(out64, out32, atol=1e-5)
+  assert np.allclose(out64, out16, atol=1e-2)
+
+  with pytest.raises(ValueError):
+    model = Network(batch=1, dtype=int)
+
+  with pytest.raises(ValueError):
+    model = Network(batch=1, dtype=np.float16, storage_dtype=np.float32)
+
+
+def test_network_fuse():
+  '''
+  Tests:
+    if the BatchNorm layers are folded into the previous Convolutional and Connected
+    layers and the fused model reproduces the inference with the running statistics
+    if the BatchNorm layers which cannot be folded are kept
+    if fit restores the original model
+  '''
+  np.random.seed(123)
+
+  batch = 4
+  epsil = 1e-8
+
+  X = np.random.uniform(low=0., high=1., size=(8, 8, 8, 3))
+  y = np.random.uniform(low=0., high=1., size=(8, 1, 1, 5))
+
+  model = Network(batch=batch, input_shape=(8, 8, 3), dtype=np.float64)
+  model.add(Convolutional_layer(input_shape=(batch, 8, 8, 3), filters=4, size=3, stride=1, pad=True, activation='Linear'))
+  model.add(BatchNorm_layer())
+  model.add(Activation_layer(activation='Relu'))
+  model.add(Convolutional_layer(input_shape=(batch, 8, 8, 4), filters=4, size=3, stride=2, pad=True, activation='Linear'))
+  model.add(BatchNorm_layer())
+  model.add(Activation_layer(activation='Logistic'))
+  model.add(Connected_layer(input_shape=(batch, 4, 4, 4), outputs=5, activation='Linear'))
+  model.add(BatchNorm_layer(scales=np.random.uniform(low=.5, high=1.5, size=(1, 1, 5)),
+                            bias=np.random.uniform(low=-1., high=1., size=(1, 1, 5))))
+  model.add(Cost_layer(input_shape=(batch, 1, 1, 5), cost_type='mse'))
+  model.compile(optimizer=Adam)
+
+  model.fit(X, y, max_iter=2, shuffle=False)
+
+  layers = list(model._net)
+  first_bn, second_bn, last_bn = (layers[2], layers[5], layers[8])
+
+  # the parameters and statistics of the first BatchNorm are the same for every pixel of each channel
+  for param in ('scales', 'bias', 'rolling_mean', 'rolling_var'):
+    value = getattr(first_bn, param)
+    setattr(first_bn, param, np.broadcast_to(value.mean(axis=(0, 1)), value.shape))
+
+  # reference inference with the running statistics of the folded layers
+  out = X[:batch]
+  for layer in layers[1:-1]:
+
+    if layer is first_bn or layer is last_bn:
+      out = (out - layer.rolling_mean) / np.sqrt(layer.rolling_var + epsil)
+      out = out * layer.scales if layer.scales is not None else out
+      out = out + layer.bias if layer.bias is not None else out
+
+    else:
+      layer.forward(inpt=out)
+      out = layer.output
+
+  weights = [(layer.weights.copy(), layer.bias.copy()) for layer in layers if hasattr(layer, 'weights')]
+
+  model.fuse(epsil=epsil)
+
+  # the second BatchNorm has different statistics for every pixel
+  assert model.num_layers == len(layers) - 2
+  assert first_bn not in model._net
+  assert second_bn in model._net
+  assert last_bn not in model._net
+
+  model._forward(X[:batch])
+  assert np.allclose(model._net[-2].output, out, atol=1e-8)
+
+  model.fit(X, y, max_iter=0)
+
+  assert model._net == layers
+  assert not model._fused
+
+  for layer, (w, b) in zip([layer for layer in layers if hasattr(layer, 'weights')], weights):
+    np.testing.assert_allclose(layer.weights, w)
+    np.testing.assert_allclose(layer.bias, b)
+
+
+def test_network_load_global_avgpool():
+  '''
+  Tests:
+    if the darknet avgpool section without size is loaded as a global average pool
+    and the avgpool section with size as an average pool
+  '''
+
+  cfg = '\n'.join(['[net]', 'batch=2', 'width=8', 'height=8', 'channels=3', '',
+                   '[convolutional]', 'filters=4', 'size=3', 'stride=1', 'pad=1', 'activation=Relu', '',
+                   '[avgpool]', 'size=2', 'stride=2', '',
+                   '[avgpool]', ''])
+
+  with tempfile.TemporaryDirectory() as tmp:
+
+    cfg_filename = os.path.join(tmp, 'global.cfg')
+
+    with open(cfg_filename, 'w') as fp:
+      fp.write(cfg)
+
+    model = Network(batch=2)
+    model.load(cfg_filename)
+
+  assert type(model[2]) is Avgpool_layer
+  assert type(model[3]) is GlobalAvgpool_layer
+  assert model[3].out_shape == (2, 1, 1, 4)
+
+
+def test_network_plan():
+  '''
+  Tests:
+    if compile builds the execution plan with the resolved call signatures
+    if the forward and backward over the plan match the layer by layer computation
+    if the plan is rebuilt when the layers of the model change
+  '''
+  np.random.seed(123)
+
+  batch = 4
+
+  X = np.random.uniform(low=0., high=1., size=(batch, 8, 8, 3))
+  y = np.random.uniform(low=0., high=1., size=(batch, 1, 1, 5))
+
+  model = _build_network(batch=batch, dtype=np.float64)
+  plan = model._plan
+
+  assert len(plan) == model.num_layers - 1
+  assert [step.layer for step in plan] == model._net[1:]
+  assert [step.inputs for step in plan] == [(layer, ) for layer in model._net[:-1]]
+  assert not any(shared for step in plan for shared in step.shared)
+  assert [step.with_truth for step in plan] == [False, False, False, False, True]
+  assert [step.backward_inpt for step in plan] == [False, False, False, True, False]
+  assert [step.cast for step in plan] == [False, True, True, False, True]
+  assert not any(step.forward_network or step.backward_network for step in plan)
+
+  # reference computation layer by layer on a copy of the model
+  layers = copy.deepcopy(model._net)
+
+  out = X
+  for layer in layers[1:-1]:
+    layer.forward(inpt=out)
+    out = layer.output
+
+  layers[-1].forward(inpt=out, truth=y)
+  out, loss = (layers[-1].output, layers[-1].cost)
+
+  for i in reversed(range(2, len(layers))):
+
+    if hasattr(layers[i], 'weights'):
+      layers[i].backward(inpt=layers[i - 1].output, delta=layers[i - 1].delta)
+    else:
+      layers[i].backward(delta=layers[i - 1].delta)
+
+    if hasattr(layers[i], 'update'):
+      layers[i].update()
+
+  layers[1].backward(delta=np.zeros(shape=X.shape))
+  layers[1].update()
+
+  assert np.allclose(model._forward(X, truth=y), out)
+  assert np.isclose(model._get_loss(), loss)
+
+  model._backward(X)
+
+  for layer, ref in zip(model._net, layers):
+    if hasattr(layer, 'weights'):
+      assert np.allclose(layer.weights, ref.weights)
+      assert np.allclose(layer.bias, ref.bias)
+
+  model.add(Activation_layer(activation='Linear'))
+  assert model._plan is None
+
+  model._forward(X)
+  assert len(model._plan) == model.num_layers - 1
+
+
+def test_network_eval():
+  '''
+  Tests:
+    if in inference mode the layers store neither the deltas nor the backward state
+    if Dropout is the identity and BatchNorm normalizes with the running statistics
+    if the backward raises NetworkError until the model is set back in training mode
+  '''
+  np.random.seed(123)
+
+  batch = 4
+  epsil = 1e-8
+
+  X = np.random.uniform(low=0., high=1., size=(8, 8, 8, 3))
+  y = np.random.uniform(low=0., high=1., size=(8, 1, 1, 5))
+
+  model = Network(batch=batch, input_shape=(8, 8, 3), dtype=np.float64)
+  model.add(Convolutional_layer(input_shape=(batch, 8, 8, 3), filters=4, size=3, stride=1, pad=True, activation='Relu'))
+  model.add(BatchNorm_layer())
+  model.add(Dropout_layer(prob=.5))
+  model.add(Maxpool_layer(size=2, stride=2))
+  model.add(Connected_layer(input_shape=(batch, 4, 4, 4), outputs=5, activation='Linear'))
+  model.add(Cost_layer(input_shape=(batch, 1, 1, 5), cost_type='mse'))
+  model.compile(optimizer=Adam)
+
+  model.fit(X, y, max_iter=2, shuffle=False)
+
+  conv, bn, dropout, maxpool, conn, cost = model._net[1:]
+
+  # reference inference
+  conv.forward(X[:batch])
+  out = (conv.output - bn.rolling_mean) / np.sqrt(bn.rolling_var + epsil) * bn.scales + bn.bias
+  maxpool.forward(out)
+  conn.forward(maxpool.output)
+  cost.forward(conn.output, truth=y[:batch])
+  loss = cost.cost / batch
+
+  rolling_mean = bn.rolling_mean.copy()
+
+  model.eval()
+  assert all(not layer.trainable for layer in model._net)
+
+  assert np.isclose(model.evaluate(X[:batch], truth=y[:batch])[0], loss)
+
+  assert np.allclose(bn.rolling_mean, rolling_mean)
+  assert conv.view is None
+  assert maxpool.indexes is None
+  assert all(layer.delta is None for layer in model._net[1:-1])
+
+  with pytest.raises(NetworkError):
+    model._backward(X[:batch])
+
+  model.train()
+  assert all(layer.trainable for layer in model._net)
+
+  model._forward(X[:batch], truth=y[:batch])
+  model._backward(X[:batch])
+
+  assert all(layer.delta is not None for layer in model._net[1:])
+
+
+def test_network_memory():
+  '''
+  Tests:
+    if the liveness of the outputs follows the layers read by the Route_layer
+    if the estimated peak memory is the widest set of outputs alive at the same time
+    if in inference mode the outputs are released after their last reader
+  '''
+  np.random.seed(123)
+
+  batch = 2
+  X = np.random.uniform(low=-1., high=1., size=(batch, 4, 4, 3))
+
+  model = Network(batch=batch, input_shape=(4, 4, 3), dtype=np.float64)
+  model.add(Activation_layer(activation='Relu'))
+  model.add(Activation_layer(activation='Logistic'))
+  model.add(Route_layer(input_layers=(1, 2), by_channels=True))
+  model.add(Activation_layer(activation='Linear'))
+  model.compile()
+
+  size = X.nbytes # outputs of the first two layers, the other two are twice as large
+
+  assert model._liveness() == [1, 3, 3, 4, 4]
+  assert [len(step.release) for step in model._plan] == [0, 0, 2, 1]
+
+  assert model._peak_bytes == 4 * size
+
+  out = model._forward(X).copy()
+  assert all(layer.output is not None for layer in model._net[1:])
+
+  model.eval()
+  assert np.allclose(model._forward(X), out)
+  assert [layer.output is None for layer in model._net[1:]] == [True, True, True, False]
+
+
+def test_network_zero_copy():
+  '''
+  Tests:
+    if the batches of fit and the input of the forward are views of the data, without copies
+    if the layers do not modify the input and the truth (ex. the Cost_layer smoothing)
+  '''
+  np.random.seed(123)
+
+  batch = 4
+
+  X = np.random.uniform(low=0., high=1., size=(8, 8, 8, 3))
+  y = np.random.uniform(low=0., high=1., size=(8, 1, 1, 5))
+  X_copy, y_copy = (X.copy(), y.copy())
+
+  model = Network(batch=batch, input_shape=(8, 8, 3), dtype=np.float64)
+  model.add(Convolutional_layer(input_shape=(batch, 8, 8, 3), filters=4, size=3, stride=1, pad=False, activation='Relu'))
+  model.add(Activation_layer(activation='Logistic'))
+  model.add(Connected_layer(input_shape=(batch, 6, 6, 4), outputs=5, activation='Linear'))
+  model.add(Cost_layer(input_shape=(batch, 1, 1, 5), cost_type='mse', smoothing=.1))
+  model.compile(optimizer=Adam)
+
+  model.fit(X, y, max_iter=2, shuffle=True)
+
+  # without padding the strided view of the convolution reads the data of the last batch
+  assert np.shares_memory(model._net[1].view, X)
+
+  model._forward(X[:batch], truth=y[:batch])
+  assert np.shares_memory(model._net[1].view, X)
+
+  np.testing.assert_array_equal(X, X_copy)
+  np.testing.assert_array_equal(y, y_copy)
+
+
+def test_network_graph():
+  '''
+  Tests:
+    if the edges of the graph follow the input layers of the Shortcut and Route layers
+    if the deltas of the layers read more than once are accumulated, comparing the weights
+    updates with the numerical derivatives of the loss
+  '''
+  np.random.seed(123)
+
+  batch = 2
+  eps = 1e-6
+
+  X = np.random.uniform(low=-1., high=1., size=(batch, 6, 6, 3))
+  y = np.random.uniform(low=0., high=1., size=(batch, 1, 1, 5))
+
+  model = Network(batch=batch, input_shape=(6, 6, 3), dtype=np.float64)
+  model.add(Convolutional_layer(input_shape=(batch, 6, 6, 3), filters=4, size=3, stride=1, pad=True, activation='Logistic'))
+  model.add(Convolutional_layer(input_shape=(batch, 6, 6, 4), filters=4, size=3, stride=1, pad=True, activation='Linear'))
+  model.add(Shortcut_layer(activation='Tanh', alpha=1., beta=.5, input_layers=(-1, -2)))
+  model.add(Route_layer(input_layers=(1, 3), by_channels=True))
+  model.add(Connected_layer(input_shape=(batch, 6, 6, 8), outputs=5, activation='Linear'))
+  model.add(Cost_layer(input_shape=(batch, 1, 1, 5), cost_type='mse'))
+  # the weights are not updated, so the updates are the derivatives of the loss
+  model.compile(optimizer=partial(SGD, lr=0.))
+
+  layers = model._net
+  assert [[layers.index(layer) for layer in step.inputs] for step in model._plan] == [[0], [1], [2, 1], [1, 3], [4], [5]]
+  assert [step.shared for step in model._plan] == [(False, ), (True, ), (False, True), (True, False), (False, ), (False, )]
+
+  model._forward(X, truth=y)
+  model._backward(X)
+
+  for layer in (layers[1], layers[2]):
+
+    weights_update = layer.weights_update.copy()
+
+    for idx in np.ndindex(*layer.weights.shape[:2]):
+
+      idx = idx + (0, 1)
+      w = layer.weights[idx]
+      loss = []
+
+      for value in (w + eps, w - eps):
+        layer.weights[idx] = value
+        model._reset_cache(layer)
+        model._forward(X, truth=y)
+        loss.append(model._get_loss())
+
+      layer.weights[idx] = w
+      model._reset_cache(layer)
+
+      assert np.isclose((loss[0] - loss[1]) / (2. * eps), weights_update[idx], atol=1e-7)
+
+
+def test_network_shortcut_shapes():
+  '''
+  Tests:
+    if the Shortcut layers combine inputs of different sizes and channels, downsampling and
+    upsampling the second input, in fit and predict
+    if the weights updates through them match the numerical derivatives of the loss
+    if the inputs with different width and height ratios are rejected
+  '''
+  np.random.seed(123)
+
+  batch = 2
+  eps = 1e-6
+
+  X = np.random.uniform(low=-1., high=1., size=(2 * batch, 8, 8, 3))
+  y = np.random.uniform(low=0., high=1., size=(2 * batch, 1, 1, 5))
+
+  model = Network(batch=batch, input_shape=(8, 8, 3))
+  model.add(Convolutional_layer(input_shape=(batch, 8, 8, 3), filters=4, size=3, stride=1, pad=True, activation='Logistic', algorithm='gemm'))
+  model.add(Maxpool_layer(size=2, stride=2))
+  model.add(Convolutional_layer(input_shape=(batch, 4, 4, 4), filters=2, size=1, stride=1, pad=False, activation='Linear'))
+  # downsampling: the 8 x 8 x 4 output of the first layer is added on the 4 x 4 x 2 one
+  model.add(Shortcut_layer(activation='Tanh', alpha=1., beta=.5, input_layers=(-1, 1)))
+  # upsampling: the 4 x 4 x 2 output is added on every other pixel of the 8 x 8 x 4 one
+  model.add(Shortcut_layer(activation='Linear', alpha=.5, beta=1., input_layers=(1, -1)))
+  model.add(Connected_layer(input_shape=(batch, 8, 8, 4), outputs=5, activation='Linear'))
+  model.add(Cost_layer(input_shape=(batch, 1, 1, 5), cost_type='mse'))
+  # the weights are not updated, so the updates are the derivatives of the loss
+  model.compile(optimizer=partial(SGD, lr=0.))
+
+  layers = model._net
+  assert layers[4].out_shape == (batch, 4, 4, 2)
+  assert layers[5].out_shape == (batch, 8, 8, 4)
+
+  model._forward(X[:batch], truth=y[:batch])
+  model._backward(X[:batch])
+
+  for layer in (layers[1], layers[3]):
+
+    weights_update = layer.weights_update.copy()
+
+    for idx in np.ndindex(*layer.weights.shape[:2]):
+
+      idx = idx + (0, 1)
+      w = layer.weights[idx]
+      loss = []
+
+      for value in (w + eps, w - eps):
+        layer.weights[idx] = value
+        model._forward(X[:batch], truth=y[:batch])
+        loss.append(model._get_loss())
+
+      layer.weights[idx] = w
+
+      assert np.isclose((loss[0] - loss[1]) / (2. * eps), weights_update[idx], atol=1e-7)
+
+  model.compile(optimizer=Adam)
+  model.fit(X, y, max_iter=1)
+
+  out = model.predict(X, truth=y)
+  assert out.shape == y.shape and np.all(np.isfinite(out))
+
+  with pytest.raises(LayerError):
+    Shortcut_layer(input_layers=(0, 1))._stride_index((batch, 4, 4, 2), (batch, 2, 4, 2))
+
+
+def test_network_workers():
+  '''
+  Tests:
+    if the model computed by more workers gives the same outputs and updates of the sequential one
+    if every layer starts after its input layers in forward and after its readers in backward
+    if the outputs are released after their last reader in inference mode
+  '''
+  np.random.seed(123)
+
+  batch = 2
+
+  X = np.random.uniform(low=-1., high=1., size=(batch, 6, 6, 3))
+  y = np.random.uniform(low=0., high=1., size=(batch, 1, 1, 5))
+
+  with pytest.raises(ValueError):
+    Network(batch=batch, input_shape=(6, 6, 3), workers=0)
+
+  model = Network(batch=batch, input_shape=(6, 6, 3), dtype=np.float64)
+  model.add(Convolutional_layer(input_shape=(batch, 6, 6, 3), filters=4, size=3, stride=1, pad=True, activation='Relu'))
+  # two independent branches on the output of the first layer
+  model.add(Convolutional_layer(input_shape=(batch, 6, 6, 4), filters=4, size=3, stride=1, pad=True, activation='Logistic'))
+  model.add(Maxpool_layer(size=2, stride=2))
+  model.add(Route_layer(input_layers=(1, )))
+  model.add(Convolutional_layer(input_shape=(batch, 6, 6, 4), filters=4, size=3, stride=2, pad=True, activation='Tanh'))
+  model.add(Shortcut_layer(activation='Linear', alpha=1., beta=1., input_layers=(-1, 3)))
+  model.add(Connected_layer(input_shape=(batch, 3, 3, 4), outputs=5, activation='Linear'))
+  model.add(Cost_layer(input_shape=(batch, 1, 1, 5), cost_type='mse'))
+  model.compile(optimizer=partial(SGD, lr=.1))
+
+  parallel = copy.deepcopy(model)
+  parallel.workers = 4
+
+  for _ in range(3):
+    out = model._forward(X, truth=y)
+    model._backward(X)
+
+    assert np.allclose(parallel._forward(X, truth=y), out)
+    assert np.isclose(parallel._get_loss(), model._get_loss())
+    parallel._backward(X)
+
+  for layer, ref in zip(parallel._net, model._net):
+    if hasattr(layer, 'weights'):
+      assert np.allclose(layer.weights, ref.weights)
+      assert np.allclose(layer.bias, ref.bias)
+
+  forward, backward = (parallel.layer_times['forward'], parallel.layer_times['backward'])
+
+  assert forward.shape == backward.shape == (parallel.num_layers, 2)
+  assert np.all(forward[1:, 0] <= forward[1:, 1])
+
+  for step in parallel._plan:
+    assert all(forward[step.index, 0] >= forward[j, 1] for j in step.sources if j)
+    assert all(backward[step.index, 0] >= backward[j, 1] for j in step.readers)
+
+  assert parallel.concurrency('forward') > 0.
+  assert parallel.concurrency('backward') > 0.
+
+  parallel.eval()
+  model.eval()
+
+  assert np.allclose(parallel._forward(X, truth=y), model._forward(X, truth=y))
+  assert all(layer.output is None for layer in parallel._net[1:-1])
+
+  with pytest.raises(NetworkError):
+    Network(batch=batch).concurrency('forward')
+
+
+def test_network_predict_batches():
+  '''
+  Tests:
+    if the prediction in chunks, also by more workers, matches the prediction of the whole input
+    if the workers leave the layers of the model unchanged
+  '''
+  np.random.seed(123)
+
+  batch = 4
+  num_data = 11
+
+  X = np.random.uniform(low=0., high=1., size=(num_data, 8, 8, 3))
+  y = np.random.uniform(low=0., high=1., size=(num_data, 1, 1, 5))
+
+  model = _build_network(batch=batch, dtype=np.float64)
+  model._fitted = True
+  model.eval()
+
+  expected = model.predict(X, truth=y).copy()
+  output = model._net[-1].output
+
+  with pytest.raises(ValueError):
+    model.predict(X, batch_size=0)
+
+  with pytest.raises(ValueError):
+    model.predict(X, batch_size=batch, workers=0)
+
+  for workers in (None, 3):
+    model._net[-1].output = output
+
+    out = model.predict(X, truth=y, batch_size=batch, workers=workers)
+
+    assert out.shape == expected.shape
+    np.testing.assert_allclose(out, expected)
+
+  # the replicas store their own outputs
+  assert model._net[-1].output is output
+
+
+def test_network_predict_replicas():
+  '''
+  Tests:
+    if the concurrent chunks give the sequential prediction with the convolutions which fill
+    their buffers in place (gemm im2col and pointwise), i.e. if the replicas do not share them
+  '''
+  np.random.seed(123)
+
+  batch = 8
+  num_data = 64
+
+  X = np.random.uniform(low=0., high=1., size=(num_data, 16, 16, 8))
+
+  model = Network(batch=batch, input_shape=(16, 16, 8), dtype=np.float64)
+  model.add(Convolutional_layer(input_shape=(batch, 16, 16, 8), filters=16, size=5, stride=1, pad=True, activation='Relu', algorithm='gemm'))
+  model.add(Convolutional_layer(input_shape=(batch, 16, 16, 16), filters=8, size=1, stride=1, pad=False, activation='Linear'))
+  model.compile(optimizer=Adam)
+  model._fitted = True
+  model.eval()
+
+  # the buffers of the model have the shape of the chunks
+  expected = model.predict(X, batch_size=batch)
+  replica = model._replica()
+
+  assert replica._net[1]._col is None and replica._net[1].weights is model._net[1].weights
+
+  for _ in range(4):
+    out = model.predict(X, batch_size=batch, workers=4)
+    np.testing.assert_allclose(out, expected)
+
+
+def test_network_infer():
+  '''
+  Tests:
+    if the concurrent inferences on the same model give the results of the sequential predictions
+    if the contexts share the parameters of the model without modifying its layers
+  '''
+  np.random.seed(123)
+
+  batch = 4
+
+  X = [np.random.uniform(low=0., high=1., size=(batch, 8, 8, 3)) for _ in range(8)]
+
+  model = Network(batch=batch, input_shape=(8, 8, 3), dtype=np.float64)
+  model.add(Convolutional_layer(input_shape=(batch, 8, 8, 3), filters=4, size=3, stride=1, pad=True, activation='Relu'))
+  model.add(BatchNorm_layer())
+  model.add(Maxpool_layer(size=2, stride=2))
+  model.add(Connected_layer(input_shape=(batch, 4, 4, 4), outputs=5, activation='Logistic'))
+  model.compile(optimizer=Adam)
+  model._fitted = True
+
+  # running statistics of the BatchNorm layer
+  model._forward(X[0])
+  model.eval()
+
+  expected = [model.predict(x).copy() for x in X]
+
+  model.train()
+  outputs = [layer.output for layer in model._net]
+
+  context = model.context()
+
+  assert not context.trainable and model.trainable
+  assert all(layer.weights is ref.weights for layer, ref in zip(context._net, model._net) if hasattr(layer, 'weights'))
+
+  with ThreadPoolExecutor(max_workers=4) as pool:
+    results = list(pool.map(model.infer, X))
+
+  for out, ref in zip(results, expected):
+    np.testing.assert_allclose(out, ref)
+
+  assert all(layer.output is out for layer, out in zip(model._net, outputs))
+  assert all(layer.trainable for layer in model._net)
+
+
+def test_network_infer_replicas():
+  '''
+  Tests:
+    if the concurrent inferences on the same model and on the same context give the sequential
+    predictions with the convolutions which fill their buffers in place (gemm im2col and pointwise)
+  '''
+  np.random.seed(123)
+
+  batch = 8
+
+  X = [np.random.uniform(low=0., high=1., size=(batch, 16, 16, 8)) for _ in range(16)]
+
+  model = Network(batch=batch, input_shape=(16, 16, 8), dtype=np.float64)
+  model.add(Convolutional_layer(input_shape=(batch, 16, 16, 8), filters=16, size=5, stride=1, pad=True, activation='Relu', algorithm='gemm'))
+  model.add(Convolutional_layer(input_shape=(batch, 16, 16, 16), filters=8, size=1, stride=1, pad=False, activation='Linear'))
+  model.compile(optimizer=Adam)
+  model._fitted = True
+  model.eval()
+
+  # the buffers of the model have the shape of the inputs
+  expected = [model.predict(x).copy() for x in X]
+  context = model.context()
+
+  for infer in (model.infer, context.infer):
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+      results = list(pool.map(infer, X))
+
+    for out, ref in zip(results, expected):
+      np.testing.assert_allclose(out, ref)
+
+
+def test_network_accumulate():
+  '''
+  Tests:
+    if the training with the updates accumulated over the micro-batches gives the same parameters
+    of the training with the whole batch
+  '''
+  np.random.seed(123)
+
+  micro_batch = 2
+  accumulate_steps = 3
+  num_data = 12
+
+  X = np.random.uniform(low=0., high=1., size=(num_data, 8, 8, 3))
+  y = np.random.uniform(low=0., high=1., size=(num_data, 1, 1, 5))
+
+  with pytest.raises(ValueError):
+    _build_network(batch=micro_batch).fit(X, y, max_iter=1, accumulate_steps=0)
+
+  # SGD is not invariant to the scale of the updates
+  model = _build_network(batch=micro_batch, dtype=np.float64).compile(optimizer=partial(SGD, lr=.5))
+  model.fit(X, y, max_iter=2, shuffle=False, accumulate_steps=accumulate_steps)
+
+  reference = _build_network(batch=micro_batch * accumulate_steps, dtype=np.float64).compile(optimizer=partial(SGD, lr=.5))
+  reference.fit(X, y, max_iter=2, shuffle=False)
+
+  for layer, ref in zip(model._net, reference._net):
+    if hasattr(layer, 'weights'):
+      np.testing.assert_allclose(layer.weights, ref.weights, rtol=1e-6, atol=1e-10)
+      np.testing.assert_allclose(layer.bias, ref.bias, rtol=1e-6, atol=1e-10)
+
+
+def test_network_checkpoint():
+  '''
+  Tests:
+    if the checkpoints are selected every sqrt(N) layers and the layers read after the next kept
+    layer are kept as well
+    if the recomputed layers store neither their outputs nor their activations out of the backward
+    if the training with the checkpoints gives the same parameters of the training without them
+  '''
+  np.random.seed(123)
+
+  batch = 2
+  num_data = 8
+
+  X = np.random.uniform(low=-1., high=1., size=(num_data, 8, 8, 3))
+  y = np.random.uniform(low=0., high=1., size=(num_data, 1, 1, 5))
+
+  def build(workers=None):
+    np.random.seed(42)
+
+    model = Network(batch=batch, input_shape=(8, 8, 3), dtype=np.float64, workers=workers)
+    model.add(Convolutional_layer(input_shape=(batch, 8, 8, 3), filters=4, size=3, stride=1, pad=True, activation='Relu'))
+    model.add(Activation_layer(activation='Logistic'))
+    model.add(Convolutional_layer(input_shape=(batch, 8, 8, 4), filters=4, size=3, stride=1, pad=True, activation='Linear'))
+    model.add(Shortcut_layer(activation='Linear', alpha=1., beta=1., input_layers=(-1, 1)))
+    model.add(Maxpool_layer(size=2, stride=2))
+    model.add(Activation_layer(activation='Relu'))
+    model.add(Connected_layer(input_shape=(batch, 4, 4, 4), outputs=5, activation='Logistic'))
+    model.add(Cost_layer(input_shape=(batch, 1, 1, 5), cost_type='mse'))
+
+    return model.compile(optimizer=partial(SGD, lr=.5))
+
+  reference = build()
+  reference.fit(X, y, max_iter=2, shuffle=False)
+
+  with pytest.raises(ValueError):
+    build().checkpoint(layers=(12, ))
+
+  for workers in (None, 3):
+
+    model = build(workers=workers).checkpoint()
+
+    assert model.checkpoints == (3, 6)
+    assert [step.kept for step in model._build_plan()] == [True, False, True, False, False, True, False, True]
+    assert [[other.index for other in step.recompute] for step in model._plan] == [[], [], [2], [], [], [4, 5], [], [7]]
+
+    model._forward(X[:batch], truth=y[:batch])
+
+    for i in (2, 4, 5, 7):
+      assert model[i].output is None and model[i].delta is None
+
+    assert model[4].output is None and model[5].indexes is None
+    assert model[3].view is not None and model[6].delta is not None
+
+    model._backward(X[:batch])
+
+    for i in (2, 4, 5, 7):
+      assert model[i].output is None and model[i].delta is None
+
+    assert model[5].indexes is None
+
+    # a new model, the first batch has been already trained
+    model = build(workers=workers).checkpoint()
+    model.fit(X, y, max_iter=2, shuffle=False)
+
+    for layer, ref in zip(model._net, reference._net):
+      if hasattr(layer, 'weights'):
+        np.testing.assert_allclose(layer.weights, ref.weights, rtol=1e-6, atol=1e-10)
+        np.testing.assert_allclose(layer.bias, ref.bias, rtol=1e-6, atol=1e-10)
+
+  model.uncheckpoint()
+  assert all(step.kept for step in model._build_plan())
+
+
+def test_network_load_graph():
+  '''
+  Tests:
+    if the darknet shortcut and route sections are loaded with the absolute indexes
+    of their input layers and the loaded model runs forward and backward
+  '''
+  np.random.seed(123)
+
+  cfg = '\n'.join(['[net]', 'batch=2', 'width=6', 'height=6', 'channels=3', '',
+                   '[convolutional]', 'filters=4', 'size=3', 'stride=1', 'pad=1', 'activation=Relu', '',
+                   '[convolutional]', 'filters=4', 'size=3', 'stride=1', 'pad=1', 'activation=Linear', '',
+                   '[shortcut]', 'from=-2', 'activation=Linear', '',
+                   '[route]', 'layers=-1,0', ''])
+
+  with tempfile.TemporaryDirectory() as tmp:
+
+    cfg_filename = os.path.join(tmp, 'graph.cfg')
+
+    with open(cfg_filename, 'w') as fp:
+      fp.write(cfg)
+
+    model = Network(batch=2)
+    model.load(cfg_filename)
+    model.compile(optimizer=partial(SGD, lr=0.))
+
+  assert model[3].input_layers == (2, 1)
+  assert model[4].input_layers == (3, 1)
+  assert model[4].out_shape == (2, 6, 6, 8)
+
+  X = np.random.uniform(low=-1., high=1., size=(2, 6, 6, 3))
+  out = model._forward(X)
+
+  assert np.allclose(out, np.concatenate([model[3].output, model[1].output], axis=-1))
+
+  model[4].delta = np.ones(shape=out.shape)
+  model._backward(X)
+
+  assert np.allclose(model[3].delta, 1.)
+
+
+if __name__ == '__main__':
+
+  test_network_dtype()
+  test_network_fuse()
+  test_network_load_global_avgpool()
+  test_network_plan()
+  test_network_eval()
+  test_network_memory()
+  test_network_zero_copy()
+  test_network_graph()
+  test_network_shortcut_shapes()
+  test_network_workers()
+  test_network_predict_batches()
+  test_network_predict_replicas()
+  test_network_infer()
+  test_network_infer_replicas()
+  test_network_accumulate()
+  test_network_checkpoint()
+  test_network_load_graph()
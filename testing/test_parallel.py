@@ -0,0 +1,116 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+
+from NumPyNet.network import Network
+from NumPyNet.parallel import DataParallel
+from NumPyNet.layers.connected_layer import Connected_layer
+from NumPyNet.layers.convolutional_layer import Convolutional_layer
+from NumPyNet.layers.cost_layer import Cost_layer
+from NumPyNet.layers.dropout_layer import Dropout_layer
+from NumPyNet.layers.maxpool_layer import Maxpool_layer
+from NumPyNet.optimizer import Adam
+from NumPyNet.optimizer import SGD
+
+import copy
+from functools import partial
+
+import numpy as np
+import pytest
+
+__author__ = ['Mattia Ceccarelli', 'Nico Curti']
+__email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
+__package__ = 'Data parallel training testing'
+
+
+def test_data_parallel():
+  '''
+  Tests:
+    if the data parallel training gives the same parameters of the training in a single process
+    if the number of processes is checked
+  '''
+  np.random.seed(123)
+
+  batch = 5
+  num_data = 20
+
+  X = np.random.uniform(low=0., high=1., size=(num_data, 6, 6, 3))
+  y = np.random.uniform(low=0., high=1., size=(num_data, 1, 1, 4))
+
+  model = Network(batch=batch, input_shape=(6, 6, 3), dtype=np.float64)
+  model.add(Convolutional_layer(input_shape=(batch, 6, 6, 3), filters=4, size=3, stride=1, pad=True, activation='Relu'))
+  model.add(Maxpool_layer(size=2, stride=2))
+  model.add(Connected_layer(input_shape=(batch, 3, 3, 4), outputs=4, activation='Logistic'))
+  model.add(Cost_layer(input_shape=(batch, 1, 1, 4), cost_type='mse'))
+  model.compile(optimizer=Adam)
+
+  parallel = copy.deepcopy(model)
+
+  model.fit(X, y, max_iter=3, shuffle=False)
+  DataParallel(parallel, processes=3).fit(X, y, max_iter=3, shuffle=False)
+
+  for layer, ref in zip(parallel._net, model._net):
+    if hasattr(layer, 'weights'):
+      np.testing.assert_allclose(layer.weights, ref.weights, rtol=1e-6, atol=1e-10)
+      np.testing.assert_allclose(layer.bias, ref.bias, rtol=1e-6, atol=1e-10)
+
+  np.testing.assert_allclose(parallel.predict(X[:batch], y[:batch]), model.predict(X[:batch], y[:batch]), rtol=1e-6, atol=1e-10)
+
+  with pytest.raises(ValueError):
+    DataParallel(parallel, processes=0)
+
+  with pytest.raises(ValueError):
+    DataParallel(parallel, processes=batch + 1).fit(X, y, max_iter=1)
+
+
+def test_data_parallel_dropout():
+  '''
+  Tests:
+    if the replicas draw independent Dropout masks: with the same data on every shard, a step
+    with SGD gives the mean of the steps of single models seeded as the replicas
+  '''
+  np.random.seed(123)
+
+  batch = 2
+  processes = 2
+  seed = 42
+
+  X = np.random.uniform(low=0., high=1., size=(batch, 3, 3, 2))
+  y = np.random.uniform(low=0., high=1., size=(batch, 1, 1, 4))
+
+  model = Network(batch=batch, input_shape=(3, 3, 2))
+  model.add(Connected_layer(input_shape=(batch, 3, 3, 2), outputs=16, activation='Relu'))
+  model.add(Dropout_layer(prob=.5))
+  model.add(Connected_layer(input_shape=(batch, 1, 1, 16), outputs=4, activation='Linear'))
+  model.add(Cost_layer(input_shape=(batch, 1, 1, 4), cost_type='mse'))
+  model.compile(optimizer=partial(SGD, lr=.1))
+
+  # every shard is a copy of the data
+  parallel = copy.deepcopy(model)
+  parallel.batch = batch * processes
+  DataParallel(parallel, processes=processes).fit(np.concatenate([X] * processes), np.concatenate([y] * processes),
+                                                  max_iter=1, shuffle=False, seed=seed)
+
+  replicas = []
+
+  for rank in range(processes):
+    replica = copy.deepcopy(model)
+    np.random.seed(seed + rank)
+    replica.fit(X, y, max_iter=1, shuffle=False)
+    replicas.append(replica)
+
+  for i, layer in enumerate(parallel._net):
+    if hasattr(layer, 'weights'):
+      expected = np.mean([replica._net[i].weights for replica in replicas], axis=0)
+      np.testing.assert_allclose(layer.weights, expected, rtol=1e-6, atol=1e-10)
+
+  # the masks of the replicas differ, so the step is not the one of a single replica
+  assert not np.allclose(parallel._net[1].weights, replicas[0]._net[1].weights)
+
+
+if __name__ == '__main__':
+
+  test_data_parallel()
+  test_data_parallel_dropout()
@@ -232,7 +232,47 @@ def timing_connected_layer (input_shape):
 
 
 def timing_convolutional_layer (input_shape):
-  raise NotImplementedError
+
+  filters = [16, 64]
+  sizes = [(1, 1), (3, 3)]
+  strides = [(1, 1), (2, 2)]
+  algorithms = ['einsum', 'gemm', 'winograd', 'fft', 'pointwise']
+
+  timing = []
+
+  for out_c in filters:
+    for size in sizes:
+      for stride in strides:
+        for algorithm in algorithms:
+
+          if algorithm == 'winograd' and (size != (3, 3) or stride != (1, 1)):
+            continue
+
+          if algorithm == 'pointwise' and size != (1, 1):
+            continue
+
+          params = {'input_shape' : input_shape, 'filters' : out_c,
+                    'size' : size, 'stride' : stride, 'pad' : True,
+                    'activation' : 'Relu', 'algorithm' : algorithm}
+
+          forward_times  = forward('Convolutional_layer', input_shape, params)
+          backward_times = backward('Convolutional_layer', input_shape, params)
+
+          timing.append( { 'layer' : 'Convolutional',
+                           **params,
+                           'num_repeatition' : NUM_REPEATS,
+                           'number'        : NUMBER,
+                           'forward_mean'  : np.mean(forward_times),
+                           'forward_max'   : np.max(forward_times),
+                           'forward_min'   : np.min(forward_times),
+                           'forward_std'   : np.std(forward_times),
+                           'backward_mean' : np.mean(backward_times),
+                           'backward_max'  : np.max(backward_times),
+                           'backward_min'  : np.min(backward_times),
+                           'backward_std'  : np.std(backward_times),
+                           })
+
+  return timing
 
 def timing_cost_layer (input_shape):
 
@@ -545,6 +585,7 @@ if __name__ == '__main__':
                    'avgpool'    : timing_avgpool_layer,
                    'batchnorm'  : timing_batchnorm_layer,
                    'connected'  : timing_connected_layer,
+                   'convolutional' : timing_convolutional_layer,
                    'dropout'    : timing_dropout_layer,
                    'input'      : timing_input_layer,
                    'logistic'   : timing_logistic_layer,
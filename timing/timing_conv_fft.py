@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import numpy as np
+import pandas as pd
+from time import time as now
+
+import timing
+from timing import forward
+from timing import backward
+
+__author__ = ['Mattia Ceccarelli', 'Nico Curti']
+__email__ = ['mattia.ceccarelli3@studio.unibo.it', 'nico.curti2@unibo.it']
+__package__ = 'Timing fft convolution crossover'
+
+
+def timing_conv_fft (input_shape, filters, sizes, strides):
+  '''
+  Time the gemm and the fft algorithms of the Convolutional layer for increasing
+  kernel sizes. The ratio kx * ky / (st1 * st2) above which the fft is faster is the
+  crossover used by the 'auto' algorithm (Convolutional_layer.FFT_CROSSOVER)
+  '''
+
+  timing_res = []
+
+  for stride in strides:
+    for size in sizes:
+      for algorithm in ['gemm', 'fft']:
+
+        params = {'input_shape' : input_shape, 'filters' : filters,
+                  'size' : (size, size), 'stride' : (stride, stride), 'pad' : True,
+                  'activation' : 'Linear', 'algorithm' : algorithm}
+
+        forward_times  = forward('Convolutional_layer', input_shape, params)
+        backward_times = backward('Convolutional_layer', input_shape, params)
+
+        timing_res.append( { 'layer' : 'Convolutional',
+                             'input_shape' : input_shape,
+                             'filters' : filters,
+                             'size' : size,
+                             'stride' : stride,
+                             'ratio' : size * size / (stride * stride),
+                             'algorithm' : algorithm,
+                             'num_repeatition' : timing.NUM_REPEATS,
+                             'number'        : timing.NUMBER,
+                             'forward_min'   : np.min(forward_times),
+                             'backward_min'  : np.min(backward_times),
+                             })
+
+  return timing_res
+
+
+def crossover (timing_res):
+  '''
+  Minimum ratio kx * ky / (st1 * st2) for which the fft (forward + backward) is faster than gemm
+  '''
+  total = timing_res.assign(total=timing_res.forward_min + timing_res.backward_min)
+  total = total.pivot_table(index=['input_shape', 'stride', 'size', 'ratio'], columns='algorithm', values='total').reset_index()
+  faster = total[total.fft < total.gemm]
+
+  return faster.ratio.min() if len(faster) else np.inf
+
+
+def parse_args ():
+
+  description = 'Timing fft convolution crossover'
+
+  parser = argparse.ArgumentParser(description=description)
+
+  parser.add_argument('--output',
+                      dest='out',
+                      required=False,
+                      type=str,
+                      action='store',
+                      help='Output filename',
+                      default=''
+                      )
+  parser.add_argument('--filters',
+                      dest='filters',
+                      required=False,
+                      type=int,
+                      action='store',
+                      help='Number of filters',
+                      default=32
+                      )
+  parser.add_argument('--n_rep',
+                      dest='n_rep',
+                      required=False,
+                      type=int,
+                      action='store',
+                      help='Number of repetition',
+                      default=3
+                      )
+  parser.add_argument('--num',
+                      dest='num',
+                      required=False,
+                      type=int,
+                      action='store',
+                      help='Number of iterations',
+                      default=3
+                      )
+
+  args = parser.parse_args()
+
+  timing.NUM_REPEATS = args.n_rep
+  timing.NUMBER = args.num
+
+  return args
+
+
+
+if __name__ == '__main__':
+
+  args = parse_args()
+
+  input_shapes = [(2, 128, 128, 16), (1, 256, 256, 3)]
+  sizes = [3, 5, 7, 9, 11, 13, 15]
+  strides = [1, 2]
+
+  timing_res = []
+  for input_shape in input_shapes:
+
+    tic = now()
+    times = timing_conv_fft(input_shape, args.filters, sizes, strides)
+    toc = now()
+
+    print('Elapsed time: {:.3f} sec'.format(toc - tic))
+
+    timing_res += [pd.DataFrame(times)]
+
+  timing_res = pd.concat(timing_res)
+
+  print('FFT crossover (kx * ky / (st1 * st2)): {}'.format(crossover(timing_res)))
+
+  if args.out:
+    timing_res.to_csv(args.out, sep=',', header=True, index=False)
+  else:
+    print(timing_res)